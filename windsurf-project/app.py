@@ -1,344 +1,1264 @@
-from flask import Flask, request, jsonify, make_response
-from flask_sqlalchemy import SQLAlchemy
+from flask import Blueprint, Flask, current_app, request, jsonify, make_response
+import click
 from flask_cors import CORS  # Add this import at the top of the file
-from datetime import datetime
-
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///tshirts.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-
-class TShirt(db.Model):
-    __tablename__ = 'tshirts'
-    id = db.Column(db.Integer, primary_key=True)
-    design_name = db.Column(db.String(100), nullable=False)
-    size = db.Column(db.String(5), nullable=False)
-    quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    color = db.Column(db.String(20), default='White')  # Default color is white
-
-    # Method to get total quantity for a design
-    @classmethod
-    def get_design_total(cls, design_name):
-        return db.session.query(cls).filter_by(design_name=design_name).all()
-
-class Order(db.Model):
-    __tablename__ = 'orders'
-    id = db.Column(db.Integer, primary_key=True)
-    customer_name = db.Column(db.String(100), nullable=False)
-    customer_phone = db.Column(db.String(20), nullable=False)
-    tshirt_id = db.Column(db.Integer, db.ForeignKey('tshirts.id'), nullable=False)
-    quantity = db.Column(db.Integer, nullable=False)
-    status = db.Column(db.String(20), default='pending')
-    order_date = db.Column(db.DateTime, default=datetime.utcnow)
-    tshirt = db.relationship('TShirt', backref='orders')
-
-with app.app_context():
-    # Create all tables without dropping first
-    db.create_all()
-    
-    # Clear existing data
-    try:
-        TShirt.query.delete()
-        Order.query.delete()
+from archive import (DEFAULT_ARCHIVE_AFTER_DAYS, archive_orders, init_archive,
+                     migrate_archive, orders_all, requested_orders_source)
+from catalog import load_catalog
+from customers import (CUSTOMER_FIELDS, backfill_customers, record_customer_order,
+                       remove_customer_order)
+from restock import plan_restock, resolve_policy
+from replica import PRIMARY_HEADER, REPLICA_BIND, init_read_routing, primary_only, replica_url
+from search import customer_match, migrate_search, rebuild_search, search_terms, tshirt_match
+from ledger import movement_report, stock_at_query, take_snapshot
+from group_commit import GroupCommitWriter, group_commit_enabled
+from jobs import JobRunner, job_to_dict
+from forecast import compute_forecast, resolve_params as resolve_forecast_params
+from instrumentation import get_logger, init_metrics
+from serialization import FastJSONProvider, columns, dumps, init_compression, loads, records
+from sqlite_profile import init_sqlite_profile
+from transfer import (FORMATS, ORDER_COLUMNS as EXPORT_ORDER_COLUMNS, TSHIRT_COLUMNS as EXPORT_TSHIRT_COLUMNS,
+                      ImportRowError, import_orders, import_tshirts, orders_export_query,
+                      resolve_format, stream_export, tshirts_export_query)
+from models import (db, TShirt, OrderHeader, Order, SalesDaily, Customer,
+                    Job, bump_cache_version, get_cache_version, publish_change, publish_stock,
+                    record_sale, rebuild_sales_rollup, take_stock, return_stock, migrate_schema,
+                    StockMovement, record_stock_levels, prune_change_events, DuplicateSKUError,
+                    committed_changes)
+from datetime import date, datetime, timedelta
+from contextlib import contextmanager
+import base64
+import binascii
+import os
+import queue
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: init-db runs unguarded
+    fcntl = None
+
+api = Blueprint('api', __name__, cli_group=None)
+logger = get_logger()
+
+def create_app(config=None):
+    """Build the Flask app.
+
+    Creating the app never touches the database, so starting or adding
+    workers is cheap and cannot modify data. Create the schema and seed the
+    catalog with ``flask --app app init-db`` (run as the release step in the
+    Procfile).
+    """
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    # Enable CORS for all routes; browsers let cross-origin clients read
+    # the read-your-writes header only when it is exposed
+    CORS(app, expose_headers=[PRIMARY_HEADER])
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///tshirts.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config:
+        app.config.update(config)
+    if replica_url(app.config):
+        app.config['SQLALCHEMY_BINDS'] = {**app.config.get('SQLALCHEMY_BINDS', {}),
+                                          REPLICA_BIND: replica_url(app.config)}
+
+    db.init_app(app)
+    init_sqlite_profile(app, db)
+    init_archive(app, db)
+    init_metrics(app, db)
+    # Registered after metrics so its hook runs first and /metrics sees wire sizes
+    init_compression(app)
+    init_read_routing(app, db)
+    app.register_blueprint(api)
+    return app
+
+class VersionedCache:
+    """A serialized response body and the cache key it was built for.
+
+    Every write that changes t-shirts bumps the shared 'catalog' stamp, and
+    every order write the 'orders' stamp, in the same transaction. With the
+    stamps in the key a worker only rebuilds the body after a change made by
+    any worker.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.body = None
+
+    def get(self, version):
+        with self._lock:
+            if self.version == version:
+                return self.body
+        return None
+
+    def put(self, version, body):
+        with self._lock:
+            self.version = version
+            self.body = body
+
+catalog_cache = VersionedCache()
+forecast_cache = VersionedCache()
+
+class ChangeBroker:
+    """Fans committed change events out to this worker's SSE subscribers.
+
+    A single background thread per worker polls change_events, so the number
+    of open streams does not add database load. Writers in this worker call
+    notify() after commit to skip the poll interval; events from other
+    workers arrive within one interval. Events are read through
+    committed_changes(), so an event whose transaction commits late is not
+    skipped.
+    """
+    POLL_INTERVAL = 0.5
+    QUEUE_SIZE = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._subscribers = set()
+        self._thread = None
+        self._app = None
+        self._last_id = None
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._app = current_app._get_current_object()
+                self._last_id = committed_changes()
+                db.session.remove()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def notify(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                with self._app.app_context():
+                    self._poll()
+            except Exception as e:
+                logger.error(f"Error polling change events: {e}")
+
+    def _poll(self):
+        events = committed_changes(self._last_id, limit=500)
+        db.session.remove()
+        if not events:
+            return
+        self._last_id = events[-1].id
+        messages = [format_sse(e) for e in events]
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            for event_id, message in messages:
+                try:
+                    subscriber.put_nowait((event_id, message))
+                except queue.Full:
+                    # A client this far behind reconnects and resumes from
+                    # its Last-Event-ID instead of holding memory here
+                    self.unsubscribe(subscriber)
+                    while not subscriber.empty():
+                        subscriber.get_nowait()
+                    subscriber.put_nowait((None, None))
+                    break
+
+change_broker = ChangeBroker()
+order_writer = GroupCommitWriter(after_commit=change_broker.notify)
+job_runner = JobRunner(after_commit=change_broker.notify)
+
+def format_sse(event):
+    return event.id, f"id: {event.id}\nevent: {event.kind}\ndata: {event.payload}\n\n"
+
+@contextmanager
+def _init_lock():
+    """Serialize init-db runs so concurrent deploys or workers cannot race"""
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect() as conn:
+            conn.execute(db.text('SELECT pg_advisory_lock(727001)'))
+            try:
+                yield
+            finally:
+                conn.execute(db.text('SELECT pg_advisory_unlock(727001)'))
+        return
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(current_app.instance_path, exist_ok=True)
+    with open(os.path.join(current_app.instance_path, 'init-db.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def init_db():
+    """Create or upgrade the schema and seed the catalog into an empty database.
+
+    Idempotent: existing tables, indexes and t-shirts are left alone, so it is
+    safe to run on every deploy. Returns the number of t-shirts seeded.
+    Raises DuplicateSKUError, naming them, if existing t-shirts share a SKU.
+    """
+    with _init_lock():
+        migrate_schema()
+        migrate_archive()
+        migrate_search()
+        # Orders from before customers were tracked
+        backfill_customers()
+        # Change events piled up by earlier versions, which only pruned them
+        # in workers serving /api/stream
+        if prune_change_events():
+            db.session.commit()
+        # Orders from before the sales rollup existed
+        if not db.session.query(SalesDaily.tshirt_id).first() and db.session.query(orders_all.c.id).first():
+            rebuild_sales_rollup(orders_all)
+        if TShirt.query.first():
+            # Databases from before the stock ledger get an opening balance
+            if not db.session.query(StockMovement.id).first():
+                record_stock_levels(1, 'opening')
+                take_snapshot()
+                db.session.commit()
+            return 0
+        count = load_catalog(db.session, TShirt.__table__)
+        record_stock_levels(1, 'catalog_reset')
+        take_snapshot()
+        bump_cache_version('catalog')
+        publish_change('catalog_reset')
         db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error clearing data: {e}")
-    
-    # Add initial t-shirts if none exist
-    if not TShirt.query.first():
-        tshirts_data = [
-            # Winging It - 13 total
-            {'design_name': 'Winging It', 'size': 'S', 'quantity': 2, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Winging It', 'size': 'M', 'quantity': 2, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Winging It', 'size': 'L', 'quantity': 3, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Winging It', 'size': 'XL', 'quantity': 3, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Winging It', 'size': '2XL', 'quantity': 3, 'price': 720, 'color': 'Black'},
-            
-            # Power to the Meeple - 12 total
-            {'design_name': 'Power to the Meeple', 'size': 'S', 'quantity': 2, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Power to the Meeple', 'size': 'M', 'quantity': 2, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Power to the Meeple', 'size': 'L', 'quantity': 2, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Power to the Meeple', 'size': 'XL', 'quantity': 3, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Power to the Meeple', 'size': '2XL', 'quantity': 3, 'price': 720, 'color': 'Navy'},
-            
-            # The Board Gamer - 7 total
-            {'design_name': 'The Board Gamer', 'size': 'L', 'quantity': 3, 'price': 720, 'color': 'Black'},
-            {'design_name': 'The Board Gamer', 'size': 'XL', 'quantity': 2, 'price': 720, 'color': 'Black'},
-            {'design_name': 'The Board Gamer', 'size': '2XL', 'quantity': 2, 'price': 720, 'color': 'Black'},
-            
-            # I Don't Make the Rules - 15 total
-            {'design_name': 'I Don\'t Make the Rules', 'size': 'S', 'quantity': 4, 'price': 720, 'color': 'Black'},
-            {'design_name': 'I Don\'t Make the Rules', 'size': 'M', 'quantity': 4, 'price': 720, 'color': 'Black'},
-            {'design_name': 'I Don\'t Make the Rules', 'size': 'L', 'quantity': 3, 'price': 720, 'color': 'Black'},
-            {'design_name': 'I Don\'t Make the Rules', 'size': 'XL', 'quantity': 1, 'price': 720, 'color': 'Black'},
-            {'design_name': 'I Don\'t Make the Rules', 'size': '2XL', 'quantity': 3, 'price': 720, 'color': 'Black'},
-            
-            # VIRTU Meeple - 15 total
-            {'design_name': 'VIRTU Meeple', 'size': 'S', 'quantity': 4, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'VIRTU Meeple', 'size': 'M', 'quantity': 4, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'VIRTU Meeple', 'size': 'L', 'quantity': 2, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'VIRTU Meeple', 'size': 'XL', 'quantity': 3, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'VIRTU Meeple', 'size': '2XL', 'quantity': 2, 'price': 720, 'color': 'Navy'},
-            
-            # Before You Ask - 13 total (Price: 800)
-            {'design_name': 'Before You Ask', 'size': 'S', 'quantity': 4, 'price': 800, 'color': 'Black'},
-            {'design_name': 'Before You Ask', 'size': 'M', 'quantity': 4, 'price': 800, 'color': 'Black'},
-            {'design_name': 'Before You Ask', 'size': 'L', 'quantity': 1, 'price': 800, 'color': 'Black'},
-            {'design_name': 'Before You Ask', 'size': 'XL', 'quantity': 2, 'price': 800, 'color': 'Black'},
-            {'design_name': 'Before You Ask', 'size': '2XL', 'quantity': 2, 'price': 800, 'color': 'Black'},
-            
-            # Settle Down - 11 total
-            {'design_name': 'Settle Down', 'size': 'M', 'quantity': 1, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Settle Down', 'size': 'L', 'quantity': 4, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Settle Down', 'size': 'XL', 'quantity': 2, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Settle Down', 'size': '2XL', 'quantity': 4, 'price': 720, 'color': 'Navy'},
-            
-            # Game Night - 17 total
-            {'design_name': 'Game Night', 'size': 'S', 'quantity': 4, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Game Night', 'size': 'M', 'quantity': 4, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Game Night', 'size': 'L', 'quantity': 2, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Game Night', 'size': 'XL', 'quantity': 2, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Game Night', 'size': '2XL', 'quantity': 5, 'price': 720, 'color': 'Black'},
-            
-            # Board Game components - 16 total (Price: 700)
-            {'design_name': 'Board Game components', 'size': 'S', 'quantity': 4, 'price': 700, 'color': 'Navy'},
-            {'design_name': 'Board Game components', 'size': 'M', 'quantity': 4, 'price': 700, 'color': 'Navy'},
-            {'design_name': 'Board Game components', 'size': 'L', 'quantity': 3, 'price': 700, 'color': 'Navy'},
-            {'design_name': 'Board Game components', 'size': 'XL', 'quantity': 1, 'price': 700, 'color': 'Navy'},
-            {'design_name': 'Board Game components', 'size': '2XL', 'quantity': 4, 'price': 700, 'color': 'Navy'}
-        ]
-        tshirts = [TShirt(**data) for data in tshirts_data]
-        db.session.add_all(tshirts)
+        return count
+
+@api.cli.command('init-db')
+def init_db_command():
+    """Create the schema and seed the catalog if the database is empty"""
+    try:
+        count = init_db()
+    except DuplicateSKUError as e:
+        raise click.ClickException(str(e))
+    print(f"Database ready ({count} t-shirts seeded)")
+
+@api.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Rebuild the reporting rollups from existing orders"""
+    print(f"Rebuilt sales rollup: {rebuild_sales_rollup(orders_all)} rows")
+
+@api.cli.command('migrate-db')
+def migrate_db_command():
+    """Add missing columns and indexes to an existing database"""
+    try:
+        migrate_schema()
+    except DuplicateSKUError as e:
+        raise click.ClickException(str(e))
+    migrate_archive()
+    migrate_search()
+    print("Database schema is up to date")
+
+@api.cli.command('archive-orders')
+@click.option('--older-than-days', type=int, default=None,
+              help='Archive closed orders older than this (default: ARCHIVE_AFTER_DAYS config, 180)')
+@click.option('--batch-size', type=int, default=5000)
+def archive_orders_command(older_than_days, batch_size):
+    """Move old fulfilled and cancelled orders to the archive"""
+    if older_than_days is None:
+        older_than_days = current_app.config.get('ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    moved = archive_orders(older_than_days, batch_size)
+    if moved:
+        bump_cache_version('orders')
         db.session.commit()
+    print(f"Archived {moved} orders older than {older_than_days} days")
 
-@app.route('/api/tshirts', methods=['GET'])
+@api.cli.command('backfill-customers')
+@click.option('--batch-size', type=int, default=5000)
+def backfill_customers_command(batch_size):
+    """Create customers for orders that have none and link them"""
+    linked = backfill_customers(batch_size)
+    print(f"Linked {linked} orders to {Customer.query.count()} customers")
+
+@api.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Reindex all t-shirts and customers for search"""
+    if rebuild_search():
+        print("Search index rebuilt")
+    else:
+        print("Nothing to rebuild: this database maintains its search indexes itself")
+
+@api.cli.command('run-jobs')
+def run_jobs_command():
+    """Run queued background jobs in the foreground until none is left"""
+    print(f"Ran {job_runner.run_pending()} jobs")
+
+@api.cli.command('snapshot-stock')
+def snapshot_stock_command():
+    """Fold recent stock movements into a new per-SKU snapshot"""
+    count = take_snapshot()
+    db.session.commit()
+    print(f"Snapshot of {count} t-shirts taken" if count else "No stock movements since the last snapshot")
+
+TSHIRT_FIELDS = ('id', 'design_name', 'size', 'color', 'quantity', 'price')
+
+@api.route('/api/tshirts', methods=['GET'])
 def get_tshirts():
     try:
-        print("Fetching tshirts from database...")  # Debug log
-        tshirts = TShirt.query.all()
-        print(f"Found {len(tshirts)} tshirts")  # Debug log
-        
-        # Convert tshirt objects to dictionaries
-        tshirt_list = []
-        for t in tshirts:
-            tshirt_data = {
-                'id': t.id,
-                'design_name': t.design_name,
-                'size': t.size,
-                'color': t.color,
-                'quantity': t.quantity,
-                'price': float(t.price)  # Ensure price is serializable
-            }
-            tshirt_list.append(tshirt_data)
-            
-        print("Returning tshirt data:", tshirt_list)  # Debug log
-        
-        # Create response with CORS headers
-        response = jsonify(tshirt_list)
+        # Read the stamp before the rows: a body built from newer rows than its
+        # stamp is only ever rebuilt too early, never served stale
+        version = get_cache_version('catalog')
+        etag = f'catalog-{version}'
+        # Weak match: compressed responses carry the ETag as W/"catalog-N"
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            body = catalog_cache.get(version)
+            if body is None:
+                logger.debug("Fetching tshirts from database...")
+                rows = db.session.execute(db.select(*[getattr(TShirt, f) for f in TSHIRT_FIELDS])).all()
+                logger.debug(f"Found {len(rows)} tshirts")
+                body = dumps(records(TSHIRT_FIELDS, rows))
+                catalog_cache.put(version, body)
+            response = current_app.response_class(body, mimetype='application/json')
+
+        # Clients must revalidate, which costs a 304 while the catalog is unchanged
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
         response.headers.add('Access-Control-Allow-Methods', 'GET')
         return response
         
     except Exception as e:
-        print(f"Error in get_tshirts: {str(e)}")
+        logger.error(f"Error in get_tshirts: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/orders', methods=['POST'])
+def _place_order(data):
+    """Write one order in the current transaction and return (body, status).
+
+    Does not commit. On an error status the caller rolls the transaction
+    (or, under group commit, the order's savepoint) back.
+    """
+    try:
+        tshirt_id, quantity = int(data['tshirt_id']), int(data['quantity'])
+    except (KeyError, TypeError, ValueError):
+        return {'error': 'Order needs a tshirt_id and quantity'}, 400
+    if quantity < 1:
+        return {'error': 'Quantity must be at least 1'}, 400
+    if not data.get('customer_name'):
+        return {'error': 'Order needs a customer_name'}, 400
+
+    # Check if tshirt exists
+    tshirt = db.session.get(TShirt, tshirt_id)
+    if not tshirt:
+        return {'error': 'T-shirt not found'}, 404
+
+    order_status = data.get('status', 'pending')
+    if order_status != 'fulfilled' and tshirt.quantity < quantity:
+        return {'error': 'Not enough t-shirts in stock'}, 400
+
+    # Create order with status; flushed first so the stock movement can
+    # reference it
+    order_date = datetime.utcnow()
+    customer_id = record_customer_order(data['customer_name'], data.get('customer_phone', ''), 1,
+                                        quantity, quantity * tshirt.price, order_date)
+    order = Order(
+        customer_id=customer_id,
+        customer_name=data['customer_name'],
+        customer_phone=data.get('customer_phone', ''),
+        tshirt_id=tshirt_id,
+        quantity=quantity,
+        status=order_status,
+        order_date=order_date,
+        unit_price=tshirt.price
+    )
+    db.session.add(order)
+    db.session.flush()
+
+    # Only reduce inventory for fulfilled orders, not for online orders
+    if order_status == 'fulfilled':
+        if not take_stock(tshirt.id, quantity, ref_id=order.id):
+            return {'error': 'Not enough t-shirts in stock'}, 400
+        bump_cache_version('catalog')
+        publish_stock(tshirt.id)
+        logger.debug(f"Reducing inventory for fulfilled order: {quantity} units of T-shirt ID {tshirt_id}")
+    else:
+        logger.debug(f"Online order: Not reducing inventory for T-shirt ID {tshirt_id}")
+
+    record_sale(tshirt, order.quantity, order.order_date)
+    bump_cache_version('orders')
+    publish_change('order_created', order_id=order.id, tshirt_id=tshirt.id,
+                   quantity=order.quantity, status=order.status)
+
+    return {
+        'id': order.id,
+        'customer_id': order.customer_id,
+        'customer_name': order.customer_name,
+        'customer_phone': order.customer_phone,
+        'tshirt': {
+            'id': tshirt.id,
+            'size': tshirt.size,
+            'color': tshirt.color,
+            'design_name': tshirt.design_name,
+            'price': tshirt.price
+        },
+        'quantity': order.quantity,
+        'status': order.status,
+        'order_date': order.order_date.isoformat()
+    }, 200
+
+@api.route('/api/orders', methods=['POST'])
 def create_order():
-    if request.method == 'POST':
-        data = request.json
-        
-        # Check if tshirt exists
-        tshirt = TShirt.query.get(data['tshirt_id'])
-        if not tshirt:
-            return jsonify({'error': 'T-shirt not found'}), 404
-        
-        # Check if enough quantity
-        if tshirt.quantity < data['quantity']:
-            return jsonify({'error': 'Not enough t-shirts in stock'}), 400
-        
-        # Create order with status
-        order = Order(
-            customer_name=data['customer_name'],
-            customer_phone=data.get('customer_phone', ''),
-            tshirt_id=data['tshirt_id'],
-            quantity=data['quantity'],
-            status=data.get('status', 'pending')
-        )
-        
+    data = request.json
+    if group_commit_enabled(current_app.config):
+        # Committed together with other orders arriving at the same moment
+        body, status = order_writer.submit(_place_order, data)
+        return jsonify(body), status
+
+    body, status = _place_order(data)
+    if status != 200:
+        db.session.rollback()
+        return jsonify(body), status
+    db.session.commit()
+    change_broker.notify()
+    return jsonify(body)
+
+@api.route('/api/orders/batch', methods=['POST'])
+def create_order_batch():
+    """Create a multi-line order in one transaction.
+
+    Expects ``customer_name``, ``customer_phone``, optional ``status`` and an
+    ``items`` list of ``{tshirt_id, quantity}``. Stock for every line is
+    checked with a single query and either all lines are written or none.
+    """
+    data = request.json or {}
+    if not isinstance(data, dict) or not data.get('customer_name'):
+        return jsonify({'error': 'Order needs a customer_name'}), 400
+    items = data.get('items') or []
+    if not items:
+        return jsonify({'error': 'Order has no items'}), 400
+
+    # Merge repeated lines for the same t-shirt so stock is checked once
+    quantities = {}
+    try:
+        for item in items:
+            tshirt_id, quantity = int(item['tshirt_id']), int(item['quantity'])
+            if quantity < 1:
+                return jsonify({'error': 'Quantity must be at least 1'}), 400
+            quantities[tshirt_id] = quantities.get(tshirt_id, 0) + quantity
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Each item needs a tshirt_id and quantity'}), 400
+
+    tshirts = {t.id: t for t in TShirt.query.filter(TShirt.id.in_(quantities)).all()}
+    missing = [tshirt_id for tshirt_id in quantities if tshirt_id not in tshirts]
+    if missing:
+        return jsonify({'error': 'T-shirt not found', 'tshirt_ids': missing}), 404
+    short = [tshirt_id for tshirt_id, quantity in quantities.items()
+             if tshirts[tshirt_id].quantity < quantity]
+    if short:
+        return jsonify({'error': 'Not enough t-shirts in stock', 'tshirt_ids': short}), 400
+
+    status = data.get('status', 'pending')
+    header = OrderHeader(
+        customer_name=data['customer_name'],
+        customer_phone=data.get('customer_phone', ''),
+        status=status,
+        order_date=datetime.utcnow()
+    )
+    db.session.add(header)
+    # Each line counts as one order, as in the sales rollup
+    customer_id = record_customer_order(
+        header.customer_name, header.customer_phone, len(quantities), sum(quantities.values()),
+        sum(quantity * tshirts[tshirt_id].price for tshirt_id, quantity in quantities.items()),
+        header.order_date)
+    for tshirt_id, quantity in quantities.items():
+        header.lines.append(Order(
+            customer_id=customer_id,
+            customer_name=header.customer_name,
+            customer_phone=header.customer_phone,
+            tshirt_id=tshirt_id,
+            quantity=quantity,
+            status=status,
+            order_date=header.order_date,
+            unit_price=tshirts[tshirt_id].price
+        ))
+    # Line ids are needed by the stock movements below
+    db.session.flush()
+    for line in header.lines:
         # Only reduce inventory for fulfilled orders, not for online orders
-        order_status = data.get('status', 'pending')
-        if order_status == 'fulfilled':
-            tshirt.quantity -= data['quantity']
-            print(f"Reducing inventory for fulfilled order: {data['quantity']} units of T-shirt ID {data['tshirt_id']}")
-        else:
-            print(f"Online order: Not reducing inventory for T-shirt ID {data['tshirt_id']}")
-            
-        db.session.add(order)
+        if status == 'fulfilled' and not take_stock(line.tshirt_id, line.quantity, ref_id=line.id):
+            db.session.rollback()
+            return jsonify({'error': 'Not enough t-shirts in stock', 'tshirt_ids': [line.tshirt_id]}), 400
+        record_sale(tshirts[line.tshirt_id], line.quantity, header.order_date)
+        if status == 'fulfilled':
+            publish_stock(line.tshirt_id)
+    bump_cache_version('orders')
+    if status == 'fulfilled':
+        bump_cache_version('catalog')
+
+    try:
+        db.session.flush()
+        for line in header.lines:
+            publish_change('order_created', order_id=line.id, header_id=header.id,
+                           tshirt_id=line.tshirt_id, quantity=line.quantity, status=status)
         db.session.commit()
-        
-        return jsonify({
-            'id': order.id,
-            'customer_name': order.customer_name,
-            'customer_phone': order.customer_phone,
-            'tshirt': {
-                'id': tshirt.id,
-                'size': tshirt.size,
-                'color': tshirt.color,
-                'design_name': tshirt.design_name,
-                'price': tshirt.price
-            },
-            'quantity': order.quantity,
-            'status': order.status,
-            'order_date': order.order_date.isoformat()
-        })
+        change_broker.notify()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error creating order: {e}")
+        return jsonify({'error': str(e)}), 500
 
-@app.route('/api/orders', methods=['GET'])
-def get_orders():
-    orders = Order.query.all()
-    return jsonify([{
-        'id': o.id,
-        'customer_name': o.customer_name,
-        'customer_phone': o.customer_phone,
+    lines = [{
+        'id': line.id,
+        'tshirt': {
+            'id': tshirts[line.tshirt_id].id,
+            'design_name': tshirts[line.tshirt_id].design_name,
+            'size': tshirts[line.tshirt_id].size,
+            'color': tshirts[line.tshirt_id].color,
+            'price': tshirts[line.tshirt_id].price
+        },
+        'quantity': line.quantity
+    } for line in header.lines]
+    return jsonify({
+        'id': header.id,
+        'customer_id': customer_id,
+        'customer_name': header.customer_name,
+        'customer_phone': header.customer_phone,
+        'status': header.status,
+        'order_date': header.order_date.isoformat(),
+        'lines': lines,
+        'total_quantity': sum(line['quantity'] for line in lines),
+        'total_price': sum(line['quantity'] * line['tshirt']['price'] for line in lines)
+    })
+
+# Page size limits for the paginated order listing
+ORDERS_PAGE_SIZE = 50
+ORDERS_MAX_PAGE_SIZE = 200
+# The columns of an _orders_query() row, as named by ?shape=columns
+ORDER_ROW_FIELDS = ('id', 'header_id', 'customer_id', 'customer_name', 'customer_phone', 'quantity',
+                    'status', 'order_date', 'tshirt_id', 'design_name', 'size', 'color', 'price')
+
+def _encode_order_cursor(order_date, order_id):
+    """Encode the (order_date, id) keyset position as an opaque cursor"""
+    raw = f"{order_date.isoformat()}|{order_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_order_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    order_date, order_id = raw.rsplit('|', 1)
+    return datetime.fromisoformat(order_date), int(order_id)
+
+def _orders_query(args):
+    """Build the orders/t-shirts join query with the filters given in args.
+
+    Only the hot orders table is read unless ``include_archived`` is set,
+    which reads the orders_all view over hot and archived orders instead.
+    Returns the query and the column namespace it selects orders from.
+    """
+    source = requested_orders_source(args)
+    orders = source.c
+    query = db.session.query(
+        orders.id, orders.header_id, orders.customer_id, orders.customer_name, orders.customer_phone,
+        orders.quantity, orders.status, orders.order_date,
+        TShirt.id, TShirt.design_name, TShirt.size, TShirt.color, TShirt.price
+    ).select_from(source).join(TShirt, orders.tshirt_id == TShirt.id)
+
+    if args.get('status'):
+        query = query.filter(orders.status == args['status'])
+    if args.get('tshirt_id'):
+        query = query.filter(orders.tshirt_id == int(args['tshirt_id']))
+    if args.get('customer_id'):
+        query = query.filter(orders.customer_id == int(args['customer_id']))
+    if args.get('customer'):
+        pattern = f"%{args['customer']}%"
+        query = query.filter(db.or_(orders.customer_name.ilike(pattern),
+                                    orders.customer_phone.like(pattern)))
+    if args.get('date_from'):
+        query = query.filter(orders.order_date >= datetime.fromisoformat(args['date_from']))
+    if args.get('date_to'):
+        query = query.filter(orders.order_date < datetime.fromisoformat(args['date_to']))
+    return query, orders
+
+def _order_row_to_dict(row):
+    (order_id, header_id, customer_id, customer_name, customer_phone, quantity, status,
+     order_date, tshirt_id, design_name, size, color, price) = row
+    return {
+        'id': order_id,
+        'header_id': header_id,
+        'customer_id': customer_id,
+        'customer_name': customer_name,
+        'customer_phone': customer_phone,
         'tshirt': {
-            'id': o.tshirt.id,
-            'design_name': o.tshirt.design_name,
-            'size': o.tshirt.size,
-            'color': o.tshirt.color,
-            'price': o.tshirt.price
+            'id': tshirt_id,
+            'design_name': design_name,
+            'size': size,
+            'color': color,
+            'price': price
         },
-        'quantity': o.quantity,
-        'status': o.status,
-        'order_date': o.order_date.isoformat()
-    } for o in orders])
+        'quantity': quantity,
+        'status': status,
+        'order_date': order_date  # encoded as ISO 8601 by the JSON provider
+    }
+
+@api.route('/api/orders', methods=['GET'])
+def get_orders():
+    """List orders with their t-shirt details fetched in the same query.
+
+    Without ``limit``/``cursor`` the full (filtered) list is returned as before.
+    Passing either switches to keyset pagination, newest first on
+    (order_date, id), and returns ``{'orders': [...], 'next_cursor': ...}``.
+    Archived orders are left out unless ``include_archived=1`` is passed.
+    With ``shape=columns`` the orders are ``{'fields': [...], 'rows': [...]}``
+    instead, flat rows encoded without building a dict per order.
+    """
+    return _list_orders(request.args)
 
-@app.route('/api/orders/<int:order_id>', methods=['DELETE'])
+def _list_orders(args):
+    try:
+        query, orders = _orders_query(args)
+        shape = args.get('shape', 'objects')
+        if shape not in ('objects', 'columns'):
+            raise ValueError("shape must be 'objects' or 'columns'")
+        paginated = 'limit' in args or 'cursor' in args
+        if not paginated:
+            rows = query.order_by(orders.id).all()
+            if shape == 'columns':
+                return jsonify(columns(ORDER_ROW_FIELDS, rows))
+            return jsonify([_order_row_to_dict(row) for row in rows])
+
+        limit = min(int(args.get('limit', ORDERS_PAGE_SIZE)), ORDERS_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        if args.get('cursor'):
+            cursor_date, cursor_id = _decode_order_cursor(args['cursor'])
+            query = query.filter(db.or_(
+                orders.order_date < cursor_date,
+                db.and_(orders.order_date == cursor_date, orders.id < cursor_id)
+            ))
+    except (ValueError, binascii.Error) as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(orders.order_date.desc(), orders.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_order_cursor(last.order_date, last[0])
+
+    if shape == 'columns':
+        return jsonify({**columns(ORDER_ROW_FIELDS, rows), 'next_cursor': next_cursor})
+    return jsonify({
+        'orders': [_order_row_to_dict(row) for row in rows],
+        'next_cursor': next_cursor
+    })
+
+@api.route('/api/orders/<int:order_id>', methods=['DELETE'])
 def delete_order(order_id):
     order = Order.query.get_or_404(order_id)
     
     # Restore the tshirt quantity
     tshirt = TShirt.query.get(order.tshirt_id)
+    # Take out what the order added to the rollup and customer spend, even
+    # if the price has changed since
+    unit_price = order.unit_price if order.unit_price is not None else (tshirt.price if tshirt else 0)
     if tshirt:
-        tshirt.quantity += order.quantity
+        return_stock(tshirt.id, order.quantity, ref_id=order_id)
+        bump_cache_version('catalog')
+        publish_stock(tshirt.id)
+        record_sale(tshirt, order.quantity, order.order_date, sign=-1, unit_price=unit_price)
     
     # Delete the order
     db.session.delete(order)
+    if order.customer_id is not None:
+        # Flushed first so the customer's order dates are looked up without it
+        db.session.flush()
+        remove_customer_order(order.customer_id, order.quantity, order.quantity * unit_price)
+    bump_cache_version('orders')
+    publish_change('order_deleted', order_id=order_id)
     db.session.commit()
+    change_broker.notify()
     
     return jsonify({'message': 'Order deleted successfully'})
 
-@app.route('/api/reset-inventory', methods=['POST'])
+SEARCH_TYPES = ('design', 'tshirt', 'customer')
+SEARCH_MAX_LIMIT = 50
+# Matches considered per type; a short prefix on a large table matches more
+SEARCH_CANDIDATES = 1000
+
+@api.route('/api/search', methods=['GET'])
+def search():
+    """Type-ahead search over designs, t-shirts and customers.
+
+    Every word of ``q`` must match the start of a word in the design name,
+    color or size (t-shirts and designs) or the name or phone (customers).
+    ``types`` limits the result lists (default: design,tshirt,customer) and
+    ``limit`` caps each list (default 10). Designs have at least one
+    matching SKU; customers come biggest spenders first. When more than
+    SEARCH_CANDIDATES rows match, the lists are drawn from the newest of
+    them, and keep narrowing down as more is typed.
+    """
+    q = request.args.get('q', '')
+    types = [t for t in request.args.get('types', ','.join(SEARCH_TYPES)).split(',') if t]
+    unknown = [t for t in types if t not in SEARCH_TYPES]
+    if unknown:
+        return jsonify({'error': f'Unknown search type: {", ".join(unknown)}'}), 400
+    try:
+        limit = min(int(request.args.get('limit', 10)), SEARCH_MAX_LIMIT)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    if not q.strip():
+        return jsonify({'error': 'q is required'}), 400
+
+    terms = search_terms(q)
+    results = {'query': q}
+    for kind in types:
+        results[f'{kind}s'] = []
+    if not terms:
+        return jsonify(results)
+    if 'design' in types:
+        rows = db.session.query(
+            TShirt.design_name, db.func.count(TShirt.id), db.func.sum(TShirt.quantity),
+            db.func.min(TShirt.price), db.func.max(TShirt.price)
+        ).filter(tshirt_match(terms, SEARCH_CANDIDATES)).group_by(TShirt.design_name) \
+            .order_by(TShirt.design_name).limit(limit).all()
+        results['designs'] = records(('design_name', 'skus', 'quantity', 'min_price', 'max_price'), rows)
+    if 'tshirt' in types:
+        rows = db.session.query(*[getattr(TShirt, f) for f in TSHIRT_FIELDS]).filter(tshirt_match(terms, SEARCH_CANDIDATES)) \
+            .order_by(TShirt.design_name, TShirt.size, TShirt.color).limit(limit).all()
+        results['tshirts'] = records(TSHIRT_FIELDS, rows)
+    if 'customer' in types:
+        rows = db.session.query(*[getattr(Customer, f) for f in CUSTOMER_FIELDS]).filter(customer_match(terms, SEARCH_CANDIDATES)) \
+            .order_by(Customer.total_spent.desc(), Customer.id.desc()).limit(limit).all()
+        results['customers'] = records(CUSTOMER_FIELDS, rows)
+    return jsonify(results)
+
+# Page size limits for the customer listing
+CUSTOMERS_PAGE_SIZE = 50
+CUSTOMERS_MAX_PAGE_SIZE = 200
+
+# Listing orders for GET /api/customers: (column, descending). Ties are
+# broken on id in the same direction so the keyset cursor is unique.
+CUSTOMER_SORTS = {
+    'name': (Customer.name, False),
+    'recent': (Customer.last_order_at, True),
+    'spent': (Customer.total_spent, True)
+}
+
+def _encode_customer_cursor(value, customer_id):
+    """Encode a (sort value, id) keyset position as an opaque cursor"""
+    raw = dumps([value, customer_id])
+    return base64.urlsafe_b64encode(raw).decode()
+
+def _decode_customer_cursor(cursor, sort):
+    value, customer_id = loads(base64.urlsafe_b64decode(cursor.encode()))
+    if sort == 'recent':
+        value = datetime.fromisoformat(value)
+    return value, int(customer_id)
+
+@api.route('/api/customers', methods=['GET'])
+def get_customers():
+    """Customers with their lifetime totals, one page at a time.
+
+    ``sort`` is name (default), recent (latest order first; customers whose
+    orders were all deleted are left out) or spent (biggest spenders first).
+    ``q`` matches the start of words in the name or phone, through the
+    search index (see search.py). Pages hold ``limit`` customers
+    (default 50); pass back ``next_cursor`` as ``cursor`` for the next one.
+    """
+    sort = request.args.get('sort', 'name')
+    if sort not in CUSTOMER_SORTS:
+        return jsonify({'error': f'Unknown sort: {sort}'}), 400
+    column, descending = CUSTOMER_SORTS[sort]
+    query = db.session.query(*[getattr(Customer, f) for f in CUSTOMER_FIELDS])
+    if sort == 'recent':
+        query = query.filter(Customer.last_order_at.isnot(None))
+    if request.args.get('q'):
+        terms = search_terms(request.args['q'])
+        if terms:
+            query = query.filter(customer_match(terms))
+    try:
+        limit = min(int(request.args.get('limit', CUSTOMERS_PAGE_SIZE)), CUSTOMERS_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        if request.args.get('cursor'):
+            value, customer_id = _decode_customer_cursor(request.args['cursor'], sort)
+            if descending:
+                after = db.or_(column < value, db.and_(column == value, Customer.id < customer_id))
+            else:
+                after = db.or_(column > value, db.and_(column == value, Customer.id > customer_id))
+            query = query.filter(after)
+    except (ValueError, TypeError, binascii.Error) as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+    if descending:
+        query = query.order_by(column.desc(), Customer.id.desc())
+    else:
+        query = query.order_by(column, Customer.id)
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_customer_cursor(getattr(last, column.key), last.id)
+    return jsonify({
+        'customers': records(CUSTOMER_FIELDS, rows),
+        'next_cursor': next_cursor
+    })
+
+@api.route('/api/customers/<int:customer_id>', methods=['GET'])
+def get_customer(customer_id):
+    """One customer and their lifetime totals"""
+    row = db.session.query(*[getattr(Customer, f) for f in CUSTOMER_FIELDS]) \
+        .filter(Customer.id == customer_id).first()
+    if row is None:
+        return jsonify({'error': 'Customer not found'}), 404
+    return jsonify(dict(zip(CUSTOMER_FIELDS, row)))
+
+@api.route('/api/customers/<int:customer_id>/orders', methods=['GET'])
+def get_customer_orders(customer_id):
+    """A customer's orders, read through the (customer_id, order_date) index.
+
+    Takes the parameters of GET /api/orders, including limit/cursor
+    pagination and include_archived.
+    """
+    if db.session.get(Customer, customer_id) is None:
+        return jsonify({'error': 'Customer not found'}), 404
+    return _list_orders(dict(request.args.items(), customer_id=customer_id))
+
+def _job_accepted(job):
+    """202 response for a queued job, pointing at its status"""
+    response = jsonify(job_to_dict(job))
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response
+
+@api.route('/api/reset-inventory', methods=['POST'])
 def reset_inventory():
-    """Reset the entire inventory to its initial state"""
+    """Reset the entire inventory to the catalog in catalog.csv, in a background job.
+
+    Replaces the t-shirts with the catalog in one transaction; with
+    ?mode=upsert existing SKUs keep their ids and the catalog is merged in
+    chunks instead. Answers 202 with the job; poll GET /api/jobs/<id>.
+    """
     try:
-        # Clear existing tshirts
-        TShirt.query.delete()
-        db.session.commit()
-        
-        # Add initial t-shirts data
-        tshirts_data = [
-            # Winging It - 13 total
-            {'design_name': 'Winging It', 'size': 'S', 'quantity': 2, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Winging It', 'size': 'M', 'quantity': 2, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Winging It', 'size': 'L', 'quantity': 3, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Winging It', 'size': 'XL', 'quantity': 3, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Winging It', 'size': '2XL', 'quantity': 3, 'price': 720, 'color': 'Black'},
-            
-            # Power to the Meeple - 12 total
-            {'design_name': 'Power to the Meeple', 'size': 'S', 'quantity': 2, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Power to the Meeple', 'size': 'M', 'quantity': 2, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Power to the Meeple', 'size': 'L', 'quantity': 2, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Power to the Meeple', 'size': 'XL', 'quantity': 3, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Power to the Meeple', 'size': '2XL', 'quantity': 3, 'price': 720, 'color': 'Navy'},
-            
-            # The Board Gamer - 7 total
-            {'design_name': 'The Board Gamer', 'size': 'L', 'quantity': 3, 'price': 720, 'color': 'Black'},
-            {'design_name': 'The Board Gamer', 'size': 'XL', 'quantity': 2, 'price': 720, 'color': 'Black'},
-            {'design_name': 'The Board Gamer', 'size': '2XL', 'quantity': 2, 'price': 720, 'color': 'Black'},
-            
-            # I Don't Make the Rules - 15 total
-            {'design_name': 'I Don\'t Make the Rules', 'size': 'S', 'quantity': 4, 'price': 720, 'color': 'Black'},
-            {'design_name': 'I Don\'t Make the Rules', 'size': 'M', 'quantity': 4, 'price': 720, 'color': 'Black'},
-            {'design_name': 'I Don\'t Make the Rules', 'size': 'L', 'quantity': 3, 'price': 720, 'color': 'Black'},
-            {'design_name': 'I Don\'t Make the Rules', 'size': 'XL', 'quantity': 1, 'price': 720, 'color': 'Black'},
-            {'design_name': 'I Don\'t Make the Rules', 'size': '2XL', 'quantity': 3, 'price': 720, 'color': 'Black'},
-            
-            # VIRTU Meeple - 15 total
-            {'design_name': 'VIRTU Meeple', 'size': 'S', 'quantity': 4, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'VIRTU Meeple', 'size': 'M', 'quantity': 4, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'VIRTU Meeple', 'size': 'L', 'quantity': 2, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'VIRTU Meeple', 'size': 'XL', 'quantity': 3, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'VIRTU Meeple', 'size': '2XL', 'quantity': 2, 'price': 720, 'color': 'Navy'},
-            
-            # Before You Ask - 13 total (Price: 800)
-            {'design_name': 'Before You Ask', 'size': 'S', 'quantity': 4, 'price': 800, 'color': 'Black'},
-            {'design_name': 'Before You Ask', 'size': 'M', 'quantity': 4, 'price': 800, 'color': 'Black'},
-            {'design_name': 'Before You Ask', 'size': 'L', 'quantity': 1, 'price': 800, 'color': 'Black'},
-            {'design_name': 'Before You Ask', 'size': 'XL', 'quantity': 2, 'price': 800, 'color': 'Black'},
-            {'design_name': 'Before You Ask', 'size': '2XL', 'quantity': 2, 'price': 800, 'color': 'Black'},
-            
-            # Settle Down - 11 total
-            {'design_name': 'Settle Down', 'size': 'M', 'quantity': 1, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Settle Down', 'size': 'L', 'quantity': 4, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Settle Down', 'size': 'XL', 'quantity': 2, 'price': 720, 'color': 'Navy'},
-            {'design_name': 'Settle Down', 'size': '2XL', 'quantity': 4, 'price': 720, 'color': 'Navy'},
-            
-            # Game Night - 17 total
-            {'design_name': 'Game Night', 'size': 'S', 'quantity': 4, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Game Night', 'size': 'M', 'quantity': 4, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Game Night', 'size': 'L', 'quantity': 2, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Game Night', 'size': 'XL', 'quantity': 2, 'price': 720, 'color': 'Black'},
-            {'design_name': 'Game Night', 'size': '2XL', 'quantity': 5, 'price': 720, 'color': 'Black'},
-            
-            # Board Game components - 16 total (Price: 700)
-            {'design_name': 'Board Game components', 'size': 'S', 'quantity': 4, 'price': 700, 'color': 'Navy'},
-            {'design_name': 'Board Game components', 'size': 'M', 'quantity': 4, 'price': 700, 'color': 'Navy'},
-            {'design_name': 'Board Game components', 'size': 'L', 'quantity': 3, 'price': 700, 'color': 'Navy'},
-            {'design_name': 'Board Game components', 'size': 'XL', 'quantity': 1, 'price': 700, 'color': 'Navy'},
-            {'design_name': 'Board Game components', 'size': '2XL', 'quantity': 4, 'price': 700, 'color': 'Navy'}
-        ]
-        
-        # Add all t-shirts back to the database
-        tshirts = [TShirt(**data) for data in tshirts_data]
-        db.session.add_all(tshirts)
-        db.session.commit()
-        
-        return jsonify({'message': 'Inventory reset successfully'}), 200
+        mode = 'upsert' if request.args.get('mode') == 'upsert' else 'replace'
+        return _job_accepted(job_runner.submit('reset_inventory', {'mode': mode}))
     except Exception as e:
         db.session.rollback()
-        print(f"Error resetting inventory: {e}")
+        logger.error(f"Error queueing inventory reset: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/update-stock', methods=['POST'])
+@api.route('/api/update-stock', methods=['POST'])
 def update_stock():
-    """Update t-shirt stock based on sales"""
+    """Restock t-shirts according to a restock policy.
+
+    The JSON body picks the policy and its parameters, e.g.
+    ``{"policy": "velocity", "window_days": 28, "cover_days": 14}`` (see
+    restock.py). With no body the threshold policy is used. The restock runs
+    as a background job: the answer is 202 with the job, and GET
+    /api/jobs/<id> reports its progress and, once done, the number of SKUs
+    restocked. ``dry_run`` (in the body or the query string) returns the
+    planned adjustments right away and leaves stock unchanged.
+    """
+    data = request.get_json(silent=True) or {}
+    dry_run = data.get('dry_run', request.args.get('dry_run', '')) in (True, 1, '1', 'true', 'yes')
     try:
-        # Get all t-shirts
-        tshirts = TShirt.query.all()
-        
-        # Get recent orders (could be refined to specific time period)
-        recent_orders = Order.query.all()
-        
-        # Calculate adjustment - here we simulate a modest restock for each design
-        for tshirt in tshirts:
-            # Only add stock if current quantity is below a threshold (e.g., 5)
-            if tshirt.quantity < 5:
-                # Add between 1-3 items randomly to simulate a restock
-                import random
-                restock_amount = random.randint(1, 3)
-                tshirt.quantity += restock_amount
-        
-        db.session.commit()
-        return jsonify({'message': 'Stock updated successfully'}), 200
+        policy, params = resolve_policy(data.get('policy'), data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        if dry_run:
+            adjustments = plan_restock(policy, params)
+            db.session.rollback()
+            return jsonify({
+                'policy': policy,
+                'params': params,
+                'dry_run': True,
+                'restocked': len(adjustments),
+                'units': sum(a['restock'] for a in adjustments),
+                'adjustments': adjustments
+            }), 200
+
+        return _job_accepted(job_runner.submit('update_stock', {'policy': policy, 'params': params}))
     except Exception as e:
         db.session.rollback()
-        print(f"Error updating stock: {e}")
+        logger.error(f"Error updating stock: {e}")
         return jsonify({'error': str(e)}), 500
 
+@api.route('/api/jobs/<int:job_id>', methods=['GET'])
+@primary_only
+def get_job(job_id):
+    """Status of a background job: ``status`` is queued, running, succeeded or
+    failed, ``done`` of ``total`` counts the SKUs processed so far, and
+    ``result`` or ``error`` is set once it has finished.
+    """
+    # Picks up jobs queued before this worker started
+    job_runner.start()
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_to_dict(job))
+
+def _export_response(statement, fields, fmt, name):
+    return current_app.response_class(
+        stream_export(db.engine, statement, fields, fmt),
+        mimetype=FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={name}.{fmt}'}
+    )
+
+@api.route('/api/export/orders', methods=['GET'])
+def export_orders():
+    """Stream all orders as CSV (default) or NDJSON (``format=ndjson``).
+
+    Takes the status, tshirt_id, date_from, date_to and include_archived
+    filters of GET /api/orders.
+    """
+    try:
+        fmt = resolve_format(request.args.get('format'))
+        statement = orders_export_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    return _export_response(statement, EXPORT_ORDER_COLUMNS, fmt, 'orders')
+
+@api.route('/api/export/tshirts', methods=['GET'])
+def export_tshirts():
+    """Stream the catalog as CSV (default) or NDJSON (``format=ndjson``)"""
+    try:
+        fmt = resolve_format(request.args.get('format'))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    return _export_response(tshirts_export_query(), EXPORT_TSHIRT_COLUMNS, fmt, 'tshirts')
+
+@api.route('/api/import/orders', methods=['POST'])
+def import_orders_upload():
+    """Bulk-insert orders from a CSV or NDJSON request body.
+
+    The format comes from ``format`` or the Content-Type (text/csv or
+    application/x-ndjson). Stock is not changed. On a bad row the response
+    is 400 with the line number and how many orders were already imported.
+    """
+    try:
+        fmt = resolve_format(request.args.get('format'), request.mimetype)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        imported = import_orders(request.stream, fmt)
+    except ImportRowError as e:
+        return jsonify({'error': str(e), 'line': e.line, 'imported': e.imported}), 400
+    return jsonify({'imported': imported})
+
+@api.route('/api/import/tshirts', methods=['POST'])
+def import_tshirts_upload():
+    """Merge t-shirts from a CSV or NDJSON request body into the catalog by SKU.
+
+    All rows are applied or none: a bad row returns 400 with its line number.
+    """
+    try:
+        fmt = resolve_format(request.args.get('format'), request.mimetype)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        imported = import_tshirts(request.stream, fmt)
+    except ImportRowError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'line': e.line}), 400
+    bump_cache_version('catalog')
+    publish_change('catalog_reset')
+    db.session.commit()
+    change_broker.notify()
+    return jsonify({'imported': imported})
+
+@api.route('/api/stream', methods=['GET'])
+@primary_only
+def stream_changes():
+    """Server-Sent Events stream of stock and order changes.
+
+    Events are ``stock`` ({tshirt_id, quantity}), ``order_created``,
+    ``order_deleted`` ({order_id}) and ``catalog_reset`` (refetch everything).
+    Reconnecting clients send Last-Event-ID and get the events they missed.
+    Each open stream is an idle generator, so serve this with an async
+    worker class (see Procfile) rather than one sync worker per client.
+    """
+    subscriber = change_broker.subscribe()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    # Replay after subscribing so nothing committed in between is lost;
+    # duplicates are skipped below by id
+    missed = []
+    if last_event_id and last_event_id.isdigit():
+        missed = [format_sse(e) for e in committed_changes(int(last_event_id), limit=1000)]
+    db.session.remove()
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            sent_id = 0
+            for event_id, message in missed:
+                sent_id = event_id
+                yield message
+            while True:
+                try:
+                    event_id, message = subscriber.get(timeout=15)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                if event_id > sent_id:
+                    sent_id = event_id
+                    yield message
+        finally:
+            change_broker.unsubscribe(subscriber)
+
+    response = current_app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Reporting endpoints, all answered from the sales_daily rollup
+
+REPORT_DIMENSIONS = {
+    'design': TShirt.design_name,
+    'size': TShirt.size,
+    'color': TShirt.color
+}
+
+def _sales_query(*columns):
+    """Rollup query joined to t-shirts and limited to the requested date range"""
+    query = db.session.query(*columns).select_from(SalesDaily).join(
+        TShirt, SalesDaily.tshirt_id == TShirt.id)
+    if request.args.get('date_from'):
+        query = query.filter(SalesDaily.day >= date.fromisoformat(request.args['date_from']))
+    if request.args.get('date_to'):
+        query = query.filter(SalesDaily.day <= date.fromisoformat(request.args['date_to']))
+    return query
+
+def _bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+@api.route('/api/reports/summary', methods=['GET'])
+def report_summary():
+    """Total orders, units sold, revenue and average order value"""
+    try:
+        orders, units, revenue = _sales_query(
+            db.func.coalesce(db.func.sum(SalesDaily.order_count), 0),
+            db.func.coalesce(db.func.sum(SalesDaily.units), 0),
+            db.func.coalesce(db.func.sum(SalesDaily.revenue), 0)
+        ).one()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    return jsonify({
+        'total_orders': orders,
+        'units_sold': units,
+        'revenue': float(revenue),
+        'average_order_value': float(revenue) / orders if orders else 0
+    })
+
+@api.route('/api/reports/sales-by/<dimension>', methods=['GET'])
+def report_sales_by(dimension):
+    """Units and revenue grouped by design, size or color"""
+    column = REPORT_DIMENSIONS.get(dimension)
+    if column is None:
+        return jsonify({'error': f'Unknown dimension: {dimension}'}), 404
+    try:
+        rows = _sales_query(
+            column, db.func.sum(SalesDaily.units), db.func.sum(SalesDaily.revenue)
+        ).group_by(column).order_by(db.func.sum(SalesDaily.revenue).desc()).all()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    return jsonify([{
+        dimension: key,
+        'units': units,
+        'revenue': float(revenue)
+    } for key, units, revenue in rows])
+
+@api.route('/api/reports/top-sellers', methods=['GET'])
+def report_top_sellers():
+    """Best-selling SKUs by units sold"""
+    try:
+        limit = min(int(request.args.get('limit', 5)), 100)
+        if limit < 1:
+            raise ValueError('limit must be at least 1')
+        # SKUs whose orders were all deleted keep rollup rows with 0 units
+        rows = _sales_query(
+            TShirt.id, TShirt.design_name, TShirt.size, TShirt.color,
+            db.func.sum(SalesDaily.units), db.func.sum(SalesDaily.revenue)
+        ).group_by(TShirt.id).having(db.func.sum(SalesDaily.units) > 0).order_by(
+            db.func.sum(SalesDaily.units).desc(), TShirt.id
+        ).limit(limit).all()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    return jsonify([{
+        'tshirt_id': tshirt_id,
+        'design_name': design_name,
+        'size': size,
+        'color': color,
+        'units': units,
+        'revenue': float(revenue)
+    } for tshirt_id, design_name, size, color, units, revenue in rows])
+
+@api.route('/api/reports/sales-over-time', methods=['GET'])
+def report_sales_over_time():
+    """Orders, units and revenue bucketed per day, week or month"""
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in ('day', 'week', 'month'):
+        return jsonify({'error': f'Unknown bucket: {bucket}'}), 400
+    try:
+        rows = _sales_query(
+            SalesDaily.day, db.func.sum(SalesDaily.order_count),
+            db.func.sum(SalesDaily.units), db.func.sum(SalesDaily.revenue)
+        ).group_by(SalesDaily.day).order_by(SalesDaily.day).all()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+    # Days are already aggregated in SQL; folding them into weeks or months
+    # touches at most one row per day in the range
+    buckets = {}
+    for day, orders, units, revenue in rows:
+        key = _bucket_start(day, bucket)
+        totals = buckets.setdefault(key, [0, 0, 0.0])
+        totals[0] += orders
+        totals[1] += units
+        totals[2] += revenue
+    return jsonify([{
+        'period': key.isoformat(),
+        'orders': orders,
+        'units': units,
+        'revenue': float(revenue)
+    } for key, (orders, units, revenue) in buckets.items()])
+
+@api.route('/api/reports/customers', methods=['GET'])
+def report_customers():
+    """Customer count, new customers, averages per customer and top spenders.
+
+    New customers placed their first order in the last ``new_days`` days
+    (default 30); ``limit`` (default 10) top spenders are listed. Answered
+    from the customers table's lifetime totals.
+    """
+    try:
+        new_days = int(request.args.get('new_days', 30))
+        limit = min(int(request.args.get('limit', 10)), 100)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    customers, orders, spent = db.session.query(
+        db.func.count(Customer.id),
+        db.func.coalesce(db.func.sum(Customer.order_count), 0),
+        db.func.coalesce(db.func.sum(Customer.total_spent), 0)
+    ).filter(Customer.order_count > 0).one()
+    new_customers = db.session.query(db.func.count(Customer.id)).filter(
+        Customer.first_order_at >= datetime.utcnow() - timedelta(days=new_days)).scalar()
+    top = db.session.query(*[getattr(Customer, f) for f in CUSTOMER_FIELDS]) \
+        .order_by(Customer.total_spent.desc(), Customer.id.desc()).limit(limit).all()
+    return jsonify({
+        'total_customers': customers,
+        'new_customers': new_customers,
+        'average_orders': orders / customers if customers else 0,
+        'average_spent': float(spent) / customers if customers else 0,
+        'top_customers': records(CUSTOMER_FIELDS, top)
+    })
+
+@api.route('/api/reports/inventory', methods=['GET'])
+def report_inventory():
+    """Stock totals, inventory value and low-stock count"""
+    try:
+        threshold = int(request.args.get('low_stock_threshold', 5))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    units, value, low_stock = db.session.query(
+        db.func.coalesce(db.func.sum(TShirt.quantity), 0),
+        db.func.coalesce(db.func.sum(TShirt.quantity * TShirt.price), 0),
+        db.func.coalesce(db.func.sum(db.case((TShirt.quantity <= threshold, 1), else_=0)), 0)
+    ).one()
+    return jsonify({
+        'total_units': units,
+        'inventory_value': float(value),
+        'low_stock_count': low_stock
+    })
+
+def _parse_time(value, default):
+    return datetime.fromisoformat(value) if value else default
+
+@api.route('/api/reports/stock', methods=['GET'])
+def report_stock_at():
+    """Stock per SKU as it stood at ``at`` (ISO date or datetime, default now).
+
+    Computed from the stock ledger: the latest snapshot before ``at`` plus the
+    movements recorded after it.
+    """
+    try:
+        at = _parse_time(request.args.get('at'), datetime.utcnow())
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    levels = stock_at_query(at)
+    rows = db.session.execute(
+        db.select(levels.c.tshirt_id, TShirt.design_name, TShirt.size, TShirt.color, levels.c.quantity)
+        .select_from(levels.outerjoin(TShirt, TShirt.id == levels.c.tshirt_id))
+        .order_by(levels.c.tshirt_id)
+    ).all()
+    return jsonify({
+        'at': at,
+        'stock': records(('tshirt_id', 'design_name', 'size', 'color', 'quantity'), rows)
+    })
+
+@api.route('/api/reports/stock-movements', methods=['GET'])
+def report_stock_movements():
+    """Opening stock, movements by reason and closing stock per SKU.
+
+    Covers ``date_from`` (default: 30 days ago) up to ``date_to`` (default
+    now). Reasons are order, order_deleted, restock, catalog_reset and
+    opening.
+    """
+    now = datetime.utcnow()
+    try:
+        date_from = _parse_time(request.args.get('date_from'), now - timedelta(days=30))
+        date_to = _parse_time(request.args.get('date_to'), now)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    return jsonify({
+        'date_from': date_from,
+        'date_to': date_to,
+        'skus': movement_report(date_from, date_to)
+    })
+
+@api.route('/api/forecast', methods=['GET'])
+def forecast():
+    """Per-SKU demand rates, days of stock left and reorder suggestions.
+
+    Query parameters: history_days (default 90), cover_days (default 14) and
+    alpha, the smoothing of the daily demand forecast (default 0.1). SKUs
+    come back soonest-to-sell-out first. The result is cached per worker
+    until the next order or stock change.
+    """
+    try:
+        params = resolve_forecast_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    today = datetime.utcnow().date()
+    key = (get_cache_version('orders'), get_cache_version('catalog'), today,
+           tuple(sorted(params.items())))
+    body = forecast_cache.get(key)
+    if body is None:
+        body = dumps({
+            'as_of': today.isoformat(),
+            **params,
+            'skus': compute_forecast(today=today, **params)
+        })
+        forecast_cache.put(key, body)
+    return current_app.response_class(body, mimetype='application/json')
+
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        init_db()
     app.run(debug=True, port=5008)
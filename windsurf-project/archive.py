@@ -0,0 +1,239 @@
+"""Hot/cold storage for closed orders.
+
+archive_orders() moves fulfilled and cancelled orders older than a given age
+out of the orders table into orders_archive, so the hot table and its
+indexes only hold recent and open orders.
+
+    SQLite    orders_archive lives in a separate database file, attached to
+              every connection as ``archive`` (default: <db>-archive.db next
+              to the main file, or the ARCHIVE_DATABASE config key).
+    Postgres  orders_archive is range-partitioned by order_date, one
+              partition per month, created as orders are archived into it.
+
+The orders_all view is the union of both tables. Reports and exports that
+need the full history select from orders_all (see orders_source()); the
+default order queries only touch the hot table (see
+requested_orders_source()).
+
+Each batch is copied to the archive in one transaction and deleted from
+the hot table in a second one. SQLite does not commit a transaction across
+attached databases atomically in WAL mode, so the copy is committed
+before the hot rows go. An interruption can leave orders in both tables,
+and orders_all lists them twice until the next run. It can never lose
+them. Copies are idempotent, so rerunning the job finishes the move
+without duplicating archived rows.
+"""
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from models import db, Order
+
+CLOSED_STATUSES = ('fulfilled', 'cancelled')
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+BATCH_SIZE = 5000
+
+# Columns added later come last: Postgres can only replace a view by
+# appending columns
+ORDER_COLUMNS = ('id', 'header_id', 'customer_name', 'customer_phone',
+                 'tshirt_id', 'quantity', 'status', 'order_date', 'customer_id', 'unit_price')
+
+
+def _order_columns():
+    return [
+        db.Column('id', db.Integer, primary_key=True, autoincrement=False),
+        db.Column('header_id', db.Integer),
+        db.Column('customer_name', db.String(100), nullable=False),
+        db.Column('customer_phone', db.String(20), nullable=False),
+        db.Column('tshirt_id', db.Integer, nullable=False),
+        db.Column('quantity', db.Integer, nullable=False),
+        db.Column('status', db.String(20)),
+        # Part of the key so Postgres can partition on it
+        db.Column('order_date', db.DateTime, primary_key=True),
+        db.Column('customer_id', db.Integer),
+        db.Column('unit_price', db.Float),
+    ]
+
+
+# Kept out of db.metadata: create_all() must not create these in the main schema
+_archive_tables = {}
+
+# Read-only handle on the orders_all view
+orders_all = db.Table('orders_all', db.MetaData(), *_order_columns())
+
+
+def archive_table(dialect_name):
+    """The orders_archive table as addressed on the given dialect"""
+    table = _archive_tables.get(dialect_name)
+    if table is None:
+        table = db.Table(
+            'orders_archive', db.MetaData(),
+            *_order_columns(),
+            db.Column('archived_at', db.DateTime, nullable=False),
+            db.Index('ix_orders_archive_order_date', 'order_date'),
+            db.Index('ix_orders_archive_tshirt_id', 'tshirt_id'),
+            db.Index('ix_orders_archive_customer_id_order_date', 'customer_id', 'order_date'),
+            schema='archive' if dialect_name == 'sqlite' else None,
+            postgresql_partition_by='RANGE (order_date)',
+        )
+        _archive_tables[dialect_name] = table
+    return table
+
+
+def _union_view_sql(hot, cold):
+    columns = ', '.join(ORDER_COLUMNS)
+    return f'SELECT {columns} FROM {hot} UNION ALL SELECT {columns} FROM {cold}'
+
+
+def archive_database_path(app, engine):
+    """File backing the SQLite archive schema"""
+    configured = app.config.get('ARCHIVE_DATABASE')
+    if configured:
+        return configured
+    main = engine.url.database
+    if not main or main == ':memory:':
+        return ':memory:'
+    root, _ = os.path.splitext(main)
+    return f'{root}-archive.db'
+
+
+def init_archive(app, db):
+    """Attach the archive database to every SQLite connection of app.
+
+    The orders_all view spans two database files, which SQLite only allows
+    for TEMP views, so it is created per connection as well. A SQLite read
+    replica attaches the same archive file.
+    """
+    with app.app_context():
+        engine = db.engine
+        engines = [bound for bound in db.engines.values() if bound.dialect.name == 'sqlite']
+    if engine.dialect.name != 'sqlite':
+        return
+
+    path = archive_database_path(app, engine)
+    table = archive_table('sqlite')
+    create_table = str(CreateTable(table, if_not_exists=True).compile(dialect=engine.dialect))
+    ddl = [str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+           for index in table.indexes]
+    ddl.append('CREATE TEMP VIEW IF NOT EXISTS orders_all AS '
+               + _union_view_sql('main.orders', 'archive.orders_archive'))
+
+    def _attach(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute('ATTACH DATABASE ? AS archive', (path,))
+            cursor.execute(create_table)
+            # Archives from before customers or order prices were tracked
+            columns = {row[1] for row in cursor.execute('PRAGMA archive.table_info(orders_archive)')}
+            if 'customer_id' not in columns:
+                cursor.execute('ALTER TABLE archive.orders_archive ADD COLUMN customer_id INTEGER')
+            if 'unit_price' not in columns:
+                cursor.execute('ALTER TABLE archive.orders_archive ADD COLUMN unit_price FLOAT')
+            for statement in ddl:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    for bound in engines:
+        event.listen(bound, 'connect', _attach)
+
+
+def migrate_archive():
+    """Create the archive table and the orders_all view on Postgres.
+
+    SQLite needs nothing here; init_archive() sets both up per connection.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+    table = archive_table('postgresql')
+    with db.engine.begin() as conn:
+        table.create(conn, checkfirst=True)
+        columns = {c['name'] for c in db.inspect(conn).get_columns('orders_archive')}
+        if 'customer_id' not in columns:
+            conn.execute(db.text('ALTER TABLE orders_archive ADD COLUMN customer_id INTEGER'))
+        if 'unit_price' not in columns:
+            conn.execute(db.text('ALTER TABLE orders_archive ADD COLUMN unit_price FLOAT'))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+        conn.execute(db.text('CREATE OR REPLACE VIEW orders_all AS '
+                             + _union_view_sql('orders', 'orders_archive')))
+
+
+def _ensure_partitions(ids):
+    """Create the monthly Postgres partitions the given hot orders fall into"""
+    months = db.session.execute(
+        db.select(db.func.date_trunc('month', Order.order_date)).where(Order.id.in_(ids)).distinct()
+    ).scalars()
+    for month in months:
+        start = month.date()
+        end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        db.session.execute(db.text(
+            f"CREATE TABLE IF NOT EXISTS orders_archive_y{start:%Y}m{start:%m} "
+            f"PARTITION OF orders_archive FOR VALUES FROM ('{start}') TO ('{end}')"))
+
+
+def archive_orders(older_than_days=DEFAULT_ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE, now=None):
+    """Move closed orders older than older_than_days into the archive.
+
+    Works in batches of batch_size orders, committing each batch's copy and
+    then its delete. Returns the number of orders moved.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    dialect = db.engine.dialect.name
+    table = archive_table(dialect)
+    candidates = (db.select(Order.id)
+                  .where(Order.status.in_(CLOSED_STATUSES), Order.order_date < cutoff)
+                  .order_by(Order.id)
+                  .limit(batch_size))
+    hot_columns = [getattr(Order, name) for name in ORDER_COLUMNS]
+
+    moved = 0
+    while True:
+        ids = db.session.execute(candidates).scalars().all()
+        if not ids:
+            break
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+            _ensure_partitions(ids)
+            copy = insert(table).on_conflict_do_nothing()
+        else:
+            copy = db.insert(table).prefix_with('OR IGNORE')
+        db.session.execute(copy.from_select(
+            list(ORDER_COLUMNS) + ['archived_at'],
+            db.select(*hot_columns, db.literal(now, db.DateTime)).where(Order.id.in_(ids))
+        ))
+        db.session.commit()
+        # Only orders whose copy is committed leave the hot table
+        db.session.execute(db.delete(Order).where(
+            Order.id.in_(ids), Order.id.in_(db.select(table.c.id).where(table.c.id.in_(ids)))))
+        db.session.commit()
+        moved += len(ids)
+    return moved
+
+
+def requested_orders_source(args):
+    """The orders table, or the orders_all view when args sets include_archived.
+
+    GET /api/orders and the orders export read the flag the same way.
+    """
+    if args.get('include_archived', '') in ('1', 'true', 'yes'):
+        return orders_all
+    return Order.__table__
+
+
+def orders_source(since=None):
+    """The table to read orders from for a query starting at since.
+
+    The hot table is enough when since is newer than everything archived;
+    otherwise (or when since is None) the orders_all view is needed.
+    """
+    if since is not None:
+        newest_archived = db.session.execute(
+            db.select(db.func.max(archive_table(db.engine.dialect.name).c.order_date))
+        ).scalar()
+        if newest_archived is None or newest_archived < since:
+            return Order.__table__
+    return orders_all
@@ -0,0 +1,109 @@
+"""Hot-table size and default query timings before and after archival.
+
+Loads a scratch database with several years of synthetic orders, mostly
+closed, times the default order queries against the hot table, archives
+closed orders older than --older-than-days and times them again. Run from
+the project directory:
+
+    python bench/bench_archive.py --orders 2000000 --years 5
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from common import app_context, insert_orders, scratch_database_url
+
+QUERIES = [
+    ('latest page', '/api/orders?limit=50'),
+    ('latest page for a status', '/api/orders?limit=50&status=pending'),
+    ('orders for one t-shirt, 50', '/api/orders?limit=50&tshirt_id=7'),
+    ('last 30 days', None),
+]
+
+
+def load_orders(count, years, tshirt_ids):
+    now = datetime.utcnow()
+    rng = random.Random(42)
+    span = years * 365 * 24 * 3600
+
+    def order(i):
+        age = rng.randrange(span)
+        # Recent orders may still be open; old ones are nearly all closed
+        status = rng.choice(('pending', 'fulfilled')) if age < 30 * 86400 else \
+            rng.choice(('fulfilled', 'fulfilled', 'cancelled'))
+        return {
+            'customer_name': f'Customer {rng.randrange(50000)}',
+            'customer_phone': f'{rng.randrange(10 ** 9, 10 ** 10)}',
+            'tshirt_id': rng.choice(tshirt_ids),
+            'quantity': rng.randint(1, 3),
+            'status': status,
+            'order_date': now - timedelta(seconds=age)
+        }
+
+    insert_orders(count, order, batch_size=100000)
+
+
+def hot_table_stats(db):
+    from models import Order
+    rows = db.session.query(db.func.count(Order.id)).scalar()
+    if db.engine.dialect.name == 'sqlite':
+        pages = db.session.execute(db.text(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+            "(SELECT name FROM sqlite_master WHERE tbl_name = 'orders')")).scalar()
+    else:
+        pages = db.session.execute(db.text("SELECT pg_total_relation_size('orders')")).scalar()
+    return rows, pages
+
+
+def run_queries(app, db, repeat):
+    client = app.test_client()
+    since = (datetime.utcnow() - timedelta(days=30)).date().isoformat()
+    results = []
+    for name, url in QUERIES:
+        url = url or f'/api/orders?date_from={since}'
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.data
+        results.append((name, statistics.median(timings)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=2000000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--older-than-days', type=int, default=180)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', help='scratch database (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    with app_context(args.database_url or scratch_database_url('bench-archive-')) as app:
+        from archive import archive_orders
+        from models import db, TShirt
+
+        tshirt_ids = [row[0] for row in db.session.query(TShirt.id)]
+        start = time.perf_counter()
+        load_orders(args.orders, args.years, tshirt_ids)
+        print(f'Loaded {args.orders} orders over {args.years} years in {time.perf_counter() - start:.1f}s')
+
+        for label in ('before archival', 'after archival'):
+            if label == 'after archival':
+                start = time.perf_counter()
+                moved = archive_orders(args.older_than_days, batch_size=50000)
+                print(f'\nArchived {moved} orders in {time.perf_counter() - start:.1f}s')
+                if db.engine.dialect.name == 'sqlite':
+                    db.session.execute(db.text('VACUUM main'))
+                db.session.execute(db.text('ANALYZE'))
+            rows, size = hot_table_stats(db)
+            print(f'\n== {label}: {rows} hot orders, {size / 1e6:.1f} MB table + indexes')
+            for name, ms in run_queries(app, db, args.repeat):
+                print(f'{name:28s} {ms:10.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Customer pages from the customers table versus grouping all orders.
+
+Fills a scratch database with --orders orders from --customers customers
+(some without a phone number) and times the backfill that links them to
+customers. Then compares answering the customer list and one customer's
+order history by grouping every order, as the Customers page used to do,
+with GET /api/customers and GET /api/customers/<id>/orders. Run from the
+project directory:
+
+    python bench/bench_customers.py --orders 1000000 --customers 50000
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from common import app_context, insert_orders, scratch_database_url
+
+
+def load_orders(count, customers, tshirt_ids):
+    """Insert orders without customers, as in a database from before them"""
+    rng = random.Random(42)
+    start = datetime.utcnow() - timedelta(days=365)
+
+    def order(i):
+        customer = rng.randrange(customers)
+        return {
+            'customer_name': f'Customer {customer}',
+            # One customer in ten gave no phone number
+            'customer_phone': '' if customer % 10 == 0 else f'98{customer:08d}',
+            'tshirt_id': rng.choice(tshirt_ids),
+            'quantity': rng.randint(1, 3),
+            'status': 'fulfilled',
+            'order_date': start + timedelta(seconds=i * 31536000 // count)
+        }
+
+    insert_orders(count, order, batch_size=100000)
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--customers', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with app_context(scratch_database_url('bench-customers-')) as app:
+        from customers import backfill_customers
+        from models import db, Order, TShirt
+
+        client = app.test_client()
+        tshirt_ids = [row[0] for row in db.session.query(TShirt.id)]
+        load_orders(args.orders, args.customers, tshirt_ids)
+        start = time.perf_counter()
+        linked = backfill_customers()
+        elapsed = time.perf_counter() - start
+        print(f'backfill  {linked} orders in {elapsed:.1f}s: {linked / elapsed:,.0f} orders/s')
+        customer_id = db.session.query(Order.customer_id).filter(Order.id == args.orders // 2).scalar()
+
+    def group_orders():
+        # What the page used to do, minus the JSON of every order
+        with app.app_context():
+            db.session.query(
+                Order.customer_name, Order.customer_phone, db.func.count(), db.func.sum(Order.quantity),
+                db.func.max(Order.order_date)
+            ).group_by(Order.customer_name, Order.customer_phone).all()
+
+    def customer_orders_scan():
+        with app.app_context():
+            phone = db.session.query(Order.customer_phone).filter(Order.customer_id == customer_id).limit(1).scalar()
+            db.session.query(Order.id).filter(Order.customer_phone == phone).all()
+
+    def report(label, fn):
+        print(f'{label:44s} {timed(fn, args.repeat):9.2f} ms')
+
+    report('customer list, GROUP BY over orders', group_orders)
+    for sort in ('name', 'recent', 'spent'):
+        report(f'GET /api/customers?sort={sort}', lambda: client.get(f'/api/customers?sort={sort}'))
+    report("one customer's orders, by phone (no index)", customer_orders_scan)
+    report(f'GET /api/customers/{customer_id}/orders', lambda: client.get(f'/api/customers/{customer_id}/orders'))
+    report('GET /api/reports/customers', lambda: client.get('/api/reports/customers'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Full recompute time of the demand forecast over a large order history.
+
+Loads a scratch database with synthetic SKUs and orders spread over the
+last year, then times compute_forecast(), split into reading and binning
+the order columns and the whole call. Run from the project directory:
+
+    python bench/bench_forecast.py --orders 10000000 --skus 1000 --history-days 90
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_data(db, skus, orders, batch_size=100000):
+    from models import Order, TShirt
+    rng = random.Random(42)
+    db.session.execute(db.delete(TShirt))
+    db.session.execute(db.insert(TShirt), [{
+        'design_name': f'Design {i // 30}',
+        'size': ('XS', 'S', 'M', 'L', 'XL', '2XL')[i % 6],
+        'color': f'Color {i % 30 // 6}',
+        'quantity': rng.randrange(0, 50),
+        'price': 25.0
+    } for i in range(skus)])
+    ids = [row[0] for row in db.session.query(TShirt.id)]
+    db.session.commit()
+
+    now = datetime.utcnow()
+    statuses = ('pending', 'fulfilled', 'cancelled')
+    for start in range(0, orders, batch_size):
+        db.session.execute(db.insert(Order), [{
+            'customer_name': 'Bench',
+            'customer_phone': '0000000000',
+            'tshirt_id': rng.choice(ids),
+            'quantity': rng.randint(1, 3),
+            'status': rng.choice(statuses),
+            'order_date': now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+        } for _ in range(min(batch_size, orders - start))])
+        db.session.commit()
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--skus', type=int, default=1000)
+    parser.add_argument('--history-days', type=int, default=90)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database-url', help='scratch database (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='bench-forecast-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    sys.path.insert(0, PROJECT_DIR)
+    import numpy as np
+    from app import create_app, init_db
+    from models import db
+    from forecast import compute_forecast, daily_units
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        start = time.perf_counter()
+        ids = load_data(db, args.skus, args.orders)
+        print(f'Loaded {args.skus} SKUs and {args.orders} orders in {time.perf_counter() - start:.1f}s')
+
+        today = datetime.utcnow().date()
+        sorted_ids = np.array(sorted(ids), dtype=np.int64)
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            daily = daily_units(sorted_ids, args.history_days, today)
+            read_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            result = compute_forecast(history_days=args.history_days, today=today)
+            total_seconds = time.perf_counter() - start
+            print(f'read+bin {int(daily.sum())} units: {read_seconds:.2f}s   '
+                  f'compute_forecast for {len(result)} SKUs: {total_seconds:.2f}s')
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Order throughput with and without group commit at several concurrencies.
+
+For each mode, starts the API under gunicorn (gevent workers, as in the
+Procfile) against a fresh SQLite database with plenty of stock, then has
+1, 8 and 64 keep-alive clients post fulfilled single-line orders for a
+fixed time and reports orders per second and latency. Run from the project
+directory:
+
+    python bench/bench_group_commit.py --clients 1 8 64 --seconds 10
+"""
+import argparse
+import http.client
+import os
+import random
+import statistics
+import threading
+import time
+
+from common import (call, connect, init_db, order_body, percentile, restock, scratch_database_url, serve,
+                    tshirt_ids as fetch_tshirt_ids)
+
+
+def run_clients(port, tshirt_ids, clients, seconds):
+    """Post orders from clients threads for seconds; return latencies and errors"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(seed):
+        rng = random.Random(seed)
+        conn = connect(port)
+        local = []
+        failed = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = call(conn, 'POST', '/api/orders', order_body(seed, rng.choice(tshirt_ids)))[0]
+            except (OSError, http.client.HTTPException):
+                status = 599
+                conn.close()
+                conn = connect(port)
+            if status == 200:
+                local.append(time.perf_counter() - start)
+            else:
+                failed += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, sum(errors)
+
+
+def run_mode(group_commit, args):
+    env = dict(os.environ, DATABASE_URL=scratch_database_url('bench-group-'),
+               ORDER_GROUP_COMMIT='1' if group_commit else '0',
+               GROUP_COMMIT_WINDOW_MS=str(args.window_ms))
+    init_db(env)
+    rows = []
+    with serve(args.port, env, workers=args.workers):
+        conn = connect(args.port)
+        restock(conn, 10 ** 8)
+        tshirt_ids = fetch_tshirt_ids(conn)
+        conn.close()
+        for clients in args.clients:
+            latencies, errors = run_clients(args.port, tshirt_ids, clients, args.seconds)
+            rows.append((clients, len(latencies) / args.seconds,
+                         statistics.median(latencies or [0]) * 1000, percentile(latencies, 0.99) * 1000, errors))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 64])
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--window-ms', type=float, default=2.0, help='GROUP_COMMIT_WINDOW_MS')
+    parser.add_argument('--port', type=int, default=5096)
+    args = parser.parse_args()
+
+    print(f'{args.workers} gevent workers, {args.seconds:g}s per run, window {args.window_ms:g} ms')
+    print(f'{"mode":14s} {"clients":>7s} {"orders/s":>9s} {"p50 ms":>8s} {"p99 ms":>8s} {"errors":>6s}')
+    for group_commit in (False, True):
+        label = 'group commit' if group_commit else 'per request'
+        for clients, rate, p50, p99, errors in run_mode(group_commit, args):
+            print(f'{label:14s} {clients:7d} {rate:9.1f} {p50:8.2f} {p99:8.2f} {errors:6d}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Query plans and timings for the order access paths, before and after indexes.
+
+Loads a scratch database with synthetic orders, runs the lookups the API
+performs with the secondary indexes dropped, then applies migrate_schema()
+and runs them again. Run from the project directory:
+
+    python bench/bench_indexes.py --orders 1000000
+    python bench/bench_indexes.py --database-url postgresql://localhost/scratch
+
+Synthetic orders are added to whatever database --database-url points at,
+so only use a scratch database.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUERIES = [
+    ('orders for one t-shirt',
+     'SELECT COUNT(*) FROM orders WHERE tshirt_id = :tshirt_id'),
+    ('orders in one day',
+     'SELECT COUNT(*) FROM orders WHERE order_date >= :day_start AND order_date < :day_end'),
+    ('latest page',
+     'SELECT id FROM orders ORDER BY order_date DESC, id DESC LIMIT 50'),
+    ('latest page for a status',
+     "SELECT id FROM orders WHERE status = 'fulfilled' ORDER BY order_date DESC LIMIT 50"),
+    ('design lookup',
+     'SELECT * FROM tshirts WHERE design_name = :design_name'),
+]
+
+
+def load_orders(db, count, tshirt_ids, batch_size=50000):
+    now = datetime.utcnow()
+    statuses = ('pending', 'fulfilled', 'cancelled')
+    insert = db.text(
+        'INSERT INTO orders (customer_name, customer_phone, tshirt_id, quantity, status, order_date) '
+        'VALUES (:customer_name, :customer_phone, :tshirt_id, :quantity, :status, :order_date)')
+    rng = random.Random(42)
+    for start in range(0, count, batch_size):
+        rows = [{
+            'customer_name': f'Customer {rng.randrange(50000)}',
+            'customer_phone': f'{rng.randrange(10 ** 9, 10 ** 10)}',
+            'tshirt_id': rng.choice(tshirt_ids),
+            'quantity': rng.randint(1, 3),
+            'status': rng.choice(statuses),
+            'order_date': now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+        } for _ in range(min(batch_size, count - start))]
+        with db.engine.begin() as conn:
+            conn.execute(insert, rows)
+
+
+def run_queries(db, params, repeat):
+    explain = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    results = []
+    with db.engine.connect() as conn:
+        for name, sql in QUERIES:
+            plan = [' '.join(str(col) for col in row) for row in conn.execute(db.text(explain + sql), params)]
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                conn.execute(db.text(sql), params).fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+            results.append((name, statistics.median(timings), plan))
+    return results
+
+
+def print_results(title, results):
+    print(f'\n== {title}')
+    for name, ms, plan in results:
+        print(f'{name:28s} {ms:10.2f} ms')
+        for line in plan:
+            print(f'    {line}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', help='scratch database (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='bench-indexes-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    sys.path.insert(0, PROJECT_DIR)
+    from app import create_app, init_db
+    from models import db, migrate_schema, Order, TShirt
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        with db.engine.begin() as conn:
+            for index in list(Order.__table__.indexes) + list(TShirt.__table__.indexes):
+                index.drop(conn, checkfirst=True)
+
+        tshirt_ids = [row[0] for row in db.session.query(TShirt.id)]
+        start = time.perf_counter()
+        load_orders(db, args.orders, tshirt_ids)
+        print(f'Loaded {args.orders} orders in {time.perf_counter() - start:.1f}s')
+
+        day = datetime.utcnow() - timedelta(days=30)
+        params = {
+            'tshirt_id': tshirt_ids[0],
+            'day_start': day,
+            'day_end': day + timedelta(days=1),
+            'design_name': 'Game Night'
+        }
+        print_results('without secondary indexes', run_queries(db, params, args.repeat))
+
+        start = time.perf_counter()
+        migrate_schema()
+        print(f'\nmigrate_schema() built the indexes in {time.perf_counter() - start:.1f}s')
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.begin() as conn:
+                conn.execute(db.text('ANALYZE'))
+        print_results('with indexes', run_queries(db, params, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Checkout latency while a large restock runs, in one transaction or as a job.
+
+Fills a scratch SQLite database with --skus t-shirts and starts the API under
+gunicorn (gevent workers, as in the Procfile). While --clients keep-alive
+clients place orders, the whole catalog is restocked (target policy) twice:
+first the way /api/update-stock used to, with apply_restock() in a single
+transaction (run in a separate process), then through POST /api/update-stock,
+which queues a background job that commits every JOB_CHUNK_SIZE SKUs.
+Reports how long each restock took and the order latencies seen meanwhile,
+next to 5 seconds of orders with no restock running.
+Run from the project directory:
+
+    python bench/bench_jobs.py --skus 200000 --chunk-size 1000 --pause-ms 10
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from common import (PROJECT_DIR, app_context, call, connect, order_body, percentile, restock,
+                    scratch_database_url, serve)
+
+SINGLE_TRANSACTION = '''
+import time
+from app import create_app
+from models import db
+from restock import apply_restock
+with create_app().app_context():
+    start = time.perf_counter()
+    apply_restock('target', {'target': 10 ** 6})
+    db.session.commit()
+    print(time.perf_counter() - start)
+'''
+
+
+def load(database_url, skus, batch_size=50000):
+    with app_context(database_url):
+        from models import db, TShirt
+
+        db.session.execute(db.delete(TShirt))
+        rows = [{'design_name': f'Design {i // 24}', 'size': ('S', 'M', 'L', 'XL')[i % 4],
+                 'color': ('Black', 'White', 'Navy', 'Red', 'Olive', 'Sand')[i // 4 % 6],
+                 'quantity': 5, 'price': 720.0} for i in range(skus)]
+        for first in range(0, skus, batch_size):
+            db.session.execute(db.insert(TShirt), rows[first:first + batch_size])
+        db.session.commit()
+        return [row[0] for row in db.session.query(TShirt.id)]
+
+
+def during(port, tshirt_ids, clients, restock):
+    """Run restock() while clients place orders; return its duration and their latencies.
+
+    restock() may return its own duration, leaving out its start-up time.
+    """
+    stop = threading.Event()
+    latencies, errors = [], []
+
+    def client(seed):
+        rng = random.Random(seed)
+        conn = connect(port, timeout=120)
+        while not stop.is_set():
+            start = time.perf_counter()
+            status = call(conn, 'POST', '/api/orders', order_body(seed, rng.choice(tshirt_ids)))[0]
+            if status < 500:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors.append(status)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(1)
+    # Only orders placed while the restock runs are kept
+    del latencies[:]
+    start = time.perf_counter()
+    elapsed = restock() or time.perf_counter() - start
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return elapsed, sorted(latencies), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--skus', type=int, default=200000)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--chunk-size', type=int, default=1000, help='JOB_CHUNK_SIZE')
+    parser.add_argument('--pause-ms', type=float, default=10, help='JOB_CHUNK_PAUSE_MS')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--port', type=int, default=5094)
+    args = parser.parse_args()
+
+    database_url = scratch_database_url('bench-jobs-')
+    tshirt_ids = load(database_url, args.skus)
+    env = dict(os.environ, DATABASE_URL=database_url, JOB_CHUNK_SIZE=str(args.chunk_size),
+               JOB_CHUNK_PAUSE_MS=str(args.pause_ms))
+
+    def single_transaction():
+        return float(subprocess.run([sys.executable, '-c', SINGLE_TRANSACTION], cwd=PROJECT_DIR, env=env,
+                                    check=True, capture_output=True, text=True).stdout)
+
+    def background_job():
+        conn = connect(args.port, timeout=120)
+        restock(conn, 2 * 10 ** 6, interval=0.05)
+        conn.close()
+
+    print(f'{args.skus} SKUs, {args.clients} order clients, {args.workers} gevent workers, '
+          f'chunks of {args.chunk_size} {args.pause_ms:g} ms apart')
+    print(f'{"restock":20s} {"seconds":>8s} {"orders":>7s} {"p50 ms":>8s} {"p99 ms":>8s} {"max ms":>8s} {"errors":>6s}')
+    with serve(args.port, env, workers=args.workers):
+        for label, run in (('none', lambda: time.sleep(5)), ('single transaction', single_transaction),
+                           ('background job', background_job)):
+            elapsed, latencies, errors = during(args.port, tshirt_ids, args.clients, run)
+            print(f'{label:20s} {elapsed:8.2f} {len(latencies):7d} {statistics.median(latencies or [0]):8.2f} '
+                  f'{percentile(latencies, 0.99):8.2f} {max(latencies or [0]):8.2f} {len(errors):6d}')
+
+
+if __name__ == '__main__':
+    main()
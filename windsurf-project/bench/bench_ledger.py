@@ -0,0 +1,122 @@
+"""Point-in-time stock from the ledger, with and without snapshots.
+
+Fills a scratch database with a long stock_movements history, then times
+stock_at() for random moments by replaying the whole ledger (no snapshots)
+and again after taking a snapshot per simulated day, as the scheduled
+snapshot-stock command would. Run from the project directory:
+
+    python bench/bench_ledger.py --movements 2000000 --days 365
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_movements(db, count, days, tshirt_ids, start, batch_size=100000):
+    from models import StockMovement
+    rng = random.Random(42)
+    step = days * 86400 / count
+    for first in range(0, count, batch_size):
+        rows = [{
+            'tshirt_id': rng.choice(tshirt_ids),
+            'delta': rng.choice((-1, -1, -2, -1, 3)),
+            'reason': 'order',
+            'created_at': start + timedelta(seconds=i * step)
+        } for i in range(first, min(first + batch_size, count))]
+        db.session.execute(db.insert(StockMovement), rows)
+        db.session.commit()
+
+
+def snapshot_daily(db, days, start):
+    """Take one snapshot per simulated day, as if the job had run every night.
+
+    Uses the same fold as take_snapshot(), bounded by each day's last
+    movement. Returns the median time of one fold.
+    """
+    from ledger import _levels_query
+    from models import StockMovement, StockSnapshot
+    previous = 0
+    timings = []
+    for day in range(1, days + 1):
+        began = time.perf_counter()
+        # Ids follow created_at here, so the day's last movement is the watermark
+        last = db.session.execute(
+            db.select(StockMovement.id, StockMovement.created_at)
+            .where(StockMovement.created_at < start + timedelta(days=day))
+            .order_by(StockMovement.created_at.desc()).limit(1)
+        ).first()
+        if last is None or last.id == previous:
+            continue
+        watermark, taken_at = last
+        levels = _levels_query(previous, StockMovement.id <= watermark)
+        db.session.execute(db.insert(StockSnapshot).from_select(
+            ['movement_id', 'tshirt_id', 'quantity', 'taken_at'],
+            db.select(db.literal(watermark), levels.c.tshirt_id, levels.c.quantity,
+                      db.literal(taken_at, db.DateTime))))
+        db.session.commit()
+        previous = watermark
+        timings.append(time.perf_counter() - began)
+    return statistics.median(timings)
+
+
+def time_queries(db, moments):
+    from ledger import stock_at
+    timings = []
+    for at in moments:
+        start = time.perf_counter()
+        stock_at(at)
+        timings.append((time.perf_counter() - start) * 1000)
+        db.session.rollback()
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movements', type=int, default=2000000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--database-url', help='scratch database (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='bench-ledger-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    sys.path.insert(0, PROJECT_DIR)
+    from app import create_app, init_db
+    from models import db, TShirt, StockMovement, StockSnapshot
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        # Start from an empty ledger so ids follow the synthetic timeline
+        db.session.execute(db.delete(StockSnapshot))
+        db.session.execute(db.delete(StockMovement))
+        db.session.commit()
+        tshirt_ids = [row[0] for row in db.session.query(TShirt.id)]
+        start = datetime.utcnow() - timedelta(days=args.days)
+        t0 = time.perf_counter()
+        load_movements(db, args.movements, args.days, tshirt_ids, start)
+        print(f'Loaded {args.movements} movements over {args.days} days in {time.perf_counter() - t0:.1f}s')
+
+        rng = random.Random(7)
+        moments = [start + timedelta(seconds=rng.randrange(args.days * 86400)) for _ in range(args.queries)]
+        median, worst = time_queries(db, moments)
+        print(f'{"full replay":24s} median {median:9.2f} ms  max {worst:9.2f} ms')
+
+        fold = snapshot_daily(db, args.days, start)
+        median, worst = time_queries(db, moments)
+        print(f'{"daily snapshots":24s} median {median:9.2f} ms  max {worst:9.2f} ms')
+        print(f'{"one daily snapshot":24s} median {fold * 1000:9.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Latency the frontend.py API proxy adds under concurrent load.
+
+Starts the API and the frontend proxy under gunicorn against a scratch
+SQLite database, then fires the same GET requests at the API directly and
+through the proxy from parallel keep-alive clients and compares latency
+percentiles. Run from the project directory:
+
+    python bench/bench_proxy.py --requests 5000 --concurrency 32
+"""
+import argparse
+import http.client
+import os
+import statistics
+import threading
+import time
+
+from common import connect, init_db, percentile, scratch_database_url, serve
+
+
+def run_load(port, path, total, concurrency):
+    """Issue total GETs from concurrency keep-alive clients; return latencies"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_client = total // concurrency
+
+    def client():
+        conn = connect(port, timeout=30)
+        local = []
+        for _ in range(per_client):
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    errors.append(resp.status)
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(str(e))
+                conn.close()
+                conn = connect(port, timeout=30)
+                continue
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(label, latencies, errors, elapsed):
+    print(f'{label:8s} {len(latencies) / elapsed:9.1f} req/s  p50 {statistics.median(latencies or [0]) * 1000:7.2f} ms'
+          f'  p99 {percentile(latencies, 0.99) * 1000:7.2f} ms  errors {len(errors)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--path', default='/api/tshirts')
+    parser.add_argument('--api-port', type=int, default=5098)
+    parser.add_argument('--proxy-port', type=int, default=8098)
+    args = parser.parse_args()
+
+    env = dict(os.environ, DATABASE_URL=scratch_database_url('bench-proxy-'),
+               API_BACKEND_URL=f'http://127.0.0.1:{args.api_port}')
+    init_db(env)
+    with serve(args.api_port, env), \
+            serve(args.proxy_port, env, workers=1, worker_class='gthread', app='frontend:app',
+                  extra_args=('--threads', str(args.concurrency))):
+        # Warm both paths so connection setup is not measured
+        run_load(args.api_port, args.path, args.concurrency, args.concurrency)
+        run_load(args.proxy_port, args.path, args.concurrency, args.concurrency)
+
+        print(f'{args.requests} x GET {args.path}, concurrency {args.concurrency}')
+        summarize('direct', *run_load(args.api_port, args.path, args.requests, args.concurrency))
+        summarize('proxied', *run_load(args.proxy_port, args.path, args.requests, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
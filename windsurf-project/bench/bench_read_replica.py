@@ -0,0 +1,125 @@
+"""Order writes under heavy read traffic, with and without read routing.
+
+For each mode, starts the API under gunicorn (gevent workers, as in the
+Procfile) against the same prefilled database, then runs --readers clients
+looping over order listings, customer pages, reports and search next to
+--writers clients posting orders, and reports the throughput and latency of
+each side. The replica mode sets READ_REPLICA_URL; by default it is the
+primary's own SQLite file, read through the separate query_only pool. Run
+from the project directory:
+
+    python bench/bench_read_replica.py --readers 32 --writers 4 --seconds 15
+    python bench/bench_read_replica.py --database-url postgresql://... --replica-url postgresql://...
+"""
+import argparse
+import http.client
+import os
+import random
+import statistics
+import threading
+import time
+
+from common import app_context, call, connect, insert_orders, order_body, percentile, scratch_database_url, serve
+
+READ_PATHS = ('/api/orders?limit=200', '/api/customers?sort=spent&limit=100', '/api/reports/customers',
+              '/api/reports/top-sellers', '/api/search?q=co', '/api/orders?limit=50&status=pending')
+
+
+def prefill(database_url, orders, customers):
+    """Seed the catalog and insert orders from customers, before any server starts"""
+    rng = random.Random(42)
+    with app_context(database_url):
+        from customers import backfill_customers
+        from models import db, TShirt
+
+        db.session.execute(db.update(TShirt).values(quantity=10 ** 8))
+        tshirt_ids = [row[0] for row in db.session.query(TShirt.id)]
+
+        def order(i):
+            customer = rng.randrange(customers)
+            return {'customer_name': f'Customer {customer}', 'customer_phone': f'98{customer:08d}',
+                    'tshirt_id': rng.choice(tshirt_ids), 'quantity': rng.randint(1, 3),
+                    'status': rng.choice(('fulfilled', 'pending'))}
+
+        insert_orders(orders, order)
+        backfill_customers()
+        db.session.commit()
+    return tshirt_ids
+
+
+def run_clients(port, tshirt_ids, readers, writers, seconds):
+    """Run reader and writer threads for seconds; return latencies and errors per side"""
+    results = {'read': ([], [0]), 'write': ([], [0])}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(side, seed):
+        rng = random.Random(seed)
+        conn = connect(port, timeout=120)
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                if side == 'read':
+                    status = call(conn, 'GET', rng.choice(READ_PATHS))[0]
+                else:
+                    status = call(conn, 'POST', '/api/orders', order_body(seed, rng.choice(tshirt_ids)))[0]
+            except (OSError, http.client.HTTPException):
+                status = 599
+                conn.close()
+                conn = connect(port, timeout=120)
+            if status == 200:
+                local.append(time.perf_counter() - start)
+            else:
+                failed += 1
+        conn.close()
+        with lock:
+            results[side][0].extend(local)
+            results[side][1][0] += failed
+
+    threads = [threading.Thread(target=client, args=('read', seed)) for seed in range(readers)]
+    threads += [threading.Thread(target=client, args=('write', 1000 + seed)) for seed in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {side: (latencies, errors[0]) for side, (latencies, errors) in results.items()}
+
+
+def run_mode(replica_url, tshirt_ids, args):
+    env = dict(os.environ, DATABASE_URL=args.database_url)
+    env.pop('READ_REPLICA_URL', None)
+    if replica_url:
+        env['READ_REPLICA_URL'] = replica_url
+    with serve(args.port, env, workers=args.workers):
+        return run_clients(args.port, tshirt_ids, args.readers, args.writers, args.seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=32)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=15.0)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--orders', type=int, default=200000, help='orders prefilled')
+    parser.add_argument('--customers', type=int, default=20000)
+    parser.add_argument('--port', type=int, default=5095)
+    parser.add_argument('--database-url', help='empty scratch database (default: temporary SQLite file)')
+    parser.add_argument('--replica-url', help='replica of --database-url (default: the same URL)')
+    args = parser.parse_args()
+    if not args.database_url:
+        args.database_url = scratch_database_url('bench-replica-')
+
+    tshirt_ids = prefill(args.database_url, args.orders, args.customers)
+    print(f'{args.workers} gevent workers, {args.readers} readers, {args.writers} writers, '
+          f'{args.seconds:g}s per run, {args.orders} orders prefilled')
+    print(f'{"mode":8s} {"side":5s} {"req/s":>8s} {"p50 ms":>8s} {"p99 ms":>8s} {"errors":>6s}')
+    for label, replica_url in (('primary', None), ('replica', args.replica_url or args.database_url)):
+        for side, (latencies, errors) in run_mode(replica_url, tshirt_ids, args).items():
+            print(f'{label:8s} {side:5s} {len(latencies) / args.seconds:8.1f} '
+                  f'{statistics.median(latencies or [0]) * 1000:8.2f} '
+                  f'{percentile(latencies, 0.99) * 1000:8.2f} {errors:6d}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Timings of the restock policies at catalog scale.
+
+Loads a scratch database with synthetic SKUs and a sales_daily rollup of the
+size a long order history produces, then times a dry run and an applied
+restock for every policy. The old per-row ORM loop is timed too, for
+comparison. Run from the project directory:
+
+    python bench/bench_restock.py --skus 100000 --days 90 --sales-rows 2000000
+
+The velocity policy reads sales_daily rather than orders, so its cost depends
+on the rollup size (at most days x SKUs rows), not on the number of orders.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_data(db, skus, days, sales_rows, batch_size=100000):
+    from models import SalesDaily, TShirt
+    rng = random.Random(42)
+    db.session.execute(db.delete(TShirt))
+    for start in range(0, skus, batch_size):
+        db.session.execute(db.insert(TShirt), [{
+            'design_name': f'Design {i // 30}',
+            'size': ('XS', 'S', 'M', 'L', 'XL', '2XL')[i % 6],
+            'color': f'Color {i % 30 // 6}',
+            'quantity': rng.randrange(0, 20),
+            'price': 25.0
+        } for i in range(start, min(skus, start + batch_size))])
+    ids = [row[0] for row in db.session.query(TShirt.id)]
+
+    today = date.today()
+    pairs = set()
+    while len(pairs) < min(sales_rows, days * skus):
+        pairs.add((rng.randrange(days), rng.choice(ids)))
+    pairs = list(pairs)
+    for start in range(0, len(pairs), batch_size):
+        db.session.execute(db.insert(SalesDaily), [{
+            'day': today - timedelta(days=day),
+            'tshirt_id': tshirt_id,
+            'order_count': 1,
+            'units': rng.randint(1, 3),
+            'revenue': 25.0
+        } for day, tshirt_id in pairs[start:start + batch_size]])
+    db.session.commit()
+    return len(pairs)
+
+
+def legacy_restock(db):
+    from models import TShirt
+    for tshirt in TShirt.query.all():
+        if tshirt.quantity < 5:
+            tshirt.quantity += random.randint(1, 3)
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f'{label:34s} {(time.perf_counter() - start) * 1000:10.1f} ms')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--skus', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--sales-rows', type=int, default=2000000,
+                        help='sales_daily rows (distinct day/SKU pairs with sales)')
+    parser.add_argument('--database-url', help='scratch database (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='bench-restock-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    sys.path.insert(0, PROJECT_DIR)
+    from app import create_app, init_db
+    from models import db
+    from restock import POLICIES, apply_restock, plan_restock
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        start = time.perf_counter()
+        rows = load_data(db, args.skus, args.days, args.sales_rows)
+        print(f'Loaded {args.skus} SKUs and {rows} sales_daily rows in {time.perf_counter() - start:.1f}s\n')
+
+        for policy in POLICIES:
+            plan = timed(f'{policy} dry run', lambda: plan_restock(policy))
+            restocked = timed(f'{policy} apply', lambda: apply_restock(policy))
+            db.session.rollback()
+            print(f'    {len(plan)} SKUs planned, {restocked} restocked')
+        timed('legacy ORM loop (threshold)', lambda: (legacy_restock(db), db.session.flush()))
+        db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
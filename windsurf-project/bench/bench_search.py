@@ -0,0 +1,114 @@
+"""Type-ahead latency of GET /api/search on a large catalog and customer base.
+
+Fills a scratch database with --skus t-shirts and --customers customers (the
+search indexes fill through their triggers as rows go in), then times
+/api/search for every keystroke of a set of queries. For comparison, the
+same lookups are timed as substring LIKE scans, the server-side equivalent
+of filtering downloaded lists in the browser. Run from the project
+directory:
+
+    python bench/bench_search.py --skus 100000 --customers 500000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ra', 'tu', 'ven', 'sho', 'dar', 'pel', 'quin', 'zor', 'bel', 'nu', 'fi')
+SIZES = ('XS', 'S', 'M', 'L', 'XL', '2XL')
+COLORS = ('Black', 'White', 'Navy', 'Maroon', 'Olive', 'Grey', 'Red', 'Sand')
+
+
+def word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def load(db, skus, customers, batch_size=50000):
+    from models import Customer, TShirt
+    rng = random.Random(42)
+    db.session.execute(db.delete(TShirt))
+    rows, seen = [], set()
+    while len(seen) < skus:
+        design = f'{word(rng)} {word(rng)}'
+        for size in SIZES:
+            for color in rng.sample(COLORS, 3):
+                if len(seen) < skus and (design, size, color) not in seen:
+                    seen.add((design, size, color))
+                    rows.append({'design_name': design, 'size': size, 'color': color,
+                                 'quantity': rng.randint(0, 50), 'price': 720.0})
+    for first in range(0, len(rows), batch_size):
+        db.session.execute(db.insert(TShirt), rows[first:first + batch_size])
+    first_names = [word(rng) for _ in range(800)]
+    last_names = [word(rng) for _ in range(800)]
+    phones = rng.sample(range(6 * 10 ** 9, 10 ** 10), customers)
+    for first in range(0, customers, batch_size):
+        db.session.execute(db.insert(Customer), [{
+            'name': f'{rng.choice(first_names)} {rng.choice(last_names)}',
+            'phone': str(phones[i]),
+            'order_count': 1, 'units': 1, 'total_spent': rng.randint(1, 100) * 720.0
+        } for i in range(first, min(first + batch_size, customers))])
+    db.session.commit()
+
+
+def keystrokes(text):
+    """The queries a type-ahead box sends while text is typed"""
+    return [text[:i] for i in range(2, len(text) + 1) if not text[:i].endswith(' ')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--skus', type=int, default=100000)
+    parser.add_argument('--customers', type=int, default=500000)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(prefix="bench-search-"), "bench.db")}'
+    sys.path.insert(0, PROJECT_DIR)
+    from app import create_app, init_db
+    from models import db, Customer, TShirt
+
+    app = create_app()
+    client = app.test_client()
+    with app.app_context():
+        init_db()
+        start = time.perf_counter()
+        load(db, args.skus, args.customers)
+        print(f'loaded {args.skus} SKUs and {args.customers} customers, indexed by triggers, '
+              f'in {time.perf_counter() - start:.1f}s')
+        design, size, color = db.session.query(TShirt.design_name, TShirt.size, TShirt.color) \
+            .order_by(TShirt.id).offset(args.skus // 2).first()
+        name, phone = db.session.query(Customer.name, Customer.phone) \
+            .order_by(Customer.id).offset(args.customers // 2).first()
+
+    queries = keystrokes(f'{design} {color.lower()}') + keystrokes(name) + keystrokes(phone[:7])
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        response = client.get('/api/search', query_string={'q': q})
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.data
+    samples.sort()
+    print(f'{"/api/search":22s} {len(samples):4d} queries  median {statistics.median(samples):7.2f} ms  '
+          f'p95 {samples[int(len(samples) * 0.95)]:7.2f} ms  max {samples[-1]:7.2f} ms')
+
+    scans = []
+    with app.app_context():
+        for q in queries:
+            pattern = f'%{q}%'
+            start = time.perf_counter()
+            db.session.query(TShirt.id).filter(db.or_(
+                TShirt.design_name.ilike(pattern), TShirt.color.ilike(pattern), TShirt.size.ilike(pattern))).all()
+            db.session.query(Customer.id).filter(db.or_(
+                Customer.name.ilike(pattern), Customer.phone.like(pattern))).all()
+            scans.append((time.perf_counter() - start) * 1000)
+    scans.sort()
+    print(f'{"LIKE scan":22s} {len(scans):4d} queries  median {statistics.median(scans):7.2f} ms  '
+          f'p95 {scans[int(len(scans) * 0.95)]:7.2f} ms  max {scans[-1]:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
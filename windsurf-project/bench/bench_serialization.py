@@ -0,0 +1,90 @@
+"""Serialization time and bytes on the wire for large order lists.
+
+Builds order rows shaped like the /api/orders query result and times
+encoding them the old way (Flask's default provider: stdlib json with
+sorted keys), through serialization.dumps() with each backend, and as
+?shape=columns rows, then reports compressed sizes and times for gzip and
+brotli of the last body. No database is
+needed. Run from the project directory:
+
+    python bench/bench_serialization.py --orders 10000 1000000
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DESIGNS = ('Winging It', 'Game Night', 'Board Game components', 'Dice Goblin')
+SIZES = ('S', 'M', 'L', 'XL', '2XL')
+COLORS = ('Black', 'White', 'Navy')
+
+
+def make_rows(count):
+    start = datetime(2024, 1, 1)
+    return [(i, None, 1 + i % 5000, f'Customer {i % 5000}', f'98{i % 100000000:08d}', 1 + i % 3,
+             ('pending', 'fulfilled', 'cancelled')[i % 3], start + timedelta(seconds=37 * i),
+             1 + i % 42, DESIGNS[i % 4], SIZES[i % 5], COLORS[i % 3], 720.0)
+            for i in range(count)]
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, nargs='+', default=[10000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ['JSON_BACKEND'] = 'json'
+    import serialization as stdlib_serialization
+    sys.modules.pop('serialization')
+    os.environ['JSON_BACKEND'] = 'orjson'
+    import serialization
+    from app import ORDER_ROW_FIELDS, _order_row_to_dict
+
+    def legacy(rows):
+        # What jsonify did before: isoformat per row, sorted keys, stdlib encoder
+        dicts = [dict(_order_row_to_dict(row), order_date=row[7].isoformat()) for row in rows]
+        return json.dumps(dicts, sort_keys=True, separators=(',', ':')).encode()
+
+    encoders = [('legacy jsonify', legacy),
+                ('stdlib dumps', lambda rows: stdlib_serialization.dumps([_order_row_to_dict(r) for r in rows]))]
+    if serialization.BACKEND == 'orjson':
+        encoders.append(('orjson dumps', lambda rows: serialization.dumps([_order_row_to_dict(r) for r in rows])))
+        encoders.append(('orjson columns',
+                         lambda rows: serialization.dumps(serialization.columns(ORDER_ROW_FIELDS, rows))))
+    else:
+        print('orjson is not installed; only the stdlib backend is measured')
+
+    for count in args.orders:
+        rows = make_rows(count)
+        repeat = args.repeat if count <= 100000 else 1
+        print(f'\n== {count} orders')
+        body = None
+        for name, encode in encoders:
+            body, seconds = timed(lambda: encode(rows), repeat)
+            print(f'{name:16s} {seconds * 1000:10.1f} ms  {len(body):>12,d} bytes')
+
+        compressed, seconds = timed(lambda: gzip.compress(body, compresslevel=6, mtime=0), repeat)
+        print(f'{"gzip -6":16s} {seconds * 1000:10.1f} ms  {len(compressed):>12,d} bytes')
+        if serialization.brotli is not None:
+            compressed, seconds = timed(lambda: serialization.brotli.compress(body, quality=4), repeat)
+            print(f'{"brotli q4":16s} {seconds * 1000:10.1f} ms  {len(compressed):>12,d} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Mixed read/write throughput of the API under each SQLite profile.
+
+For every profile, creates a fresh SQLite database, then runs several worker
+processes against it for a fixed time, each with its own app instance like a
+gunicorn worker. Every worker mixes catalog, order-page and summary reads
+with fulfilled orders, and the script reports throughput, latency and how
+many requests failed (typically "database is locked"). Run from the project
+directory:
+
+    python bench/bench_sqlite_profile.py --processes 4 --seconds 10 --write-ratio 0.2
+"""
+import argparse
+import multiprocessing
+import random
+import statistics
+import time
+
+from common import make_app as make_project_app, order_body, percentile, scratch_database_url
+
+READS = ('/api/tshirts', '/api/orders?limit=50', '/api/reports/summary')
+
+
+def make_app(db_url, profile):
+    return make_project_app(db_url, {'SQLITE_PROFILE': profile})
+
+
+def prepare(db_url, profile):
+    app = make_app(db_url, profile)
+    from app import init_db
+    from models import db, TShirt
+    with app.app_context():
+        init_db()
+        db.session.execute(db.update(TShirt).values(quantity=10 ** 9))
+        db.session.commit()
+        tshirt_ids = [row[0] for row in db.session.query(TShirt.id)]
+        db.engine.dispose()
+    return tshirt_ids
+
+
+def worker(db_url, profile, tshirt_ids, seconds, write_ratio, seed, results):
+    app = make_app(db_url, profile)
+    client = app.test_client()
+    rng = random.Random(seed)
+    timings = {'read': [], 'write': []}
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if rng.random() < write_ratio:
+            kind = 'write'
+            response = client.post('/api/orders', json=order_body(seed, rng.choice(tshirt_ids)))
+        else:
+            kind = 'read'
+            response = client.get(rng.choice(READS))
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 500:
+            errors += 1
+        else:
+            timings[kind].append(elapsed)
+    results.put((timings, errors))
+
+
+def run_profile(profile, args):
+    db_url = scratch_database_url('bench-sqlite-')
+    tshirt_ids = prepare(db_url, profile)
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(db_url, profile, tshirt_ids, args.seconds,
+                                              args.write_ratio, seed, results))
+             for seed in range(args.processes)]
+    for proc in procs:
+        proc.start()
+    collected = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    reads = [t for timings, _ in collected for t in timings['read']]
+    writes = [t for timings, _ in collected for t in timings['write']]
+    errors = sum(e for _, e in collected)
+    return reads, writes, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4, help='worker processes')
+    parser.add_argument('--seconds', type=float, default=10.0, help='duration per profile')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='share of requests that are orders')
+    parser.add_argument('--profiles', default='default,production', help='comma-separated profile names')
+    args = parser.parse_args()
+
+    print(f'processes={args.processes} seconds={args.seconds} write_ratio={args.write_ratio}')
+    print(f'{"profile":12s} {"reads/s":>9s} {"writes/s":>9s} {"errors":>7s} '
+          f'{"read p50":>9s} {"read p99":>9s} {"write p50":>10s} {"write p99":>10s}')
+    for profile in args.profiles.split(','):
+        reads, writes, errors = run_profile(profile, args)
+        print(f'{profile:12s} {len(reads) / args.seconds:9.1f} {len(writes) / args.seconds:9.1f} {errors:7d} '
+              f'{statistics.median(reads or [0]) * 1000:7.1f}ms {percentile(reads, 0.99) * 1000:7.1f}ms '
+              f'{statistics.median(writes or [0]) * 1000:8.1f}ms {percentile(writes, 0.99) * 1000:8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
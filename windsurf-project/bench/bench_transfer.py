@@ -0,0 +1,105 @@
+"""Bulk import throughput and export memory for the streaming endpoints.
+
+Writes a CSV of synthetic orders to a temporary file, posts it to
+/api/import/orders as a streamed body and reports rows per second. The
+orders table is then grown to --export-orders rows and exported as CSV and
+NDJSON, reading the response chunk by chunk while sampling the process RSS.
+Run from the project directory:
+
+    python bench/bench_transfer.py --import-rows 1000000 --export-orders 10000000
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def write_orders_csv(path, count, tshirt_ids):
+    rng = random.Random(42)
+    start = datetime.utcnow() - timedelta(days=365)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('customer_name', 'customer_phone', 'tshirt_id', 'quantity', 'status', 'order_date'))
+        for i in range(count):
+            writer.writerow((f'Customer {rng.randrange(50000)}', f'{rng.randrange(10 ** 9, 10 ** 10)}',
+                             rng.choice(tshirt_ids), rng.randint(1, 3),
+                             rng.choice(('pending', 'fulfilled', 'cancelled')),
+                             (start + timedelta(seconds=i * 31536000 // count)).isoformat()))
+
+
+def grow_orders(db, target):
+    """Duplicate existing orders set-based until the table holds target rows"""
+    from models import Order
+    columns = ['customer_name', 'customer_phone', 'tshirt_id', 'quantity', 'status', 'order_date']
+    while True:
+        count = db.session.query(db.func.count(Order.id)).scalar()
+        if count >= target:
+            return count
+        db.session.execute(db.insert(Order).from_select(
+            columns, db.select(*[getattr(Order, c) for c in columns]).limit(target - count)))
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--import-rows', type=int, default=1000000)
+    parser.add_argument('--export-orders', type=int, default=10000000)
+    parser.add_argument('--database-url', help='scratch database (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-transfer-')
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite:///{os.path.join(workdir, "bench.db")}'
+    sys.path.insert(0, PROJECT_DIR)
+    from app import create_app, init_db
+    from models import db, TShirt
+
+    app = create_app()
+    client = app.test_client()
+    with app.app_context():
+        init_db()
+        tshirt_ids = [row[0] for row in db.session.query(TShirt.id)]
+
+    path = os.path.join(workdir, 'orders.csv')
+    write_orders_csv(path, args.import_rows, tshirt_ids)
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        start = time.perf_counter()
+        response = client.post('/api/import/orders', input_stream=f, content_type='text/csv',
+                               headers={'Content-Length': str(size)})
+        elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.data
+    print(f'import  {args.import_rows} rows ({size / 1e6:.0f} MB CSV) in {elapsed:.1f}s: '
+          f'{args.import_rows / elapsed:,.0f} rows/s')
+
+    with app.app_context():
+        total = grow_orders(db, args.export_orders)
+    for fmt in ('csv', 'ndjson'):
+        baseline = peak = rss_mb()
+        sent = 0
+        start = time.perf_counter()
+        response = client.get(f'/api/export/orders?format={fmt}', buffered=False)
+        for chunk in response.response:
+            sent += len(chunk)
+            peak = max(peak, rss_mb())
+        response.close()
+        elapsed = time.perf_counter() - start
+        print(f'export  {total} orders as {fmt:6s} {sent / 1e6:8.0f} MB in {elapsed:6.1f}s  '
+              f'{total / elapsed:,.0f} rows/s  RSS {baseline:.0f} -> peak {peak:.0f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Helpers shared by the bench scripts.
+
+Scripts import this as ``common`` (bench/ is on sys.path when one of them
+runs). It starts the API under gunicorn against a scratch database, calls
+it over keep-alive connections, waits for background jobs, loads orders
+into an app context and summarizes latencies.
+"""
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from contextlib import contextmanager
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def scratch_database_url(prefix):
+    """URL of a new SQLite file in a temporary directory"""
+    return f'sqlite:///{os.path.join(tempfile.mkdtemp(prefix=prefix), "bench.db")}'
+
+
+def init_db(env):
+    """Create and seed the database of env's DATABASE_URL with flask init-db"""
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+                   cwd=PROJECT_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def start_server(port, env, workers=2, worker_class='gevent', app='wsgi:app', extra_args=()):
+    """Start app under gunicorn on 127.0.0.1:port; returns the process"""
+    args = [sys.executable, '-m', 'gunicorn', '-k', worker_class, '-w', str(workers)]
+    if worker_class == 'gevent':
+        args += ['--worker-connections', '1000']
+    args += [*extra_args, '-b', f'127.0.0.1:{port}', app]
+    return subprocess.Popen(args, cwd=PROJECT_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@contextmanager
+def serve(port, env, **kwargs):
+    """Run start_server() for the block, once the server answers"""
+    server = start_server(port, env, **kwargs)
+    try:
+        wait_for_server(f'http://127.0.0.1:{port}')
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def wait_for_server(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'{base_url}/api/tshirts', timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{base_url} did not start in time')
+
+
+def connect(port, timeout=60):
+    return http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+
+
+def call(conn, method, path, body=None):
+    """Send one request; returns the status and the decoded JSON body (or None)"""
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    resp = conn.getresponse()
+    data = resp.read()
+    if resp.status in (200, 202) and resp.getheader('Content-Type', '').startswith('application/json'):
+        return resp.status, json.loads(data)
+    return resp.status, None
+
+
+def wait_for_job(conn, job, timeout=300, interval=0.1):
+    """Poll a background job until it has finished"""
+    deadline = time.time() + timeout
+    while job['status'] in ('queued', 'running'):
+        if time.time() > deadline:
+            raise RuntimeError(f'job {job["id"]} did not finish in time')
+        time.sleep(interval)
+        job = call(conn, 'GET', f'/api/jobs/{job["id"]}')[1]
+    if job['status'] != 'succeeded':
+        raise RuntimeError(f'job {job["id"]} failed: {job["error"]}')
+    return job
+
+
+def restock(conn, target, interval=0.1):
+    """Bring every SKU up to target units and wait for the background job"""
+    status, job = call(conn, 'POST', '/api/update-stock', {'policy': 'target', 'target': target})
+    if status != 202:
+        raise RuntimeError(f'update-stock answered {status}')
+    return wait_for_job(conn, job, interval=interval)
+
+
+def tshirt_ids(conn):
+    return [row['id'] for row in call(conn, 'GET', '/api/tshirts')[1]]
+
+
+def order_body(seed, tshirt_id, status='fulfilled', quantity=1):
+    """A single-line order from client seed"""
+    return {'customer_name': f'Bench {seed}', 'customer_phone': f'{seed:010d}',
+            'tshirt_id': tshirt_id, 'quantity': quantity, 'status': status}
+
+
+def make_app(database_url, config=None):
+    """create_app() for database_url, importing the project from PROJECT_DIR"""
+    os.environ['DATABASE_URL'] = database_url
+    if PROJECT_DIR not in sys.path:
+        sys.path.insert(0, PROJECT_DIR)
+    from app import create_app
+    return create_app(config)
+
+
+@contextmanager
+def app_context(database_url, config=None):
+    """An app context on database_url with the schema created and the catalog seeded"""
+    app = make_app(database_url, config)
+    from app import init_db
+    with app.app_context():
+        init_db()
+        yield app
+
+
+def insert_orders(count, make_row, batch_size=50000):
+    """Insert count orders, make_row(i) giving each one's columns, committing every batch"""
+    from models import db, Order
+    for first in range(0, count, batch_size):
+        db.session.execute(db.insert(Order), [make_row(i) for i in range(first, min(first + batch_size, count))])
+        db.session.commit()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
@@ -0,0 +1,102 @@
+"""Concurrency stress test for stock decrements.
+
+Starts the API under gunicorn with several workers against a scratch SQLite
+database, fires many parallel fulfilled orders at a single SKU and checks
+that stock never goes negative, that every accepted order is accounted
+for and that no order fails with a server or connection error. Run from
+the project directory:
+
+    python bench/stress_stock.py --workers 4 --orders 5000 --stock 1000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from common import init_db, serve
+
+
+def place_order(base_url, tshirt_id):
+    body = json.dumps({
+        'customer_name': 'Stress Test',
+        'customer_phone': '0000000000',
+        'tshirt_id': tshirt_id,
+        'quantity': 1,
+        'status': 'fulfilled'
+    }).encode()
+    req = urllib.request.Request(f'{base_url}/api/orders', data=body,
+                                 headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except urllib.error.URLError:
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--orders', type=int, default=2000, help='orders to fire')
+    parser.add_argument('--concurrency', type=int, default=64, help='parallel client threads')
+    parser.add_argument('--stock', type=int, default=500, help='starting stock of the SKU')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--max-errors', type=int, default=0,
+                        help='5xx and failed connections tolerated before the run fails')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='stress-stock-')
+    db_path = os.path.join(tmpdir, 'stress.db')
+    base_url = f'http://127.0.0.1:{args.port}'
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}')
+
+    init_db(env)
+    with serve(args.port, env, workers=args.workers, worker_class='sync'):
+        conn = sqlite3.connect(db_path)
+        tshirt_id = conn.execute('SELECT id FROM tshirts ORDER BY id LIMIT 1').fetchone()[0]
+        conn.execute('UPDATE tshirts SET quantity = ? WHERE id = ?', (args.stock, tshirt_id))
+        conn.commit()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            statuses = list(pool.map(lambda _: place_order(base_url, tshirt_id), range(args.orders)))
+        elapsed = time.perf_counter() - start
+
+        final_stock = conn.execute('SELECT quantity FROM tshirts WHERE id = ?', (tshirt_id,)).fetchone()[0]
+        stored = conn.execute('SELECT COUNT(*) FROM orders WHERE tshirt_id = ?', (tshirt_id,)).fetchone()[0]
+        conn.close()
+
+    accepted = statuses.count(200)
+    rejected = statuses.count(400)
+    errors = len(statuses) - accepted - rejected
+
+    print(f'workers={args.workers} concurrency={args.concurrency} orders={args.orders} stock={args.stock}')
+    print(f'accepted={accepted} out_of_stock={rejected} errors={errors}')
+    print(f'elapsed={elapsed:.2f}s throughput={args.orders / elapsed:.1f} req/s')
+    print(f'final_stock={final_stock} stored_orders={stored}')
+
+    failures = []
+    if final_stock < 0:
+        failures.append('stock went negative')
+    if args.stock - accepted != final_stock:
+        failures.append('accepted orders do not match the stock decrement')
+    if stored != accepted:
+        failures.append('stored orders do not match accepted orders')
+    if accepted > args.stock:
+        failures.append('more orders accepted than units in stock')
+    if errors > args.max_errors:
+        failures.append(f'{errors} orders failed with a server or connection error')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
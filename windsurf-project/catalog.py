@@ -0,0 +1,55 @@
+"""Catalog seed data and bulk loader.
+
+catalog.csv is the single definition of the starting t-shirt catalog, used
+when the app seeds an empty database, by /api/reset-inventory and by
+reset_db.py. Rows are written with one executemany INSERT rather than one
+ORM object per SKU.
+"""
+import csv
+import os
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.csv')
+
+SKU_COLUMNS = ('design_name', 'size', 'color')
+
+
+def read_catalog(path=CATALOG_PATH):
+    """Read catalog rows as dicts ready for insertion"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return [{
+            'design_name': row['design_name'],
+            'size': row['size'],
+            'color': row['color'],
+            'quantity': int(row['quantity']),
+            'price': float(row['price'])
+        } for row in csv.DictReader(f)]
+
+
+def load_catalog(session, table, rows=None, upsert=False):
+    """Write catalog rows into the t-shirts table in the session's transaction.
+
+    By default the table is emptied first. With upsert=True existing SKUs keep
+    their ids and get the catalog quantity and price, and new SKUs are added.
+    The caller commits. Returns the number of rows written.
+    """
+    if rows is None:
+        rows = read_catalog()
+    if not rows:
+        return 0
+
+    if not upsert:
+        session.execute(table.delete())
+        session.execute(table.insert(), rows)
+        return len(rows)
+
+    dialect = session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c[name] for name in SKU_COLUMNS],
+        set_={'quantity': stmt.excluded.quantity, 'price': stmt.excluded.price}
+    )
+    session.execute(stmt, rows)
+    return len(rows)
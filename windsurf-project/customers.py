@@ -0,0 +1,175 @@
+"""Customers and their lifetime order totals.
+
+Every order belongs to a customer, matched on the normalized phone number or,
+for orders without one, on the name. Order writes keep the customer's totals
+(orders, units, spend, first and last order) in step in the same
+transaction:
+
+    record_customer_order()   one upsert per new order or checkout; creates
+                              the customer on first sight and returns its id
+    remove_customer_order()   takes a deleted order back out of the totals
+
+link_customers() attaches orders that have no customer yet, a batch at a
+time and set-based, adding them to the totals as it goes. It backfills
+databases from before customers were tracked and links bulk-imported
+orders. Each batch links its orders and updates the totals in one
+transaction, so an interrupted backfill resumes without counting an order
+twice. Spend is quantity times the order's unit price (the t-shirt price
+for orders without one), as in the sales rollup.
+"""
+from datetime import datetime
+
+from archive import BATCH_SIZE, archive_table, orders_all
+from models import PHONE_SEPARATORS, db, dialect_insert, normalize_phone, Customer, Order, TShirt
+
+CUSTOMER_FIELDS = ('id', 'name', 'phone', 'order_count', 'units', 'total_spent',
+                   'first_order_at', 'last_order_at')
+
+
+def _customer_upsert(stmt, has_phone):
+    """stmt, an INSERT into customers, adding to the customer it collides with.
+
+    Customers with a phone collide on the phone and take the name of their
+    most recent order; those without collide on the name.
+    """
+    customers = Customer.__table__.c
+    new = stmt.excluded
+    if has_phone:
+        target = {'index_elements': [customers.phone]}
+    else:
+        target = {'index_elements': [customers.name], 'index_where': customers.phone.is_(None)}
+    return stmt.on_conflict_do_update(**target, set_={
+        'name': db.case(
+            (db.or_(customers.last_order_at.is_(None), new.last_order_at >= customers.last_order_at), new.name),
+            else_=customers.name),
+        'order_count': customers.order_count + new.order_count,
+        'units': customers.units + new.units,
+        'total_spent': customers.total_spent + new.total_spent,
+        'first_order_at': db.case(
+            (db.or_(customers.first_order_at.is_(None), new.first_order_at < customers.first_order_at),
+             new.first_order_at),
+            else_=customers.first_order_at),
+        'last_order_at': db.case(
+            (db.or_(customers.last_order_at.is_(None), new.last_order_at > customers.last_order_at),
+             new.last_order_at),
+            else_=customers.last_order_at),
+    })
+
+
+def record_customer_order(name, phone, order_count, units, spent, order_date):
+    """Add new orders to a customer's totals, creating the customer if needed.
+
+    Returns the customer id for the orders to reference. Runs in the
+    caller's transaction as a single upsert.
+    """
+    phone = normalize_phone(phone)
+    stmt = dialect_insert(Customer.__table__).values(
+        name=name, phone=phone, order_count=order_count, units=units, total_spent=spent,
+        first_order_at=order_date, last_order_at=order_date, created_at=datetime.utcnow())
+    return db.session.execute(
+        _customer_upsert(stmt, phone is not None).returning(Customer.id)
+    ).scalar_one()
+
+
+def remove_customer_order(customer_id, units, spent):
+    """Take a deleted order out of its customer's totals.
+
+    Call after the order is deleted (and flushed). The first and last order
+    dates are looked up again over live and archived orders, which is an
+    index range scan on (customer_id, order_date).
+    """
+    orders = orders_all.c
+    dates = db.select(db.func.min(orders.order_date), db.func.max(orders.order_date)) \
+        .where(orders.customer_id == customer_id)
+    first, last = db.session.execute(dates).one()
+    db.session.execute(
+        db.update(Customer)
+        .where(Customer.id == customer_id)
+        .values(order_count=Customer.order_count - 1,
+                units=Customer.units - units,
+                total_spent=Customer.total_spent - spent,
+                first_order_at=first,
+                last_order_at=last)
+    )
+
+
+def _phone_key(column):
+    """SQL version of normalize_phone(): separators stripped, NULL if empty"""
+    key = db.func.trim(column)
+    for ch in PHONE_SEPARATORS:
+        if ch != ' ':
+            key = db.func.replace(key, ch, '')
+    return db.func.nullif(db.func.replace(key, ' ', ''), '')
+
+
+def _link_batch(table, ids):
+    """Add the orders of table with the given ids to their customers and link them"""
+    orders = table.c
+    phone = _phone_key(orders.customer_phone)
+    now = datetime.utcnow()
+    for has_phone in (True, False):
+        # Customers without a phone are grouped by name
+        key = phone if has_phone else orders.customer_name
+        ranked = db.select(
+            phone.label('phone'), key.label('key'), orders.customer_name, orders.order_date, orders.quantity,
+            (orders.quantity * db.func.coalesce(orders.unit_price, TShirt.price, 0)).label('spent'),
+            # 1 for the customer's most recent order, whose name is kept
+            db.func.row_number().over(partition_by=key,
+                                      order_by=(orders.order_date.desc(), orders.id.desc())).label('recency')
+        ).select_from(table.outerjoin(TShirt, orders.tshirt_id == TShirt.id)) \
+            .where(orders.id.in_(ids), phone.isnot(None) if has_phone else phone.is_(None)).subquery()
+        totals = db.select(
+            db.func.max(db.case((ranked.c.recency == 1, ranked.c.customer_name))), ranked.c.phone,
+            db.func.count(), db.func.sum(ranked.c.quantity), db.func.sum(ranked.c.spent),
+            db.func.min(ranked.c.order_date), db.func.max(ranked.c.order_date),
+            db.literal(now, db.DateTime)
+        # The WHERE keeps SQLite from reading ON CONFLICT as a join constraint
+        ).where(db.true()).group_by(ranked.c.key, ranked.c.phone)
+        insert = dialect_insert(Customer.__table__).from_select(
+            ['name', 'phone', 'order_count', 'units', 'total_spent',
+             'first_order_at', 'last_order_at', 'created_at'], totals)
+        db.session.execute(_customer_upsert(insert, has_phone))
+
+    by_phone = db.select(Customer.id).where(Customer.phone == phone).scalar_subquery()
+    by_name = db.select(Customer.id).where(
+        Customer.phone.is_(None), Customer.name == orders.customer_name).scalar_subquery()
+    db.session.execute(
+        db.update(table)
+        .where(orders.id.in_(ids))
+        .values(customer_id=db.case((phone.is_(None), by_name), else_=by_phone))
+    )
+
+
+def link_customers(table=None, limit=None):
+    """Link up to limit orders without a customer; returns the number linked.
+
+    table is the orders table (default) or the archive. Runs in the
+    caller's transaction; pass no limit to link every unlinked order at once.
+    """
+    table = Order.__table__ if table is None else table
+    # In (customer_id, order_date) index order: each batch is read off the
+    # front of the index instead of sorting every unlinked order
+    unlinked = db.select(table.c.id).where(table.c.customer_id.is_(None)).order_by(table.c.order_date)
+    if limit is not None:
+        unlinked = unlinked.limit(limit)
+    ids = db.session.execute(unlinked).scalars().all()
+    if ids:
+        _link_batch(table, ids)
+    return len(ids)
+
+
+def backfill_customers(batch_size=BATCH_SIZE):
+    """Create customers for every unlinked live and archived order.
+
+    Commits after each batch of batch_size orders. Returns the number of
+    orders linked; 0, after two index lookups, once everything is linked.
+    """
+    linked = 0
+    for table in (Order.__table__, archive_table(db.engine.dialect.name)):
+        while True:
+            count = link_customers(table, batch_size)
+            db.session.commit()
+            if not count:
+                break
+            linked += count
+    return linked
@@ -2,6 +2,8 @@ import os
 from flask import Flask, request, jsonify, make_response
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from instrumentation import get_logger, init_metrics
+from db_pool import engine_options, init_pool_diagnostics
 from datetime import datetime
 
 app = Flask(__name__)
@@ -14,10 +16,19 @@ if database_url.startswith("postgres://"):
 
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool sizing, pre-ping and statement timeout come from the environment (see db_pool.py)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url)
 db = SQLAlchemy(app)
+logger = get_logger()
+init_metrics(app, db)
+init_pool_diagnostics(app, db)
 
 class TShirt(db.Model):
     __tablename__ = 'tshirts'
+    __table_args__ = (
+        # One row per SKU
+        db.Index('uq_tshirts_sku', 'design_name', 'size', 'color', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     design_name = db.Column(db.String(100), nullable=False)
     size = db.Column(db.String(5), nullable=False)
@@ -32,6 +43,11 @@ class TShirt(db.Model):
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_tshirt_id', 'tshirt_id'),
+        db.Index('ix_orders_order_date', 'order_date'),
+        db.Index('ix_orders_status_order_date', 'status', 'order_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     customer_name = db.Column(db.String(100), nullable=False)
     tshirt_id = db.Column(db.Integer, db.ForeignKey('tshirts.id'), nullable=False)
@@ -43,6 +59,15 @@ class Order(db.Model):
 with app.app_context():
     # Create all tables without dropping first
     db.create_all()
+
+    # create_all() skips tables that already exist, so add newer indexes in place
+    try:
+        with db.engine.begin() as conn:
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+    except Exception as e:
+        logger.error(f"Error creating indexes: {e}")
     
     # Clear existing data
     try:
@@ -51,7 +76,7 @@ with app.app_context():
         db.session.commit()
     except Exception as e:
         db.session.rollback()
-        print(f"Error clearing data: {e}")
+        logger.error(f"Error clearing data: {e}")
     
     # Add initial t-shirts if none exist
     if not TShirt.query.first():
@@ -123,9 +148,9 @@ with app.app_context():
 @app.route('/api/tshirts', methods=['GET'])
 def get_tshirts():
     try:
-        print("Fetching tshirts from database...")  # Debug log
+        logger.debug("Fetching tshirts from database...")
         tshirts = TShirt.query.all()
-        print(f"Found {len(tshirts)} tshirts")  # Debug log
+        logger.debug(f"Found {len(tshirts)} tshirts")
         
         # Convert tshirt objects to dictionaries
         tshirt_list = []
@@ -140,7 +165,7 @@ def get_tshirts():
             }
             tshirt_list.append(tshirt_data)
             
-        print("Returning tshirt data:", tshirt_list)  # Debug log
+        logger.debug("Returning tshirt data: %s", tshirt_list)
         
         # Create response with CORS headers
         response = jsonify(tshirt_list)
@@ -150,7 +175,7 @@ def get_tshirts():
         return response
         
     except Exception as e:
-        print(f"Error in get_tshirts: {str(e)}")
+        logger.error(f"Error in get_tshirts: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/orders', methods=['POST'])
@@ -285,7 +310,7 @@ def reset_inventory():
         return jsonify({'message': 'Inventory reset successfully'}), 200
     except Exception as e:
         db.session.rollback()
-        print(f"Error resetting inventory: {e}")
+        logger.error(f"Error resetting inventory: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/update-stock', methods=['POST'])
@@ -311,7 +336,7 @@ def update_stock():
         return jsonify({'message': 'Stock updated successfully'}), 200
     except Exception as e:
         db.session.rollback()
-        print(f"Error updating stock: {e}")
+        logger.error(f"Error updating stock: {e}")
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
@@ -0,0 +1,187 @@
+"""Database connection pool settings and diagnostics.
+
+engine_options() turns environment variables into SQLALCHEMY_ENGINE_OPTIONS
+for PostgreSQL. Each gunicorn worker has its own pool, so by default the pool
+is sized so that all workers together stay within DB_MAX_CONNECTIONS:
+
+    DB_POOL_MODE            'session' (default): a pool per worker connecting
+                            straight to Postgres. 'transaction': no pooling in
+                            the app (NullPool), for use behind a transaction-
+                            pooling proxy such as PgBouncer.
+    DB_MAX_CONNECTIONS      connections the app may hold in total (default 20)
+    WEB_CONCURRENCY         gunicorn worker count (default 1)
+    DB_POOL_SIZE            connections kept open per worker
+                            (default: min(5, DB_MAX_CONNECTIONS / workers))
+    DB_MAX_OVERFLOW         extra connections per worker under load
+                            (default: the rest of the worker's share)
+    DB_POOL_TIMEOUT         seconds to wait for a free connection (default 10)
+    DB_POOL_RECYCLE         seconds before a connection is replaced (default 1800)
+    DB_POOL_PRE_PING        test connections on checkout (default 1)
+    DB_STATEMENT_TIMEOUT_MS server-side per-statement timeout, 0 disables
+                            (default 30000)
+
+SQLite URLs used in development get no extra options.
+
+init_pool_diagnostics() counts pool events and serves the pool state of the
+answering worker at /api/diagnostics/pool.
+"""
+import os
+import threading
+import time
+
+from flask import jsonify
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+
+POOL_MODES = ('session', 'transaction')
+
+
+def _env_int(environ, name, default):
+    value = environ.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer, got {value!r}')
+
+
+def _env_bool(environ, name, default):
+    value = environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def pool_settings(environ=None):
+    """Resolve the pool configuration from the environment"""
+    environ = os.environ if environ is None else environ
+    mode = environ.get('DB_POOL_MODE', 'session').lower()
+    if mode not in POOL_MODES:
+        raise ValueError(f'DB_POOL_MODE must be one of {POOL_MODES}, got {mode!r}')
+
+    workers = max(1, _env_int(environ, 'WEB_CONCURRENCY', 1))
+    max_connections = max(1, _env_int(environ, 'DB_MAX_CONNECTIONS', 20))
+    per_worker = max(1, max_connections // workers)
+    pool_size = _env_int(environ, 'DB_POOL_SIZE', min(5, per_worker))
+    return {
+        'mode': mode,
+        'workers': workers,
+        'max_connections': max_connections,
+        'pool_size': pool_size,
+        'max_overflow': _env_int(environ, 'DB_MAX_OVERFLOW', max(0, per_worker - pool_size)),
+        'pool_timeout': _env_int(environ, 'DB_POOL_TIMEOUT', 10),
+        'pool_recycle': _env_int(environ, 'DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': _env_bool(environ, 'DB_POOL_PRE_PING', True),
+        'statement_timeout_ms': _env_int(environ, 'DB_STATEMENT_TIMEOUT_MS', 30000),
+    }
+
+
+def engine_options(database_url, settings=None):
+    """Return SQLALCHEMY_ENGINE_OPTIONS for database_url"""
+    if not database_url.startswith('postgresql'):
+        return {}
+    settings = settings or pool_settings()
+
+    if settings['mode'] == 'transaction':
+        # The proxy owns the pooling; the app opens a connection per checkout.
+        # Startup parameters such as "options" are rejected by PgBouncer, so
+        # the statement timeout is set per transaction instead (see below).
+        return {'poolclass': NullPool, 'pool_pre_ping': settings['pool_pre_ping']}
+
+    options = {
+        'pool_size': settings['pool_size'],
+        'max_overflow': settings['max_overflow'],
+        'pool_timeout': settings['pool_timeout'],
+        'pool_recycle': settings['pool_recycle'],
+        'pool_pre_ping': settings['pool_pre_ping'],
+    }
+    if settings['statement_timeout_ms'] > 0:
+        options['connect_args'] = {'options': f"-c statement_timeout={settings['statement_timeout_ms']}"}
+    return options
+
+
+class PoolStats:
+    """Pool event counters for one worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.peak_checked_out = 0
+        self._checked_out = 0
+
+    def on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self._checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self._checked_out)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+            self._checked_out = max(0, self._checked_out - 1)
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'checked_out': self._checked_out,
+                'peak_checked_out': self.peak_checked_out,
+            }
+
+
+def init_pool_diagnostics(app, db, settings=None):
+    """Track pool usage of app's engine and expose it at /api/diagnostics/pool"""
+    stats = PoolStats()
+    started = time.time()
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'connect', stats.on_connect)
+    event.listen(engine, 'checkout', stats.on_checkout)
+    event.listen(engine, 'checkin', stats.on_checkin)
+    event.listen(engine, 'invalidate', stats.on_invalidate)
+
+    if engine.dialect.name == 'postgresql':
+        settings = settings or pool_settings()
+        if settings['mode'] == 'transaction' and settings['statement_timeout_ms'] > 0:
+            timeout_sql = f"SET LOCAL statement_timeout = {settings['statement_timeout_ms']}"
+
+            @event.listens_for(engine, 'begin')
+            def _set_statement_timeout(conn):
+                conn.exec_driver_sql(timeout_sql)
+    else:
+        settings = None
+
+    @app.route('/api/diagnostics/pool', methods=['GET'])
+    def pool_diagnostics():
+        pool = engine.pool
+        state = {'class': type(pool).__name__, 'status': pool.status()}
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            method = getattr(pool, name, None)
+            if callable(method):
+                state[name] = method()
+        return jsonify({
+            'pid': os.getpid(),
+            'uptime_seconds': round(time.time() - started, 1),
+            'dialect': engine.dialect.name,
+            'settings': settings,
+            'pool': state,
+            'events': stats.as_dict(),
+        })
+
+    return stats
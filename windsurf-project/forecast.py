@@ -0,0 +1,120 @@
+"""Demand forecasting over the order history with NumPy.
+
+compute_forecast() streams (tshirt_id, quantity, day) columns for the
+history window out of the orders table in chunks and bins them into one
+SKU x day matrix with np.bincount. Everything per SKU is then computed for
+the whole catalog at once from that matrix:
+
+    units_7d, units_28d      units sold in the last 7 / 28 days
+    avg_daily_7d, _28d       the matching moving averages
+    forecast_daily           exponentially weighted daily demand (recent days
+                             count more; ``alpha`` sets how much)
+    days_of_stock            current quantity / forecast_daily
+    reorder_quantity         units needed to cover ``cover_days`` of demand
+
+Cancelled orders are not demand and are left out. Archived orders are read
+through the orders_all view when the history window reaches back into them.
+"""
+from datetime import date, datetime, timedelta
+from itertools import chain
+
+import numpy as np
+
+from archive import orders_source
+from models import db, TShirt
+
+CHUNK_ROWS = 200000
+DEFAULTS = {'history_days': 90, 'cover_days': 14, 'alpha': 0.1}
+MAX_HISTORY_DAYS = 730
+
+EPOCH = date(1970, 1, 1)
+
+
+def resolve_params(args):
+    """Validate forecast parameters from a query string, filling in defaults"""
+    try:
+        history_days = int(args.get('history_days', DEFAULTS['history_days']))
+        cover_days = int(args.get('cover_days', DEFAULTS['cover_days']))
+        alpha = float(args.get('alpha', DEFAULTS['alpha']))
+    except (TypeError, ValueError):
+        raise ValueError('history_days and cover_days must be integers and alpha a number')
+    if not 28 <= history_days <= MAX_HISTORY_DAYS:
+        raise ValueError(f'history_days must be between 28 and {MAX_HISTORY_DAYS}')
+    if cover_days < 1:
+        raise ValueError('cover_days must be positive')
+    if not 0 < alpha <= 1:
+        raise ValueError('alpha must be in (0, 1]')
+    return {'history_days': history_days, 'cover_days': cover_days, 'alpha': alpha}
+
+
+def _epoch_day(column):
+    """SQL expression for the whole days between 1970-01-01 and a timestamp"""
+    if db.engine.dialect.name == 'postgresql':
+        return db.cast(db.func.floor(db.extract('epoch', column) / 86400), db.Integer)
+    return db.cast(db.func.julianday(column) - 2440587.5, db.Integer)
+
+
+def daily_units(ids, history_days, today):
+    """Units sold per SKU per day as an (len(ids), history_days) matrix.
+
+    Column 0 is today, column 1 yesterday, and so on. ids must be sorted.
+    """
+    n = len(ids)
+    counts = np.zeros(n * history_days, dtype=np.float64)
+    if n == 0:
+        return counts.reshape(0, history_days)
+
+    today_day = (today - EPOCH).days
+    since = datetime.combine(today - timedelta(days=history_days - 1), datetime.min.time())
+    orders = orders_source(since).c
+    query = (db.select(orders.tshirt_id, orders.quantity, _epoch_day(orders.order_date))
+             .where(orders.order_date >= since, orders.status != 'cancelled'))
+    result = db.session.connection().execution_options(stream_results=True).execute(query)
+    for chunk in result.partitions(CHUNK_ROWS):
+        # Rows are flattened with fromiter; np.asarray treats Row objects as mappings and is slow
+        columns = np.fromiter(chain.from_iterable(chunk), dtype=np.int64, count=3 * len(chunk)).reshape(-1, 3)
+        tshirt_ids, quantities, days = columns[:, 0], columns[:, 1], columns[:, 2]
+        idx = np.minimum(np.searchsorted(ids, tshirt_ids), n - 1)
+        age = today_day - days
+        keep = (ids[idx] == tshirt_ids) & (age >= 0) & (age < history_days)
+        counts += np.bincount(idx[keep] * history_days + age[keep],
+                              weights=quantities[keep], minlength=n * history_days)
+    return counts.reshape(n, history_days)
+
+
+def compute_forecast(history_days=90, cover_days=14, alpha=0.1, today=None):
+    """Return the demand forecast for every SKU, ordered by days of stock left"""
+    today = today or datetime.utcnow().date()
+    catalog = db.session.execute(
+        db.select(TShirt.id, TShirt.design_name, TShirt.size, TShirt.color, TShirt.quantity)
+        .order_by(TShirt.id)
+    ).all()
+    ids = np.array([row.id for row in catalog], dtype=np.int64)
+    quantity = np.array([row.quantity for row in catalog], dtype=np.float64)
+
+    daily = daily_units(ids, history_days, today)
+    units_7d = daily[:, :7].sum(axis=1)
+    units_28d = daily[:, :28].sum(axis=1)
+
+    weights = alpha * (1 - alpha) ** np.arange(history_days)
+    forecast_daily = daily @ (weights / weights.sum())
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_stock = np.where(forecast_daily > 0, quantity / forecast_daily, np.inf)
+    reorder = np.maximum(np.ceil(forecast_daily * cover_days - 1e-9) - quantity, 0)
+
+    order = np.argsort(days_of_stock, kind='stable')
+    return [{
+        'tshirt_id': catalog[i].id,
+        'design_name': catalog[i].design_name,
+        'size': catalog[i].size,
+        'color': catalog[i].color,
+        'quantity': catalog[i].quantity,
+        'units_7d': int(units_7d[i]),
+        'units_28d': int(units_28d[i]),
+        'avg_daily_7d': round(float(units_7d[i]) / 7, 3),
+        'avg_daily_28d': round(float(units_28d[i]) / 28, 3),
+        'forecast_daily': round(float(forecast_daily[i]), 3),
+        'days_of_stock': None if np.isinf(days_of_stock[i]) else round(float(days_of_stock[i]), 1),
+        'reorder_quantity': int(reorder[i])
+    } for i in order.tolist()]
@@ -1,8 +1,38 @@
-from flask import Flask, render_template, send_from_directory
+from flask import Flask, Response, render_template, render_template_string, request, send_from_directory
 import os
+import urllib3
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
+# API proxy settings
+BACKEND_URL = os.environ.get('API_BACKEND_URL', 'http://localhost:5008').rstrip('/')
+CONNECT_TIMEOUT = float(os.environ.get('PROXY_CONNECT_TIMEOUT', 3))
+# Longer than the 15 s keepalive of /api/stream, so idle event streams stay open
+READ_TIMEOUT = float(os.environ.get('PROXY_READ_TIMEOUT', 30))
+POOL_SIZE = int(os.environ.get('PROXY_POOL_SIZE', 32))
+CHUNK_SIZE = 64 * 1024
+
+# One keep-alive pool per process, shared by all request threads
+upstream = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=POOL_SIZE,
+    retries=False,
+    timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT)
+)
+
+# Headers that describe one connection and must not be forwarded (RFC 7230 6.1)
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'trailers', 'transfer-encoding', 'upgrade'
+}
+
+def _end_to_end_headers(headers):
+    """Drop hop-by-hop headers, including any named in the Connection header"""
+    listed = {name.strip().lower() for value in headers.getlist('Connection')
+              for name in value.split(',')}
+    drop = HOP_BY_HOP_HEADERS | listed
+    return [(name, value) for name, value in headers.items() if name.lower() not in drop]
+
 # Serve static files
 @app.route('/static/<path:path>')
 def serve_static(path):
@@ -14,18 +44,65 @@ def index():
     return render_template('index.html')
 
 # API proxy endpoints
-@app.route('/api/<path:path>', methods=['GET', 'POST'])
+@app.route('/api/<path:path>', methods=['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'HEAD'])
 def proxy_api(path):
-    import requests
-    backend_url = f'http://localhost:5008/api/{path}'
+    """Forward an API call to the backend over a pooled connection.
+
+    The request and response bodies are streamed as they arrive, the response
+    undecoded, so large imports, exports and the /api/stream event stream
+    pass straight through.
+    """
+    url = f'{BACKEND_URL}/api/{path}'
+    if request.query_string:
+        url += '?' + request.query_string.decode('latin-1')
+
+    headers = [(name, value) for name, value in _end_to_end_headers(request.headers)
+               if name.lower() not in ('host', 'content-length')]
+    headers.append(('X-Forwarded-For', request.remote_addr or ''))
+    headers.append(('X-Forwarded-Host', request.host))
+    headers.append(('X-Forwarded-Proto', request.scheme))
+    # Request bodies are forwarded as they arrive rather than buffered, so
+    # bulk imports stream through too
+    body, chunked = None, False
+    if request.content_length is not None:
+        headers.append(('Content-Length', str(request.content_length)))
+        body = request.stream
+    elif 'chunked' in request.headers.get('Transfer-Encoding', '').lower():
+        body, chunked = request.stream, True
+
     try:
-        if request.method == 'GET':
-            resp = requests.get(backend_url, params=request.args)
-        else:
-            resp = requests.post(backend_url, json=request.get_json())
-        return (resp.content, resp.status_code, resp.headers.items())
-    except requests.exceptions.RequestException as e:
-        return str(e), 500
+        resp = upstream.urlopen(request.method, url, body=body, headers=dict(headers), chunked=chunked,
+                                redirect=False, preload_content=False, decode_content=False)
+    except urllib3.exceptions.NewConnectionError as e:
+        return {'error': f'Backend unavailable: {e}'}, 502
+    except urllib3.exceptions.TimeoutError as e:
+        return {'error': f'Backend timed out: {e}'}, 504
+    except urllib3.exceptions.HTTPError as e:
+        return {'error': f'Backend unavailable: {e}'}, 502
+
+    released = False
+
+    def body_chunks():
+        nonlocal released
+        for chunk in resp.stream(CHUNK_SIZE, decode_content=False):
+            yield chunk
+        # The body was read to the end, so the connection can be reused
+        resp.release_conn()
+        released = True
+
+    def discard_unfinished():
+        # The client went away before the end of the body (an event stream,
+        # an aborted export): the backend may still be writing on this
+        # connection, so it is closed before going back to the pool and the
+        # next request opens a fresh one
+        if not released:
+            resp.close()
+            resp.release_conn()
+
+    response = Response(body_chunks(), status=resp.status,
+                        headers=_end_to_end_headers(resp.headers), direct_passthrough=True)
+    response.call_on_close(discard_unfinished)
+    return response
 
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -169,8 +246,9 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
-@app.route('/')
-def index():
+# Standalone test page, kept separate from the main page at /
+@app.route('/simple')
+def simple_index():
     return render_template_string(HTML_TEMPLATE)
 
 if __name__ == '__main__':
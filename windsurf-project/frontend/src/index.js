@@ -2,6 +2,7 @@ import React from 'react';
 import ReactDOM from 'react-dom/client';
 import { BrowserRouter } from 'react-router-dom';
 import App from './App';
+import './readPrimary';
 import './index.css';
 
 const root = ReactDOM.createRoot(document.getElementById('root'));
@@ -36,9 +36,12 @@ import axios from 'axios';
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:5008';
 
+// Customer list order per tab: All, Recent, Top Spenders
+const TAB_SORTS = ['name', 'recent', 'spent'];
+
 const Customers = () => {
   const [customers, setCustomers] = useState([]);
-  const [filteredCustomers, setFilteredCustomers] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
   const [tabValue, setTabValue] = useState(0);
@@ -46,60 +49,28 @@ const Customers = () => {
   const [customerOrders, setCustomerOrders] = useState([]);
 
   useEffect(() => {
-    fetchCustomers();
-  }, []);
+    // Searching and sorting happen server-side; wait for typing to pause
+    const timer = setTimeout(() => fetchCustomers(), searchTerm ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchTerm, tabValue]);
 
-  useEffect(() => {
-    if (searchTerm) {
-      const filtered = customers.filter(
-        customer => 
-          customer.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-          customer.phone.includes(searchTerm)
-      );
-      setFilteredCustomers(filtered);
-    } else {
-      setFilteredCustomers(customers);
-    }
-  }, [searchTerm, customers]);
-
-  const fetchCustomers = async () => {
+  const fetchCustomers = async (cursor = null) => {
     setLoading(true);
     try {
-      // Fetch orders to extract unique customers
-      const response = await axios.get(`${API_BASE_URL}/api/orders`);
-      const orders = response.data;
-      
-      // Extract unique customers with their order details
-      const customerMap = new Map();
-      
-      orders.forEach(order => {
-        const customerId = `${order.customer_name}-${order.customer_phone}`;
-        
-        if (!customerMap.has(customerId)) {
-          customerMap.set(customerId, {
-            id: customerId,
-            name: order.customer_name,
-            phone: order.customer_phone,
-            orders: [order],
-            totalSpent: order.quantity * order.tshirt.price,
-            lastOrder: new Date(order.order_date)
-          });
-        } else {
-          const customer = customerMap.get(customerId);
-          customer.orders.push(order);
-          customer.totalSpent += order.quantity * order.tshirt.price;
-          
-          const orderDate = new Date(order.order_date);
-          if (orderDate > customer.lastOrder) {
-            customer.lastOrder = orderDate;
-          }
+      // One page of customers with their lifetime totals
+      const response = await axios.get(`${API_BASE_URL}/api/customers`, {
+        params: {
+          sort: TAB_SORTS[tabValue],
+          q: searchTerm || undefined,
+          cursor: cursor || undefined
         }
       });
-      
-      const customerList = Array.from(customerMap.values());
-      setCustomers(customerList);
-      setFilteredCustomers(customerList);
-      
+      const page = response.data.customers.map(customer => ({
+        ...customer,
+        lastOrder: customer.last_order_at ? new Date(customer.last_order_at) : null
+      }));
+      setCustomers(cursor ? [...customers, ...page] : page);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error('Error fetching customers:', error);
     } finally {
@@ -111,12 +82,22 @@ const Customers = () => {
     setTabValue(newValue);
   };
 
-  const handleSelectCustomer = (customer) => {
+  const handleSelectCustomer = async (customer) => {
     setSelectedCustomer(customer);
-    setCustomerOrders(customer.orders);
+    setCustomerOrders([]);
+    try {
+      // Newest first, including archived orders
+      const response = await axios.get(`${API_BASE_URL}/api/customers/${customer.id}/orders`, {
+        params: { include_archived: 1, limit: 50 }
+      });
+      setCustomerOrders(response.data.orders);
+    } catch (error) {
+      console.error('Error fetching customer orders:', error);
+    }
   };
 
   const formatDate = (date) => {
+    if (!date) return '-';
     const options = { 
       year: 'numeric', 
       month: 'short', 
@@ -205,23 +186,20 @@ const Customers = () => {
                   </TableRow>
                 </TableHead>
                 <TableBody>
-                  {loading ? (
+                  {loading && customers.length === 0 ? (
                     <TableRow>
                       <TableCell colSpan={6} align="center">
                         <CircularProgress size={30} />
                       </TableCell>
                     </TableRow>
-                  ) : filteredCustomers.length === 0 ? (
+                  ) : customers.length === 0 ? (
                     <TableRow>
                       <TableCell colSpan={6} align="center">
                         No customers found
                       </TableCell>
                     </TableRow>
                   ) : (
-                    (tabValue === 0 ? filteredCustomers : 
-                     tabValue === 1 ? filteredCustomers.sort((a, b) => b.lastOrder - a.lastOrder) :
-                     filteredCustomers.sort((a, b) => b.totalSpent - a.totalSpent)
-                    ).map(customer => (
+                    customers.map(customer => (
                       <TableRow 
                         key={customer.id}
                         hover
@@ -242,9 +220,9 @@ const Customers = () => {
                             {customer.name}
                           </Box>
                         </TableCell>
-                        <TableCell>{customer.phone}</TableCell>
-                        <TableCell>{customer.orders.length}</TableCell>
-                        <TableCell>₹{customer.totalSpent}</TableCell>
+                        <TableCell>{customer.phone || '-'}</TableCell>
+                        <TableCell>{customer.order_count}</TableCell>
+                        <TableCell>₹{customer.total_spent}</TableCell>
                         <TableCell>{formatDate(customer.lastOrder)}</TableCell>
                         <TableCell>
                           <IconButton>
@@ -257,6 +235,11 @@ const Customers = () => {
                 </TableBody>
               </Table>
             </TableContainer>
+            {nextCursor && (
+              <Button fullWidth disabled={loading} onClick={() => fetchCustomers(nextCursor)}>
+                Load more
+              </Button>
+            )}
           </Paper>
         </Grid>
 
@@ -280,7 +263,7 @@ const Customers = () => {
                   <Box sx={{ display: 'flex', alignItems: 'center', mt: 1 }}>
                     <PhoneIcon fontSize="small" sx={{ mr: 1, color: 'text.secondary' }} />
                     <Typography variant="body1" color="text.secondary">
-                      {selectedCustomer.phone}
+                      {selectedCustomer.phone || '-'}
                     </Typography>
                   </Box>
                 </Box>
@@ -291,7 +274,7 @@ const Customers = () => {
                   <Card>
                     <CardContent sx={{ textAlign: 'center' }}>
                       <Typography variant="body2" color="text.secondary">Orders</Typography>
-                      <Typography variant="h5">{selectedCustomer.orders.length}</Typography>
+                      <Typography variant="h5">{selectedCustomer.order_count}</Typography>
                     </CardContent>
                   </Card>
                 </Grid>
@@ -299,7 +282,7 @@ const Customers = () => {
                   <Card>
                     <CardContent sx={{ textAlign: 'center' }}>
                       <Typography variant="body2" color="text.secondary">Spent</Typography>
-                      <Typography variant="h5">₹{selectedCustomer.totalSpent}</Typography>
+                      <Typography variant="h5">₹{selectedCustomer.total_spent}</Typography>
                     </CardContent>
                   </Card>
                 </Grid>
@@ -30,39 +30,36 @@ const Dashboard = () => {
     revenue: 0
   });
   const [inventory, setInventory] = useState([]);
-  const [orders, setOrders] = useState([]);
+  const [topSellingProducts, setTopSellingProducts] = useState([]);
 
   useEffect(() => {
     const fetchData = async () => {
       setLoading(true);
       try {
-        // Fetch inventory and orders
-        const [inventoryRes, ordersRes] = await Promise.all([
+        // Sales figures come pre-aggregated from the reports API
+        const [inventoryRes, summaryRes, byDesignRes, customersRes] = await Promise.all([
           axios.get(`${API_BASE_URL}/api/tshirts`),
-          axios.get(`${API_BASE_URL}/api/orders`)
+          axios.get(`${API_BASE_URL}/api/reports/summary`),
+          axios.get(`${API_BASE_URL}/api/reports/sales-by/design`),
+          axios.get(`${API_BASE_URL}/api/reports/customers`, { params: { limit: 0 } })
         ]);
         
         setInventory(inventoryRes.data);
-        setOrders(ordersRes.data);
+        setTopSellingProducts(
+          [...byDesignRes.data]
+            .sort((a, b) => b.units - a.units)
+            .slice(0, 5)
+            .map(item => ({ design: item.design, quantity: item.units }))
+        );
         
         // Calculate stats
         const totalProducts = inventoryRes.data.reduce((total, item) => total + item.quantity, 0);
-        const totalOrders = ordersRes.data.length;
-        
-        // Get unique customers
-        const uniqueCustomers = new Set();
-        ordersRes.data.forEach(order => uniqueCustomers.add(order.customer_name));
-        
-        // Calculate revenue
-        const revenue = ordersRes.data.reduce((total, order) => {
-          return total + (order.quantity * order.tshirt.price);
-        }, 0);
         
         setStats({
           totalProducts,
-          totalOrders,
-          totalCustomers: uniqueCustomers.size,
-          revenue
+          totalOrders: summaryRes.data.total_orders,
+          totalCustomers: customersRes.data.total_customers,
+          revenue: summaryRes.data.revenue
         });
         
       } catch (error) {
@@ -85,19 +82,6 @@ const Dashboard = () => {
     }
     return acc;
   }, []);
-  
-  const topSellingProducts = orders.reduce((acc, order) => {
-    const design = order.tshirt.design_name;
-    const existingIndex = acc.findIndex(item => item.design === design);
-    
-    if (existingIndex >= 0) {
-      acc[existingIndex].quantity += order.quantity;
-    } else {
-      acc.push({ design, quantity: order.quantity });
-    }
-    
-    return acc;
-  }, []).sort((a, b) => b.quantity - a.quantity).slice(0, 5);
 
   if (loading) {
     return (
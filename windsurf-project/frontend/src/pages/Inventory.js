@@ -127,6 +127,18 @@ const Inventory = () => {
     }));
   };
 
+  // Bulk updates run as background jobs: wait for the job before refetching
+  const waitForJob = async (job) => {
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise(resolve => setTimeout(resolve, 500));
+      job = (await axios.get(`${API_BASE_URL}/api/jobs/${job.id}`)).data;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error);
+    }
+    return job;
+  };
+
   const handleResetInventory = async () => {
     if (!window.confirm('Are you sure you want to reset the inventory to its initial state?')) {
       return;
@@ -134,7 +146,8 @@ const Inventory = () => {
     
     setLoading(true);
     try {
-      await axios.post(`${API_BASE_URL}/api/reset-inventory`);
+      const { data } = await axios.post(`${API_BASE_URL}/api/reset-inventory`);
+      await waitForJob(data);
       await fetchInventory();
       
       showAlert('Inventory reset successfully', 'success');
@@ -149,7 +162,8 @@ const Inventory = () => {
   const handleRefreshInventory = async () => {
     setLoading(true);
     try {
-      await axios.post(`${API_BASE_URL}/api/update-stock`);
+      const { data } = await axios.post(`${API_BASE_URL}/api/update-stock`);
+      await waitForJob(data);
       await fetchInventory();
       
       showAlert('Inventory refreshed successfully', 'success');
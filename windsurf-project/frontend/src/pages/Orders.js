@@ -39,6 +39,7 @@ import {
 import axios from 'axios';
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:5008';
+const ORDERS_PAGE_SIZE = 50;
 
 const Orders = () => {
   const [orders, setOrders] = useState([]);
@@ -46,6 +47,8 @@ const Orders = () => {
   const [filteredOrders, setFilteredOrders] = useState([]);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [summary, setSummary] = useState({ total_orders: 0, revenue: 0 });
   const [openDialog, setOpenDialog] = useState(false);
   const [dialogType, setDialogType] = useState('');
   const [currentOrder, setCurrentOrder] = useState(null);
@@ -82,14 +85,17 @@ const Orders = () => {
   const fetchData = async () => {
     setLoading(true);
     try {
-      const [ordersRes, tshirtsRes] = await Promise.all([
-        axios.get(`${API_BASE_URL}/api/orders`),
-        axios.get(`${API_BASE_URL}/api/tshirts`)
+      const [ordersRes, tshirtsRes, summaryRes] = await Promise.all([
+        axios.get(`${API_BASE_URL}/api/orders`, { params: { limit: ORDERS_PAGE_SIZE } }),
+        axios.get(`${API_BASE_URL}/api/tshirts`),
+        axios.get(`${API_BASE_URL}/api/reports/summary`)
       ]);
       
-      setOrders(ordersRes.data);
-      setFilteredOrders(ordersRes.data);
+      setOrders(ordersRes.data.orders);
+      setFilteredOrders(ordersRes.data.orders);
+      setNextCursor(ordersRes.data.next_cursor);
       setTshirts(tshirtsRes.data);
+      setSummary(summaryRes.data);
     } catch (error) {
       console.error('Error fetching data:', error);
       showAlert('Failed to load data', 'error');
@@ -98,6 +104,22 @@ const Orders = () => {
     }
   };
 
+  const fetchMoreOrders = async () => {
+    setLoading(true);
+    try {
+      const res = await axios.get(`${API_BASE_URL}/api/orders`, {
+        params: { limit: ORDERS_PAGE_SIZE, cursor: nextCursor }
+      });
+      setOrders(prev => [...prev, ...res.data.orders]);
+      setNextCursor(res.data.next_cursor);
+    } catch (error) {
+      console.error('Error fetching orders:', error);
+      showAlert('Failed to load more orders', 'error');
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const handleOpenDialog = (type, order = null) => {
     setDialogType(type);
     if (order) {
@@ -307,6 +329,13 @@ const Orders = () => {
             </TableBody>
           </Table>
         </TableContainer>
+        {nextCursor && (
+          <Box sx={{ display: 'flex', justifyContent: 'center', p: 2 }}>
+            <Button onClick={fetchMoreOrders} disabled={loading}>
+              Load more
+            </Button>
+          </Box>
+        )}
       </Paper>
 
       {/* Order Summary */}
@@ -318,15 +347,13 @@ const Orders = () => {
           <Grid item xs={12} md={4}>
             <Box sx={{ p: 2, bgcolor: 'background.default', borderRadius: 1 }}>
               <Typography variant="subtitle1">Total Orders</Typography>
-              <Typography variant="h4">{orders.length}</Typography>
+              <Typography variant="h4">{summary.total_orders}</Typography>
             </Box>
           </Grid>
           <Grid item xs={12} md={4}>
             <Box sx={{ p: 2, bgcolor: 'background.default', borderRadius: 1 }}>
               <Typography variant="subtitle1">Total Revenue</Typography>
-              <Typography variant="h4">
-                ₹{orders.reduce((sum, order) => sum + (order.quantity * order.tshirt.price), 0)}
-              </Typography>
+              <Typography variant="h4">₹{summary.revenue}</Typography>
             </Box>
           </Grid>
           <Grid item xs={12} md={4}>
@@ -37,7 +37,14 @@ const Reports = () => {
   const [tabValue, setTabValue] = useState(0);
   const [loading, setLoading] = useState(true);
   const [inventory, setInventory] = useState([]);
-  const [orders, setOrders] = useState([]);
+  const [customerReport, setCustomerReport] = useState(null);
+  const [forecast, setForecast] = useState({});
+  const [summary, setSummary] = useState({
+    total_orders: 0,
+    units_sold: 0,
+    revenue: 0,
+    average_order_value: 0
+  });
   const [timeRange, setTimeRange] = useState('monthly');
   const [reportData, setReportData] = useState({
     inventoryByDesign: [],
@@ -51,19 +58,73 @@ const Reports = () => {
   }, []);
 
   useEffect(() => {
-    processReportData();
-  }, [inventory, orders, timeRange]);
+    fetchSalesOverTime();
+  }, [timeRange]);
+
+  useEffect(() => {
+    // Customer insights come from the customers' lifetime totals
+    if (tabValue === 2 && !customerReport) {
+      axios.get(`${API_BASE_URL}/api/reports/customers`)
+        .then(res => setCustomerReport(res.data))
+        .catch(error => console.error('Error fetching customer report:', error));
+    }
+  }, [tabValue]);
+
+  useEffect(() => {
+    // Demand forecast for the inventory tab: days of stock left per SKU
+    if (tabValue === 1) {
+      axios.get(`${API_BASE_URL}/api/forecast`)
+        .then(res => setForecast(Object.fromEntries(res.data.skus.map(sku => [sku.tshirt_id, sku]))))
+        .catch(error => console.error('Error fetching forecast:', error));
+    }
+  }, [tabValue]);
+
+  const stockStatus = (item) => {
+    const sku = forecast[item.id];
+    if (item.quantity === 0) return 'Out of Stock';
+    if (sku && sku.days_of_stock !== null) {
+      return sku.reorder_quantity > 0 ? 'Low Stock' : 'In Stock';
+    }
+    return item.quantity <= 5 ? 'Low Stock' : 'In Stock';
+  };
 
   const fetchData = async () => {
     setLoading(true);
     try {
-      const [inventoryRes, ordersRes] = await Promise.all([
+      const [inventoryRes, summaryRes, byDesignRes, byColorRes] = await Promise.all([
         axios.get(`${API_BASE_URL}/api/tshirts`),
-        axios.get(`${API_BASE_URL}/api/orders`)
+        axios.get(`${API_BASE_URL}/api/reports/summary`),
+        axios.get(`${API_BASE_URL}/api/reports/sales-by/design`),
+        axios.get(`${API_BASE_URL}/api/reports/sales-by/color`)
       ]);
       
       setInventory(inventoryRes.data);
-      setOrders(ordersRes.data);
+      setSummary(summaryRes.data);
+      
+      // Process inventory by design
+      const inventoryByDesign = inventoryRes.data.reduce((acc, item) => {
+        const existingIndex = acc.findIndex(i => i.design === item.design_name);
+        if (existingIndex >= 0) {
+          acc[existingIndex].quantity += item.quantity;
+        } else {
+          acc.push({ design: item.design_name, quantity: item.quantity });
+        }
+        return acc;
+      }, []);
+      
+      setReportData(prev => ({
+        ...prev,
+        inventoryByDesign,
+        topProducts: byDesignRes.data.slice(0, 5).map(item => ({
+          design: item.design,
+          quantity: item.units,
+          revenue: item.revenue
+        })),
+        salesByCategory: byColorRes.data.map(item => ({
+          category: item.color,
+          sales: item.revenue
+        }))
+      }));
     } catch (error) {
       console.error('Error fetching data:', error);
     } finally {
@@ -71,113 +132,56 @@ const Reports = () => {
     }
   };
 
-  const processReportData = () => {
-    // Process inventory by design
-    const inventoryByDesign = inventory.reduce((acc, item) => {
-      const existingIndex = acc.findIndex(i => i.design === item.design_name);
-      if (existingIndex >= 0) {
-        acc[existingIndex].quantity += item.quantity;
-      } else {
-        acc.push({ design: item.design_name, quantity: item.quantity });
-      }
-      return acc;
-    }, []);
-    
-    // Process orders by date
-    const ordersByDate = {};
+  const fetchSalesOverTime = async () => {
     const now = new Date();
+    const start = new Date(now);
+    let bucket = 'day';
     
-    // Initialize date buckets based on time range
-    if (timeRange === 'weekly') {
-      // Last 7 days
-      for (let i = 6; i >= 0; i--) {
-        const date = new Date(now);
-        date.setDate(date.getDate() - i);
-        const dateStr = date.toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
-        ordersByDate[dateStr] = 0;
-      }
-    } else if (timeRange === 'monthly') {
-      // Last 30 days
-      for (let i = 29; i >= 0; i--) {
+    // Build the empty buckets for the range so days without sales show as zero
+    const ordersByDate = {};
+    if (timeRange === 'weekly' || timeRange === 'monthly') {
+      const days = timeRange === 'weekly' ? 7 : 30;
+      start.setDate(start.getDate() - (days - 1));
+      for (let i = days - 1; i >= 0; i--) {
         const date = new Date(now);
         date.setDate(date.getDate() - i);
-        const dateStr = date.toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
-        ordersByDate[dateStr] = 0;
+        ordersByDate[date.toLocaleDateString('en-US', { month: 'short', day: 'numeric' })] = 0;
       }
     } else {
-      // Last 12 months
+      bucket = 'month';
+      start.setMonth(start.getMonth() - 11);
+      start.setDate(1);
       for (let i = 11; i >= 0; i--) {
         const date = new Date(now);
         date.setMonth(date.getMonth() - i);
-        const dateStr = date.toLocaleDateString('en-US', { month: 'short', year: 'numeric' });
-        ordersByDate[dateStr] = 0;
+        ordersByDate[date.toLocaleDateString('en-US', { month: 'short', year: 'numeric' })] = 0;
       }
     }
     
-    // Fill in order data
-    orders.forEach(order => {
-      const orderDate = new Date(order.order_date);
-      let dateStr;
-      
-      if (timeRange === 'weekly' || timeRange === 'monthly') {
-        dateStr = orderDate.toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
-      } else {
-        dateStr = orderDate.toLocaleDateString('en-US', { month: 'short', year: 'numeric' });
-      }
-      
-      if (ordersByDate[dateStr] !== undefined) {
-        ordersByDate[dateStr] += order.quantity * order.tshirt.price;
-      }
-    });
+    try {
+      const res = await axios.get(`${API_BASE_URL}/api/reports/sales-over-time`, {
+        params: { bucket, date_from: start.toISOString().slice(0, 10) }
+      });
+      res.data.forEach(row => {
+        const periodDate = new Date(`${row.period}T00:00:00`);
+        const dateStr = bucket === 'day'
+          ? periodDate.toLocaleDateString('en-US', { month: 'short', day: 'numeric' })
+          : periodDate.toLocaleDateString('en-US', { month: 'short', year: 'numeric' });
+        if (ordersByDate[dateStr] !== undefined) {
+          ordersByDate[dateStr] += row.revenue;
+        }
+      });
+    } catch (error) {
+      console.error('Error fetching sales over time:', error);
+    }
     
-    // Convert to array format for charts
-    const orderDateData = Object.entries(ordersByDate).map(([date, amount]) => ({
-      date,
-      amount
+    setReportData(prev => ({
+      ...prev,
+      ordersByDate: Object.entries(ordersByDate).map(([date, amount]) => ({
+        date,
+        amount
+      }))
     }));
-    
-    // Process top selling products
-    const topProducts = orders.reduce((acc, order) => {
-      const design = order.tshirt.design_name;
-      const existingIndex = acc.findIndex(item => item.design === design);
-      
-      if (existingIndex >= 0) {
-        acc[existingIndex].quantity += order.quantity;
-        acc[existingIndex].revenue += order.quantity * order.tshirt.price;
-      } else {
-        acc.push({
-          design,
-          quantity: order.quantity,
-          revenue: order.quantity * order.tshirt.price
-        });
-      }
-      
-      return acc;
-    }, []).sort((a, b) => b.revenue - a.revenue).slice(0, 5);
-    
-    // Process sales by category (color in this case)
-    const salesByCategory = orders.reduce((acc, order) => {
-      const color = order.tshirt.color;
-      const existingIndex = acc.findIndex(item => item.category === color);
-      
-      if (existingIndex >= 0) {
-        acc[existingIndex].sales += order.quantity * order.tshirt.price;
-      } else {
-        acc.push({
-          category: color,
-          sales: order.quantity * order.tshirt.price
-        });
-      }
-      
-      return acc;
-    }, []);
-    
-    setReportData({
-      inventoryByDesign,
-      ordersByDate: orderDateData,
-      topProducts,
-      salesByCategory
-    });
   };
 
   const handleTabChange = (event, newValue) => {
@@ -264,7 +268,7 @@ const Reports = () => {
               <Card>
                 <CardContent sx={{ textAlign: 'center' }}>
                   <Typography variant="h4" sx={{ color: 'primary.main' }}>
-                    {orders.length}
+                    {summary.total_orders}
                   </Typography>
                   <Typography variant="body1" color="text.secondary">
                     Total Orders
@@ -276,7 +280,7 @@ const Reports = () => {
               <Card>
                 <CardContent sx={{ textAlign: 'center' }}>
                   <Typography variant="h4" sx={{ color: 'primary.main' }}>
-                    {orders.reduce((sum, order) => sum + order.quantity, 0)}
+                    {summary.units_sold}
                   </Typography>
                   <Typography variant="body1" color="text.secondary">
                     Items Sold
@@ -288,7 +292,7 @@ const Reports = () => {
               <Card>
                 <CardContent sx={{ textAlign: 'center' }}>
                   <Typography variant="h4" sx={{ color: 'primary.main' }}>
-                    ₹{orders.reduce((sum, order) => sum + (order.quantity * order.tshirt.price), 0)}
+                    ₹{summary.revenue}
                   </Typography>
                   <Typography variant="body1" color="text.secondary">
                     Total Revenue
@@ -300,8 +304,7 @@ const Reports = () => {
               <Card>
                 <CardContent sx={{ textAlign: 'center' }}>
                   <Typography variant="h4" sx={{ color: 'primary.main' }}>
-                    ₹{Math.round(orders.reduce((sum, order) => sum + (order.quantity * order.tshirt.price), 0) / 
-                    (orders.length || 1))}
+                    ₹{Math.round(summary.average_order_value)}
                   </Typography>
                   <Typography variant="body1" color="text.secondary">
                     Average Order Value
@@ -439,6 +442,8 @@ const Reports = () => {
                     <TableCell>Color</TableCell>
                     <TableCell align="right">Available</TableCell>
                     <TableCell align="right">Price</TableCell>
+                    <TableCell align="right">Days Left</TableCell>
+                    <TableCell align="right">Reorder</TableCell>
                     <TableCell>Status</TableCell>
                   </TableRow>
                 </TableHead>
@@ -450,10 +455,13 @@ const Reports = () => {
                       <TableCell>{item.color}</TableCell>
                       <TableCell align="right">{item.quantity}</TableCell>
                       <TableCell align="right">₹{item.price}</TableCell>
-                      <TableCell>
-                        {item.quantity === 0 ? 'Out of Stock' : 
-                         item.quantity <= 5 ? 'Low Stock' : 'In Stock'}
+                      <TableCell align="right">
+                        {forecast[item.id]?.days_of_stock ?? '—'}
                       </TableCell>
+                      <TableCell align="right">
+                        {forecast[item.id]?.reorder_quantity ?? '—'}
+                      </TableCell>
+                      <TableCell>{stockStatus(item)}</TableCell>
                     </TableRow>
                   ))}
                 </TableBody>
@@ -475,7 +483,7 @@ const Reports = () => {
                 <Card>
                   <CardContent sx={{ textAlign: 'center' }}>
                     <Typography variant="h4" sx={{ color: 'primary.main' }}>
-                      {new Set(orders.map(order => `${order.customer_name}-${order.customer_phone}`)).size}
+                      {customerReport ? customerReport.total_customers : '-'}
                     </Typography>
                     <Typography variant="body1" color="text.secondary">
                       Total Customers
@@ -487,8 +495,7 @@ const Reports = () => {
                 <Card>
                   <CardContent sx={{ textAlign: 'center' }}>
                     <Typography variant="h4" sx={{ color: 'primary.main' }}>
-                      {Math.round(orders.reduce((acc, order) => acc + 1, 0) / 
-                       new Set(orders.map(order => `${order.customer_name}-${order.customer_phone}`)).size)}
+                      {customerReport ? Math.round(customerReport.average_orders) : '-'}
                     </Typography>
                     <Typography variant="body1" color="text.secondary">
                       Avg. Orders per Customer
@@ -500,8 +507,7 @@ const Reports = () => {
                 <Card>
                   <CardContent sx={{ textAlign: 'center' }}>
                     <Typography variant="h4" sx={{ color: 'primary.main' }}>
-                      {new Set(orders.filter(order => new Date(order.order_date) > new Date(Date.now() - 30 * 24 * 60 * 60 * 1000))
-                       .map(order => `${order.customer_name}-${order.customer_phone}`)).size}
+                      {customerReport ? customerReport.new_customers : '-'}
                     </Typography>
                     <Typography variant="body1" color="text.secondary">
                       New Customers (30d)
@@ -513,8 +519,7 @@ const Reports = () => {
                 <Card>
                   <CardContent sx={{ textAlign: 'center' }}>
                     <Typography variant="h4" sx={{ color: 'primary.main' }}>
-                      ₹{Math.round(orders.reduce((sum, order) => sum + (order.quantity * order.tshirt.price), 0) / 
-                       new Set(orders.map(order => `${order.customer_name}-${order.customer_phone}`)).size)}
+                      ₹{customerReport ? Math.round(customerReport.average_spent) : '-'}
                     </Typography>
                     <Typography variant="body1" color="text.secondary">
                       Avg. Customer Spend
@@ -541,36 +546,15 @@ const Reports = () => {
                   </TableRow>
                 </TableHead>
                 <TableBody>
-                  {Object.values(orders.reduce((acc, order) => {
-                    const customerId = `${order.customer_name}-${order.customer_phone}`;
-                    if (!acc[customerId]) {
-                      acc[customerId] = {
-                        name: order.customer_name,
-                        phone: order.customer_phone,
-                        orders: 1,
-                        spent: order.quantity * order.tshirt.price,
-                        lastOrder: new Date(order.order_date)
-                      };
-                    } else {
-                      acc[customerId].orders += 1;
-                      acc[customerId].spent += order.quantity * order.tshirt.price;
-                      const orderDate = new Date(order.order_date);
-                      if (orderDate > acc[customerId].lastOrder) {
-                        acc[customerId].lastOrder = orderDate;
-                      }
-                    }
-                    return acc;
-                  }, {}))
-                  .sort((a, b) => b.spent - a.spent)
-                  .slice(0, 10)
-                  .map((customer, index) => (
-                    <TableRow key={index}>
+                  {(customerReport ? customerReport.top_customers : [])
+                  .map(customer => (
+                    <TableRow key={customer.id}>
                       <TableCell>{customer.name}</TableCell>
-                      <TableCell>{customer.phone}</TableCell>
-                      <TableCell align="right">{customer.orders}</TableCell>
-                      <TableCell align="right">₹{customer.spent}</TableCell>
+                      <TableCell>{customer.phone || '-'}</TableCell>
+                      <TableCell align="right">{customer.order_count}</TableCell>
+                      <TableCell align="right">₹{customer.total_spent}</TableCell>
                       <TableCell>
-                        {customer.lastOrder.toLocaleDateString()}
+                        {customer.last_order_at ? new Date(customer.last_order_at).toLocaleDateString() : '-'}
                       </TableCell>
                     </TableRow>
                   ))}
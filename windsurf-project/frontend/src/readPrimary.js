@@ -0,0 +1,23 @@
+// Read-your-writes when the API reads from a replica. A successful write
+// answers with X-Read-Primary: <seconds>; until then every request sends
+// X-Read-Primary so its reads go to the primary, which already has the write.
+// The API's cookie for the same purpose is not sent back cross-origin.
+import axios from 'axios';
+
+const READ_PRIMARY_HEADER = 'X-Read-Primary';
+let readPrimaryUntil = 0;
+
+axios.interceptors.request.use((config) => {
+  if (Date.now() < readPrimaryUntil) {
+    config.headers[READ_PRIMARY_HEADER] = '1';
+  }
+  return config;
+});
+
+axios.interceptors.response.use((response) => {
+  const seconds = Number(response.headers[READ_PRIMARY_HEADER.toLowerCase()]);
+  if (seconds > 0) {
+    readPrimaryUntil = Date.now() + seconds * 1000;
+  }
+  return response;
+});
@@ -0,0 +1,361 @@
+"""Request metrics and logging for the Flask API.
+
+init_metrics() times every request, counts the SQL statements and SQL time it
+caused through SQLAlchemy engine events, records response sizes, and serves
+everything at /metrics in the Prometheus text format.
+
+Metrics are kept per process. Under several gunicorn workers, set METRICS_DIR
+(config key, else environment variable) to a directory shared by the workers
+and emptied when the server starts: each worker then writes its metrics to
+worker-<pid>-<random>.json there at most every METRICS_FLUSH_INTERVAL
+seconds, and /metrics sums the files of all workers. Files of workers that
+have exited are folded into aggregate.json when /metrics is scraped, so
+their counts are kept and counters never go backwards between scrapes,
+even when a new worker gets an old worker's pid.
+
+get_logger() returns the application logger. Records are handed to a queue
+and written by a background thread, so logging never blocks a request.
+Debug and info output is off unless APP_DEBUG_LOG is set.
+"""
+import atexit
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: exited workers' files are summed, not folded
+    fcntl = None
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+METRICS_FLUSH_INTERVAL = 1.0
+AGGREGATE_FILE = 'aggregate.json'
+
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def get_logger():
+    """Return the shared application logger, creating it on first use"""
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            logger = logging.getLogger('tshirts')
+            enabled = os.environ.get('APP_DEBUG_LOG', '').lower() in ('1', 'true', 'yes')
+            logger.setLevel(logging.DEBUG if enabled else logging.WARNING)
+            logger.propagate = False
+
+            records = queue.SimpleQueue()
+            stream = logging.StreamHandler()
+            stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+            listener = logging.handlers.QueueListener(records, stream)
+            listener.start()
+            atexit.register(listener.stop)
+            logger.addHandler(logging.handlers.QueueHandler(records))
+            _logger = logger
+    return _logger
+
+
+class Histogram:
+    """Cumulative histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def dump(self):
+        return [[list(labels), counts, total, count]
+                for labels, (counts, total, count) in self._series.items()]
+
+    def merge(self, dumped):
+        for labels, counts, total, count in dumped:
+            series = self._series.setdefault(tuple(labels), [[0] * len(self.buckets), 0.0, 0])
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += total
+            series[2] += count
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            label_text = _format_labels(self.label_names, labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dump(self):
+        return [[list(labels), value] for labels, value in self._values.items()]
+
+    def merge(self, dumped):
+        for labels, value in dumped:
+            self.inc(tuple(labels), value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{{{_format_labels(self.label_names, labels)}}} {value}')
+        return lines
+
+
+def _format_labels(names, values):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class RequestMetrics:
+    """Per-route request, SQL and payload metrics for one Flask app.
+
+    With a directory, render() reports the sum over every process that
+    flushed its metrics there.
+    """
+
+    def __init__(self, directory=None):
+        self._lock = threading.Lock()
+        self.directory = directory
+        self._flusher_pid = None
+        self._file_pid = None
+        self._file_name = None
+        self._dirty = False
+        labels = ('method', 'route')
+        self.requests = Counter('http_requests_total', 'Requests handled',
+                                ('method', 'route', 'status'))
+        self.latency = Histogram('http_request_duration_seconds', 'Request latency',
+                                 labels, LATENCY_BUCKETS)
+        self.sql_statements = Histogram('http_request_sql_statements',
+                                        'SQL statements executed per request',
+                                        labels, SQL_COUNT_BUCKETS)
+        self.sql_seconds = Histogram('http_request_sql_duration_seconds',
+                                     'Total SQL time per request', labels, LATENCY_BUCKETS)
+        self.response_bytes = Histogram('http_response_size_bytes', 'Response body size',
+                                        labels, SIZE_BUCKETS)
+
+    def metrics(self):
+        return (self.requests, self.latency, self.sql_statements,
+                self.sql_seconds, self.response_bytes)
+
+    def record(self, method, route, status, seconds, statements, sql_seconds, size):
+        labels = (method, route)
+        with self._lock:
+            self.requests.inc((method, route, str(status)))
+            self.latency.observe(labels, seconds)
+            self.sql_statements.observe(labels, statements)
+            self.sql_seconds.observe(labels, sql_seconds)
+            if size is not None:
+                self.response_bytes.observe(labels, size)
+            self._dirty = True
+            # Started per pid, so every gunicorn worker flushes its own file
+            if self.directory and self._flusher_pid != os.getpid():
+                self._flusher_pid = os.getpid()
+                threading.Thread(target=self._flush_periodically, daemon=True).start()
+                # Workers restarted by gunicorn write their last requests too
+                atexit.register(self._flush_at_exit)
+
+    def _own_file(self):
+        # A random part keeps a worker that reuses an old pid from
+        # overwriting the old worker's file
+        if self._file_pid != os.getpid():
+            self._file_pid = os.getpid()
+            self._file_name = f'worker-{self._file_pid}-{uuid.uuid4().hex[:12]}.json'
+        return os.path.join(self.directory, self._file_name)
+
+    def flush(self):
+        """Write this process's metrics to its file in the directory"""
+        with self._lock:
+            dumped = {metric.name: metric.dump() for metric in self.metrics()}
+            self._dirty = False
+        _write_json(self._own_file(), dumped)
+
+    def _flush_at_exit(self):
+        if self._dirty and self._flusher_pid == os.getpid():
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                if self._dirty:
+                    self.flush()
+            except OSError as e:
+                get_logger().error(f"Error writing metrics to {self.directory}: {e}")
+
+    def render(self):
+        if not self.directory:
+            with self._lock:
+                return _render(self.metrics())
+        self.flush()
+        merged = RequestMetrics()
+        with self._directory_lock():
+            aggregate = self._fold_exited_workers()
+            folded = set(aggregate['folded'])
+            merged.merge_dumped(aggregate['metrics'])
+            for path in glob.glob(os.path.join(self.directory, 'worker-*.json')):
+                # A folded file whose removal failed is already in the aggregate
+                if os.path.basename(path) not in folded:
+                    merged.merge_dumped(_read_json(path) or {})
+        return _render(merged.metrics())
+
+    def merge_dumped(self, dumped):
+        for metric in self.metrics():
+            metric.merge(dumped.get(metric.name, []))
+
+    @contextmanager
+    def _directory_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, 'metrics.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _fold_exited_workers(self):
+        """Add the files of exited workers to the aggregate file and remove them.
+
+        Call with the directory lock held. The aggregate lists the files it
+        holds, so a file whose removal failed is never added twice. Returns
+        the aggregate.
+        """
+        path = os.path.join(self.directory, AGGREGATE_FILE)
+        aggregate = _read_json(path) or {'folded': [], 'metrics': {}}
+        if fcntl is None:
+            return aggregate
+        exited = [name for name in map(os.path.basename,
+                                       glob.glob(os.path.join(self.directory, 'worker-*.json')))
+                  if not _process_alive(int(name.split('-')[1]))]
+        new = [name for name in exited if name not in aggregate['folded']]
+        if new:
+            totals = RequestMetrics()
+            totals.merge_dumped(aggregate['metrics'])
+            for name in new:
+                totals.merge_dumped(_read_json(os.path.join(self.directory, name)) or {})
+            aggregate = {'folded': exited,
+                         'metrics': {metric.name: metric.dump() for metric in totals.metrics()}}
+            _write_json(path, aggregate)
+        for name in exited:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        return aggregate
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to another user
+        return True
+    return True
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, value):
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(value, f)
+    # Readers only ever see complete files
+    os.replace(f'{path}.tmp', path)
+
+
+def _render(metrics):
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app, db):
+    """Instrument every route of app and expose the results at /metrics"""
+    directory = app.config.get('METRICS_DIR') or os.environ.get('METRICS_DIR') or None
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    metrics = RequestMetrics(directory)
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            # Streamed bodies have no length up front and are left out of the size histogram
+            size = None if response.is_streamed else response.calculate_content_length()
+            metrics.record(request.method, route, response.status_code,
+                           time.perf_counter() - start, g.sql_statements, g.sql_seconds, size)
+        return response
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if has_request_context() and 'sql_statements' in g:
+            g.sql_statements += 1
+            g.sql_seconds += elapsed
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
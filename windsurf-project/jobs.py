@@ -0,0 +1,282 @@
+"""Background jobs for bulk inventory operations.
+
+/api/reset-inventory and /api/update-stock queue a row in the jobs table and
+answer 202 at once; clients poll GET /api/jobs/<id> for its progress. Each
+worker process runs one JobRunner thread, started on first use, that claims
+queued jobs in order, one job at a time across all workers, and runs them:
+
+    reset_inventory  mode=upsert merges catalog.csv JOB_CHUNK_SIZE SKUs at a
+                     time; the default mode swaps the whole catalog for new
+                     ids, so it stays one transaction
+    update_stock     applies a restock policy (see restock.py) to
+                     JOB_CHUNK_SIZE SKUs at a time, in id order
+
+Every chunk commits together with the job's progress, so the write lock is
+released between chunks and checkouts interleave with the job. A job's
+cache bump and change event go out with its chunks and its last
+transaction.
+
+Jobs are generators run in the runner's session. Each one does a chunk of
+work and yields (done, total); its return value becomes the job's result.
+A job left running by a worker that died is marked failed; the chunks it
+committed stay applied, and rerunning either job is safe. On Postgres the
+worker running a job holds an advisory lock on the job (its lease) on a
+connection of its own, which the server drops with the worker, so a
+running job nobody holds the lease of is dead however long its steps
+take. SQLite has no such locks: a job there is dead once it has made no
+progress for JOB_STALE_SECONDS. A step holds the database write lock until
+it commits its progress, so no other worker can run that check mid-step.
+``flask --app app run-jobs`` runs queued jobs in the foreground instead.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from catalog import SKU_COLUMNS, load_catalog, read_catalog
+from instrumentation import get_logger
+from models import db, Job, TShirt, bump_cache_version, publish_change, record_stock_levels
+from restock import apply_restock, resolve_policy
+from serialization import dumps, loads
+
+CHUNK_SIZE = 1000
+CHUNK_PAUSE_MS = 10
+POLL_INTERVAL = 2.0
+STALE_SECONDS = 300
+JOB_FIELDS = ('id', 'kind', 'status', 'done', 'total', 'params', 'result', 'error',
+              'created_at', 'started_at', 'finished_at')
+# Taken while claiming on Postgres, so two workers never start jobs at once
+CLAIM_LOCK_KEY = 727002
+# pg_advisory_lock(LEASE_LOCK_KEY, job id) is held while a job runs on Postgres
+LEASE_LOCK_KEY = 727003
+
+logger = get_logger()
+
+
+def _reset_inventory(params, chunk_size):
+    rows = read_catalog()
+    if params.get('mode') != 'upsert':
+        # The ledger sees the old quantities go out and the new ones come in
+        record_stock_levels(-1, 'catalog_reset')
+        load_catalog(db.session, TShirt.__table__, rows)
+        record_stock_levels(1, 'catalog_reset')
+        bump_cache_version('catalog')
+        yield len(rows), len(rows)
+    else:
+        for first in range(0, len(rows), chunk_size):
+            chunk = rows[first:first + chunk_size]
+            skus = [tuple(row[name] for name in SKU_COLUMNS) for row in chunk]
+            record_stock_levels(-1, 'catalog_reset', skus)
+            load_catalog(db.session, TShirt.__table__, chunk, upsert=True)
+            record_stock_levels(1, 'catalog_reset', skus)
+            bump_cache_version('catalog')
+            yield first + len(chunk), len(rows)
+    publish_change('catalog_reset')
+    return {'message': 'Inventory reset successfully', 'tshirts': len(rows)}
+
+
+def _update_stock(params, chunk_size):
+    policy, params = resolve_policy(params.get('policy'), params.get('params'))
+    total = db.session.query(db.func.count(TShirt.id)).scalar()
+    restocked = done = last_id = 0
+    while True:
+        ids = db.session.execute(
+            db.select(TShirt.id).where(TShirt.id > last_id).order_by(TShirt.id).limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            break
+        count = apply_restock(policy, params, id_range=(ids[0], ids[-1]))
+        if count:
+            bump_cache_version('catalog')
+        restocked += count
+        done += len(ids)
+        last_id = ids[-1]
+        yield done, total
+    if restocked:
+        publish_change('catalog_reset')
+    return {'message': 'Stock updated successfully', 'policy': policy, 'params': params,
+            'restocked': restocked}
+
+
+JOB_KINDS = {
+    'reset_inventory': _reset_inventory,
+    'update_stock': _update_stock,
+}
+
+
+def job_to_dict(job):
+    values = {name: getattr(job, name) for name in JOB_FIELDS}
+    values['params'] = loads(job.params)
+    values['result'] = loads(job.result) if job.result else None
+    return values
+
+
+def _take_lease(job_id):
+    """Hold the job's advisory lock on a new connection and return it"""
+    conn = db.engine.connect()
+    conn.execute(db.text('SELECT pg_advisory_lock(:key, :job)'), {'key': LEASE_LOCK_KEY, 'job': job_id})
+    conn.commit()
+    return conn
+
+
+def _release_lease(conn, job_id):
+    try:
+        conn.execute(db.text('SELECT pg_advisory_unlock(:key, :job)'), {'key': LEASE_LOCK_KEY, 'job': job_id})
+        conn.commit()
+    except Exception:
+        # A pooled connection must not keep the lock
+        conn.invalidate()
+    finally:
+        conn.close()
+
+
+def _begin_write():
+    """Start the session's transaction, on SQLite holding the write lock"""
+    if db.engine.dialect.name == 'sqlite':
+        # Chunks read before they write; a deferred transaction could not
+        # upgrade to a writer after another worker's commit
+        db.session.connection().exec_driver_sql('BEGIN IMMEDIATE')
+
+
+class JobRunner:
+    """Claims and runs queued jobs on a thread of this worker.
+
+    after_commit runs after each job finishes, successfully or not.
+    """
+
+    def __init__(self, after_commit=None):
+        self._after_commit = after_commit
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._app = None
+
+    def submit(self, kind, params):
+        """Queue a job, commit it and return it; it runs on a runner thread"""
+        if kind not in JOB_KINDS:
+            raise ValueError(f'Unknown job kind {kind!r}')
+        job = Job(kind=kind, params=dumps(params).decode('utf-8'), status='queued')
+        db.session.add(job)
+        db.session.commit()
+        self.start()
+        self._wake.set()
+        return job
+
+    def start(self):
+        """Start this worker's runner thread if it is not running yet"""
+        with self._lock:
+            # One runner per worker process: a runner started before gunicorn
+            # forked (--preload) is not running here
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._app = current_app._get_current_object()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def run_pending(self):
+        """Run queued jobs in the calling thread until none is left; returns how many ran"""
+        ran = 0
+        while self._run_next():
+            ran += 1
+        return ran
+
+    def _run(self):
+        while True:
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                with self._app.app_context():
+                    self.run_pending()
+            except Exception as e:
+                logger.error(f"Error running background jobs: {e}")
+
+    def _claim(self):
+        """Mark the oldest queued job running and return it with its lease, or (None, None)"""
+        # Cheap check first: idle workers poll without taking the write lock
+        queued = db.session.query(Job.id).filter(Job.status == 'queued').first()
+        db.session.rollback()
+        if not queued:
+            return None, None
+        _begin_write()
+        postgres = db.engine.dialect.name == 'postgresql'
+        if postgres:
+            db.session.execute(db.text('SELECT pg_advisory_xact_lock(:key)'), {'key': CLAIM_LOCK_KEY})
+        now = datetime.utcnow()
+        if postgres:
+            running = db.session.execute(db.select(Job.id).where(Job.status == 'running')).scalars().all()
+            # Released at commit; getting it means the lease holder is gone
+            dead = [job_id for job_id in running if db.session.execute(
+                db.text('SELECT pg_try_advisory_xact_lock(:key, :job)'),
+                {'key': LEASE_LOCK_KEY, 'job': job_id}).scalar()]
+            stale = Job.id.in_(dead)
+        else:
+            stale = Job.updated_at < now - timedelta(
+                seconds=float(self._config('JOB_STALE_SECONDS', STALE_SECONDS)))
+        db.session.execute(
+            db.update(Job)
+            .where(Job.status == 'running', stale)
+            .values(status='failed', error='Interrupted: the worker running it stopped', finished_at=now)
+        )
+        job = lease = None
+        if not db.session.query(Job.id).filter(Job.status == 'running').first():
+            job = Job.query.filter(Job.status == 'queued').order_by(Job.id).first()
+            if job is not None:
+                job.status = 'running'
+                job.started_at = job.updated_at = now
+                if postgres:
+                    # Taken before the claim commits, so no other worker
+                    # ever sees the job running without a lease
+                    lease = _take_lease(job.id)
+        try:
+            db.session.commit()
+        except Exception:
+            if lease is not None:
+                _release_lease(lease, job.id)
+            raise
+        return job, lease
+
+    def _run_next(self):
+        job, lease = self._claim()
+        if job is None:
+            return False
+        job_id = job.id
+        chunk_size = int(self._config('JOB_CHUNK_SIZE', CHUNK_SIZE))
+        pause = float(self._config('JOB_CHUNK_PAUSE_MS', CHUNK_PAUSE_MS)) / 1000
+        steps = JOB_KINDS[job.kind](loads(job.params), chunk_size)
+        try:
+            while True:
+                _begin_write()
+                try:
+                    job.done, job.total = next(steps)
+                except StopIteration as finished:
+                    job.status = 'succeeded'
+                    job.result = dumps(finished.value).decode('utf-8')
+                    job.finished_at = datetime.utcnow()
+                    db.session.commit()
+                    break
+                job.updated_at = datetime.utcnow()
+                db.session.commit()
+                # Let the writers waiting on the lock in before the next chunk
+                time.sleep(pause)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            _begin_write()
+            job.status = 'failed'
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+        finally:
+            db.session.remove()
+            if lease is not None:
+                _release_lease(lease, job_id)
+        if self._after_commit:
+            self._after_commit()
+        return True
+
+    def _config(self, key, default):
+        return current_app.config.get(key, os.environ.get(key, default))
@@ -0,0 +1,121 @@
+"""Point-in-time stock from the stock_movements ledger.
+
+Every change to TShirt.quantity appends a StockMovement in the same
+transaction (see models.take_stock and friends), so stock at any moment is
+the sum of the movements recorded up to it. take_snapshot() periodically
+folds the ledger into per-SKU StockSnapshot rows; stock_at() then starts
+from the latest snapshot taken before the requested time and adds only the
+movements recorded after it, never the full history.
+
+A snapshot covers every movement with an id up to its movement_id, and its
+taken_at is the newest created_at among them, so it can be used for any
+time at or after taken_at. Schedule ``flask --app app snapshot-stock``
+(e.g. hourly or nightly) to keep the tails short.
+"""
+from datetime import datetime
+
+from models import db, StockMovement, StockSnapshot
+
+
+def take_snapshot():
+    """Fold the movements since the last snapshot into a new one.
+
+    Runs in the caller's transaction; the caller commits. Returns the number
+    of SKUs in the new snapshot, or 0 when nothing moved since the last one.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        # Movement ids are handed out before commit: wait for in-flight
+        # writers so no id below the watermark can still appear later
+        db.session.execute(db.text('LOCK TABLE stock_movements IN SHARE MODE'))
+    previous = db.session.execute(db.select(db.func.max(StockSnapshot.movement_id))).scalar() or 0
+    watermark, taken_at = db.session.execute(
+        db.select(db.func.max(StockMovement.id), db.func.max(StockMovement.created_at))
+    ).one()
+    if watermark is None or watermark == previous:
+        return 0
+
+    levels = _levels_query(previous, StockMovement.id <= watermark)
+    result = db.session.execute(db.insert(StockSnapshot).from_select(
+        ['movement_id', 'tshirt_id', 'quantity', 'taken_at'],
+        db.select(db.literal(watermark), levels.c.tshirt_id, levels.c.quantity,
+                  db.literal(taken_at, db.DateTime))
+    ))
+    return result.rowcount
+
+
+def _levels_query(base, *tail_filters):
+    """Per-SKU quantity: snapshot base plus the movements after it matching tail_filters"""
+    snapshot = db.select(StockSnapshot.tshirt_id, StockSnapshot.quantity.label('delta')) \
+        .where(StockSnapshot.movement_id == base)
+    tail = db.select(StockMovement.tshirt_id, StockMovement.delta) \
+        .where(StockMovement.id > base, *tail_filters)
+    combined = db.union_all(snapshot, tail).subquery('combined')
+    return db.select(
+        combined.c.tshirt_id, db.func.sum(combined.c.delta).label('quantity')
+    ).group_by(combined.c.tshirt_id).subquery('levels')
+
+
+def _snapshot_before(at):
+    """(movement_id, taken_at) of the latest snapshot usable at time at"""
+    row = db.session.execute(
+        db.select(StockSnapshot.movement_id, StockSnapshot.taken_at)
+        .where(StockSnapshot.taken_at <= at)
+        .order_by(StockSnapshot.movement_id.desc()).limit(1)
+    ).first()
+    return (row.movement_id, row.taken_at) if row else (0, None)
+
+
+def stock_at_query(at):
+    """Subquery of (tshirt_id, quantity) as stock stood at time at.
+
+    The tail is bounded by the next snapshot's watermark as well as by time,
+    so it is read through the primary key between two snapshots.
+    """
+    base, _ = _snapshot_before(at)
+    tail_filters = [StockMovement.created_at <= at]
+    following = db.session.execute(
+        db.select(db.func.min(StockSnapshot.movement_id)).where(StockSnapshot.movement_id > base)
+    ).scalar()
+    if following is not None:
+        tail_filters.append(StockMovement.id <= following)
+    return _levels_query(base, *tail_filters)
+
+
+def stock_at(at=None):
+    """Dict of tshirt_id -> quantity at time at (default: now)"""
+    levels = stock_at_query(at or datetime.utcnow())
+    return dict(db.session.execute(db.select(levels.c.tshirt_id, levels.c.quantity)).all())
+
+
+def movement_report(date_from, date_to):
+    """Opening stock, movements by reason and closing stock per SKU.
+
+    Covers movements with date_from <= created_at < date_to. Opening stock
+    comes from stock_at(); the window itself is read through the created_at
+    index. SKUs with neither stock nor movements are left out.
+    """
+    opening = stock_at(date_from)
+    moved = db.session.execute(
+        db.select(StockMovement.tshirt_id, StockMovement.reason, db.func.sum(StockMovement.delta))
+        .where(StockMovement.created_at >= date_from, StockMovement.created_at < date_to)
+        .group_by(StockMovement.tshirt_id, StockMovement.reason)
+    ).all()
+
+    by_sku = {}
+    for tshirt_id, reason, delta in moved:
+        by_sku.setdefault(tshirt_id, {})[reason] = delta
+    report = []
+    for tshirt_id in sorted(set(opening) | set(by_sku)):
+        reasons = by_sku.get(tshirt_id, {})
+        start = opening.get(tshirt_id, 0)
+        if not start and not reasons:
+            continue
+        net = sum(reasons.values())
+        report.append({
+            'tshirt_id': tshirt_id,
+            'opening': start,
+            'movements': reasons,
+            'net': net,
+            'closing': start + net
+        })
+    return report
@@ -0,0 +1,410 @@
+"""Database models and the data-access helpers shared by the API and scripts"""
+from flask_sqlalchemy import SQLAlchemy
+from replica import RoutingSession
+from datetime import datetime
+import itertools
+import json
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+class TShirt(db.Model):
+    __tablename__ = 'tshirts'
+    __table_args__ = (
+        # One row per SKU
+        db.Index('uq_tshirts_sku', 'design_name', 'size', 'color', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    design_name = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.String(5), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    color = db.Column(db.String(20), default='White')  # Default color is white
+
+    # Method to get total quantity for a design
+    @classmethod
+    def get_design_total(cls, design_name):
+        return db.session.query(cls).filter_by(design_name=design_name).all()
+
+class OrderHeader(db.Model):
+    """A checkout grouping several order lines for one customer"""
+    __tablename__ = 'order_headers'
+    id = db.Column(db.Integer, primary_key=True)
+    customer_name = db.Column(db.String(100), nullable=False)
+    customer_phone = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), default='pending')
+    order_date = db.Column(db.DateTime, default=datetime.utcnow)
+    lines = db.relationship('Order', backref='header')
+
+# Characters ignored when matching phone numbers to customers
+PHONE_SEPARATORS = ' -().'
+
+def normalize_phone(phone):
+    """The phone number customers are matched on, or None for no number"""
+    phone = ''.join(ch for ch in (phone or '') if ch not in PHONE_SEPARATORS)
+    return phone or None
+
+class Customer(db.Model):
+    """A customer, identified by phone number or, without one, by name.
+
+    Orders reference their customer and keep their own copy of the name and
+    phone as entered. The lifetime totals are kept in step with the orders
+    (see customers.py), so customer pages read one row instead of scanning
+    orders.
+    """
+    __tablename__ = 'customers'
+    __table_args__ = (
+        db.Index('uq_customers_phone', 'phone', unique=True),
+        # Customers without a phone number are told apart by name
+        db.Index('uq_customers_name_no_phone', 'name', unique=True,
+                 sqlite_where=db.text('phone IS NULL'), postgresql_where=db.text('phone IS NULL')),
+        db.Index('ix_customers_name', 'name'),
+        db.Index('ix_customers_last_order_at', 'last_order_at'),
+        db.Index('ix_customers_first_order_at', 'first_order_at'),
+        db.Index('ix_customers_total_spent', 'total_spent'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    phone = db.Column(db.String(20))
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    total_spent = db.Column(db.Float, nullable=False, default=0)
+    first_order_at = db.Column(db.DateTime)
+    last_order_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Order(db.Model):
+    __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_tshirt_id', 'tshirt_id'),
+        db.Index('ix_orders_order_date', 'order_date'),
+        db.Index('ix_orders_status_order_date', 'status', 'order_date'),
+        db.Index('ix_orders_customer_id_order_date', 'customer_id', 'order_date'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    header_id = db.Column(db.Integer, db.ForeignKey('order_headers.id'))
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'))
+    customer_name = db.Column(db.String(100), nullable=False)
+    customer_phone = db.Column(db.String(20), nullable=False)
+    tshirt_id = db.Column(db.Integer, db.ForeignKey('tshirts.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default='pending')
+    order_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # The t-shirt price when the order was placed, which the sales rollup and
+    # customer spend were credited with
+    unit_price = db.Column(db.Float)
+    tshirt = db.relationship('TShirt', backref='orders')
+
+class SalesDaily(db.Model):
+    """Per-day, per-t-shirt sales rollup kept in step with the orders table.
+
+    Reports read from here instead of scanning orders, so their cost depends
+    on the number of days and SKUs rather than the number of orders.
+    """
+    __tablename__ = 'sales_daily'
+    day = db.Column(db.Date, primary_key=True)
+    tshirt_id = db.Column(db.Integer, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+class CacheVersion(db.Model):
+    """Version stamps shared by all workers for invalidating local caches"""
+    __tablename__ = 'cache_versions'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class StockMovement(db.Model):
+    """Append-only ledger of every change to TShirt.quantity.
+
+    Rows are only ever inserted, in the same transaction as the quantity
+    change they describe, so the sum of deltas for a SKU always equals its
+    current quantity. TShirt.quantity stays as the fast read cache.
+    """
+    __tablename__ = 'stock_movements'
+    __table_args__ = (
+        db.Index('ix_stock_movements_tshirt_id_created_at', 'tshirt_id', 'created_at'),
+        db.Index('ix_stock_movements_created_at', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign key: history outlives SKUs removed by a catalog reset
+    tshirt_id = db.Column(db.Integer, nullable=False)
+    delta = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)
+    ref_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class StockSnapshot(db.Model):
+    """Per-SKU stock as of the movement with id movement_id.
+
+    Point-in-time stock is the latest snapshot taken before the requested
+    time plus the movements recorded after it, see ledger.py.
+    """
+    __tablename__ = 'stock_snapshots'
+    __table_args__ = (
+        db.Index('ix_stock_snapshots_taken_at', 'taken_at'),
+    )
+    movement_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    tshirt_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False)
+
+def record_movement(tshirt_id, delta, reason, ref_id=None):
+    """Append one stock movement in the caller's transaction"""
+    db.session.execute(db.insert(StockMovement).values(
+        tshirt_id=tshirt_id, delta=delta, reason=reason, ref_id=ref_id,
+        created_at=datetime.utcnow()
+    ))
+
+def record_stock_levels(sign, reason, skus=None):
+    """Append a movement of sign * quantity for every SKU holding stock.
+
+    Used around bulk catalog loads: sign=-1 before the load takes the old
+    quantities out of the ledger and sign=1 afterwards puts the new ones in,
+    so the net movement per SKU is new minus old. One INSERT ... SELECT.
+    skus, a list of (design_name, size, color), limits it to those SKUs.
+    """
+    levels = db.select(TShirt.id, sign * TShirt.quantity, db.literal(reason),
+                       db.literal(datetime.utcnow(), db.DateTime)).where(TShirt.quantity != 0)
+    if skus is not None:
+        levels = levels.where(db.tuple_(TShirt.design_name, TShirt.size, TShirt.color).in_(skus))
+    db.session.execute(db.insert(StockMovement).from_select(
+        ['tshirt_id', 'delta', 'reason', 'created_at'], levels))
+
+def bump_cache_version(name):
+    """Advance a version stamp in the caller's transaction"""
+    result = db.session.execute(
+        db.update(CacheVersion)
+        .where(CacheVersion.name == name)
+        .values(version=CacheVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        db.session.add(CacheVersion(name=name, version=1))
+
+def get_cache_version(name):
+    return db.session.query(CacheVersion.version).filter_by(name=name).scalar() or 0
+
+class ChangeEvent(db.Model):
+    """Committed inventory and order changes, read by the /api/stream poller"""
+    __tablename__ = 'change_events'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Job(db.Model):
+    """A bulk operation run in the background, and its progress (see jobs.py)"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_id', 'status', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    # queued, running, succeeded or failed
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    params = db.Column(db.Text, nullable=False)
+    done = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    # Advanced with every committed chunk while running
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+# The newest CHANGE_EVENT_RETENTION events are kept for reconnecting streams;
+# every CHANGE_EVENT_PRUNE_EVERY events published, a worker deletes older ones
+CHANGE_EVENT_RETENTION = 10000
+CHANGE_EVENT_PRUNE_EVERY = 1000
+_published = itertools.count(1)
+
+def publish_change(kind, **payload):
+    """Queue a change event in the caller's transaction"""
+    db.session.add(ChangeEvent(kind=kind, payload=json.dumps(payload)))
+    if next(_published) % CHANGE_EVENT_PRUNE_EVERY == 0:
+        prune_change_events()
+
+def prune_change_events(retention=CHANGE_EVENT_RETENTION):
+    """Delete all but the newest retention change events, in the caller's transaction"""
+    newest = db.session.query(db.func.max(ChangeEvent.id)).scalar_subquery()
+    return db.session.query(ChangeEvent).filter(ChangeEvent.id <= newest - retention) \
+        .delete(synchronize_session=False)
+
+def committed_changes(after_id=None, limit=None):
+    """Change events with ids above after_id in id order, as (id, kind, payload) rows.
+
+    Without after_id, returns the newest id instead (0 when there are none).
+    Change event ids come from a sequence on Postgres and are handed out
+    before commit, so a transaction holding a lower id can commit after a
+    higher one has been read. Taking the table in SHARE mode first waits for
+    transactions that are inserting events, so every id up to the newest one
+    seen here is final. The caller ends the transaction soon after, which
+    releases the lock. SQLite commits one writer at a time, in id order.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text('LOCK TABLE change_events IN SHARE MODE'))
+    if after_id is None:
+        return db.session.query(db.func.max(ChangeEvent.id)).scalar() or 0
+    query = db.select(ChangeEvent.id, ChangeEvent.kind, ChangeEvent.payload) \
+        .where(ChangeEvent.id > after_id).order_by(ChangeEvent.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return db.session.execute(query).all()
+
+def publish_stock(tshirt_id):
+    """Publish the current stock of a t-shirt as seen by this transaction"""
+    quantity = db.session.query(TShirt.quantity).filter_by(id=tshirt_id).scalar()
+    publish_change('stock', tshirt_id=tshirt_id, quantity=quantity)
+
+def dialect_insert(table):
+    """INSERT into table that supports on_conflict_do_update() on this database"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+def _sales_rollup_upsert():
+    """INSERT into sales_daily that adds to an existing (day, tshirt_id) row"""
+    table = SalesDaily.__table__
+    stmt = dialect_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.tshirt_id],
+        set_={
+            'order_count': table.c.order_count + stmt.excluded.order_count,
+            'units': table.c.units + stmt.excluded.units,
+            'revenue': table.c.revenue + stmt.excluded.revenue
+        }
+    )
+
+def record_sale(tshirt, quantity, order_date, sign=1, unit_price=None):
+    """Add (sign=1) or remove (sign=-1) one order from the sales rollup.
+
+    unit_price defaults to the t-shirt's current price; removals pass the
+    order's own unit_price so they take out what was added. Runs in the
+    caller's session so the rollup commits or rolls back together with the
+    order itself.
+    """
+    if unit_price is None:
+        unit_price = tshirt.price
+    db.session.execute(_sales_rollup_upsert(), {
+        'day': order_date.date(),
+        'tshirt_id': tshirt.id,
+        'order_count': sign,
+        'units': sign * quantity,
+        'revenue': sign * quantity * unit_price
+    })
+
+def record_sales(totals):
+    """Add pre-aggregated sales to the rollup with one executemany.
+
+    totals maps (day, tshirt_id) to [order_count, units, revenue]. Runs in
+    the caller's session, like record_sale().
+    """
+    if totals:
+        db.session.execute(_sales_rollup_upsert(), [{
+            'day': day,
+            'tshirt_id': tshirt_id,
+            'order_count': order_count,
+            'units': units,
+            'revenue': revenue
+        } for (day, tshirt_id), (order_count, units, revenue) in totals.items()])
+
+def rebuild_sales_rollup(source=None):
+    """Recompute the sales rollup from the orders table in one pass.
+
+    source is the table or view to read orders from (default: the orders
+    table); pass the orders_all view to include archived orders. Orders
+    without a unit_price are counted at the t-shirt's current price.
+    """
+    orders = Order.__table__ if source is None else source
+    SalesDaily.query.delete()
+    day = db.func.date(orders.c.order_date)
+    rows = db.session.query(
+        day, orders.c.tshirt_id, db.func.count(orders.c.id),
+        db.func.sum(orders.c.quantity),
+        db.func.sum(orders.c.quantity * db.func.coalesce(orders.c.unit_price, TShirt.price))
+    ).select_from(orders).join(TShirt, orders.c.tshirt_id == TShirt.id) \
+        .group_by(day, orders.c.tshirt_id).all()
+    if rows:
+        db.session.execute(db.insert(SalesDaily), [{
+            'day': d if not isinstance(d, str) else datetime.strptime(d, '%Y-%m-%d').date(),
+            'tshirt_id': tshirt_id,
+            'order_count': count,
+            'units': units,
+            'revenue': revenue
+        } for d, tshirt_id, count, units, revenue in rows])
+    db.session.commit()
+    return len(rows)
+
+def take_stock(tshirt_id, quantity, reason='order', ref_id=None):
+    """Atomically remove quantity units of a t-shirt from stock.
+
+    The availability check and the decrement are one conditional UPDATE, so
+    concurrent orders in different workers can never drive stock negative.
+    Returns False, leaving stock untouched, when not enough units are left.
+    The movement is recorded in the ledger in the same transaction.
+    """
+    result = db.session.execute(
+        db.update(TShirt)
+        .where(TShirt.id == tshirt_id, TShirt.quantity >= quantity)
+        .values(quantity=TShirt.quantity - quantity)
+    )
+    if result.rowcount != 1:
+        return False
+    record_movement(tshirt_id, -quantity, reason, ref_id)
+    return True
+
+def return_stock(tshirt_id, quantity, reason='order_deleted', ref_id=None):
+    """Atomically put quantity units of a t-shirt back into stock"""
+    result = db.session.execute(
+        db.update(TShirt)
+        .where(TShirt.id == tshirt_id)
+        .values(quantity=TShirt.quantity + quantity)
+    )
+    if result.rowcount == 1:
+        record_movement(tshirt_id, quantity, reason, ref_id)
+
+class DuplicateSKUError(RuntimeError):
+    """Existing t-shirts share a SKU, so the unique SKU index cannot be built"""
+
+def _check_unique_skus(limit=20):
+    duplicates = db.session.query(TShirt.design_name, TShirt.size, TShirt.color, db.func.count()) \
+        .group_by(TShirt.design_name, TShirt.size, TShirt.color) \
+        .having(db.func.count() > 1).limit(limit).all()
+    db.session.rollback()
+    if duplicates:
+        listed = '; '.join(f'{design} / {size} / {color} ({count} rows)'
+                           for design, size, color, count in duplicates)
+        raise DuplicateSKUError(
+            f'Cannot add the unique SKU index: these t-shirts are duplicated (first {limit} shown): '
+            f'{listed}. Merge or delete the extra rows, then run flask --app app migrate-db.')
+
+def migrate_schema():
+    """Bring an existing SQLite or Postgres database up to the current models.
+
+    create_all() only creates missing tables, so columns and indexes added to
+    tables that already exist are applied here. Safe to run repeatedly.
+    """
+    db.create_all()
+    inspector = db.inspect(db.engine)
+    if 'uq_tshirts_sku' not in {i['name'] for i in inspector.get_indexes('tshirts')}:
+        _check_unique_skus()
+    existing = {c['name'] for c in inspector.get_columns('orders')}
+    with db.engine.begin() as conn:
+        if 'header_id' not in existing:
+            conn.execute(db.text(
+                'ALTER TABLE orders ADD COLUMN header_id INTEGER REFERENCES order_headers(id)'))
+        if 'customer_id' not in existing:
+            conn.execute(db.text(
+                'ALTER TABLE orders ADD COLUMN customer_id INTEGER REFERENCES customers(id)'))
+        if 'unit_price' not in existing:
+            conn.execute(db.text('ALTER TABLE orders ADD COLUMN unit_price FLOAT'))
+            # The rollup was built at today's prices, so deleting an older
+            # order takes out what it holds for it
+            conn.execute(db.text(
+                'UPDATE orders SET unit_price = '
+                '(SELECT price FROM tshirts WHERE tshirts.id = orders.tshirt_id)'))
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
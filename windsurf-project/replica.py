@@ -0,0 +1,175 @@
+"""Routing of read-only requests to a replica database.
+
+With READ_REPLICA_URL set (config key, else environment variable), the
+SELECTs of GET and HEAD requests run on a second engine, so catalog, order
+list and report reads stop competing with checkouts for the primary's
+connections.
+
+    Postgres  READ_REPLICA_URL points at a streaming replica. Its sessions
+              default to read-only transactions.
+    SQLite    READ_REPLICA_URL may be the primary's own URL: reads then get
+              their own pool of query_only connections, which in WAL mode
+              read the last committed snapshot without waiting for writers.
+
+Everything else stays on the primary: requests other than GET and HEAD,
+views marked @primary_only, raw SQL and writes, and every statement after
+the session's first write. Replica reads are at most READ_REPLICA_MAX_LAG
+seconds (default 5) behind the primary:
+
+- The replica's replay lag is checked at most once a second per worker.
+  While it is over the bound, or unknown because the replica is down, reads
+  go to the primary.
+- A successful write answers with a cookie that keeps the client's reads on
+  the primary for READ_REPLICA_MAX_LAG seconds, so it reads its own writes.
+  Cross-origin clients, which do not send the cookie back, get the same
+  number of seconds in an X-Read-Primary response header and send
+  X-Read-Primary with their requests until then.
+"""
+import math
+import os
+import threading
+import time
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+from instrumentation import get_logger
+
+REPLICA_BIND = 'replica'
+DEFAULT_MAX_LAG = 5.0
+LAG_CHECK_INTERVAL = 1.0
+PRIMARY_COOKIE = 'read_primary'
+PRIMARY_HEADER = 'X-Read-Primary'
+READ_METHODS = ('GET', 'HEAD')
+# Requests that never write, so need no read-your-writes cookie
+SAFE_METHODS = READ_METHODS + ('OPTIONS',)
+
+# Zero while the standby has replayed everything it received: an idle
+# primary leaves the last replay timestamp old without any lag
+POSTGRES_LAG_SQL = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+logger = get_logger()
+
+
+def replica_url(config):
+    """The READ_REPLICA_URL of an app config or the environment, or None"""
+    return config.get('READ_REPLICA_URL') or os.environ.get('READ_REPLICA_URL') or None
+
+
+def max_lag(config):
+    value = config.get('READ_REPLICA_MAX_LAG')
+    if value is None:
+        value = os.environ.get('READ_REPLICA_MAX_LAG', DEFAULT_MAX_LAG)
+    return float(value)
+
+
+def primary_only(view):
+    """Keep every statement of a GET view on the primary"""
+    view.primary_only = True
+    return view
+
+
+class RoutingSession(Session):
+    """db.session, sending SELECTs to the replica in requests routed there"""
+
+    _wrote = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context() and g.get('read_replica'):
+            if getattr(clause, 'is_select', False) and getattr(clause, '_for_update_arg', None) is None \
+                    and not self._wrote:
+                return self._db.engines[REPLICA_BIND]
+            # Read your own writes for the rest of the session
+            self._wrote = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaLag:
+    """Whether the replica is within the staleness bound, rechecked once a second"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._fresh = False
+
+    def fresh(self, engine, bound):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_check:
+                return self._fresh
+            # Other requests use the previous answer while this one checks
+            self._next_check = now + LAG_CHECK_INTERVAL
+        try:
+            lag = _replica_lag(engine)
+        except Exception as e:
+            logger.warning(f"Replica lag check failed, reading from the primary: {e}")
+            lag = None
+        fresh = lag is not None and lag <= bound
+        if not fresh and lag is not None:
+            logger.warning(f"Replica is {lag:.1f}s behind, reading from the primary")
+        with self._lock:
+            self._fresh = fresh
+        return fresh
+
+
+def _replica_lag(engine):
+    """Seconds the replica is behind the primary"""
+    if engine.dialect.name != 'postgresql':
+        # A SQLite replica reads the primary's own file
+        return 0.0
+    with engine.connect() as conn:
+        lag = conn.execute(sa.text(POSTGRES_LAG_SQL)).scalar()
+    # NULL when the replica URL is not a standby at all
+    return float(lag or 0)
+
+
+def init_read_routing(app, db):
+    """Route the reads of app's GET requests to the replica bind, if configured.
+
+    create_app() adds READ_REPLICA_URL to SQLALCHEMY_BINDS; call this after
+    the other engine hooks so replica connections are made read-only last.
+    """
+    with app.app_context():
+        engine = db.engines.get(REPLICA_BIND)
+    if engine is None:
+        return None
+
+    bound = max_lag(app.config)
+    lag = ReplicaLag()
+
+    def _read_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if engine.dialect.name == 'sqlite':
+                cursor.execute('PRAGMA query_only=ON')
+            else:
+                cursor.execute('SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY')
+        finally:
+            cursor.close()
+        if engine.dialect.name != 'sqlite':
+            dbapi_connection.commit()
+
+    event.listen(engine, 'connect', _read_only)
+
+    @app.before_request
+    def _route_reads():
+        view = current_app.view_functions.get(request.endpoint)
+        g.read_replica = (request.method in READ_METHODS
+                          and not getattr(view, 'primary_only', False)
+                          and PRIMARY_COOKIE not in request.cookies
+                          and PRIMARY_HEADER not in request.headers
+                          and lag.fresh(engine, bound))
+
+    @app.after_request
+    def _pin_writers(response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=math.ceil(bound), httponly=True, samesite='Lax')
+            response.headers[PRIMARY_HEADER] = str(math.ceil(bound))
+        return response
+
+    return engine
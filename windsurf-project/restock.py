@@ -0,0 +1,138 @@
+"""Restock policies applied as set-based statements.
+
+Each policy is a query that yields a restock amount per SKU. apply_restock()
+adds those amounts to stock with one UPDATE ... FROM and appends the
+matching stock_movements rows with one INSERT ... SELECT; plan_restock()
+runs the same query as a SELECT, for dry runs. Python never loops over SKUs.
+
+Policies:
+    threshold  SKUs below ``threshold`` units get ``amount`` more units
+    target     SKUs below ``target`` units are brought up to ``target``
+    velocity   SKUs are brought up to the units they sold per day over the
+               last ``window_days`` times ``cover_days``, and never below
+               ``min_stock``. Sales come from the sales_daily rollup, so the
+               cost depends on SKUs and days, not on the number of orders.
+"""
+from datetime import date, datetime, timedelta
+
+from models import db, TShirt, SalesDaily, StockMovement
+
+POLICIES = {
+    'threshold': {'threshold': 5, 'amount': 3},
+    'target': {'target': 10},
+    'velocity': {'window_days': 28, 'cover_days': 14, 'min_stock': 2},
+}
+
+
+def resolve_policy(name, params=None):
+    """Validate a policy name and its parameters, filling in defaults"""
+    name = name or 'threshold'
+    if name not in POLICIES:
+        raise ValueError(f'Unknown restock policy {name!r}; expected one of {sorted(POLICIES)}')
+    params = params or {}
+    resolved = {}
+    for key, default in POLICIES[name].items():
+        value = params.get(key, default)
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{key} must be an integer')
+        if value < 0 or (key in ('window_days', 'cover_days', 'amount') and value == 0):
+            raise ValueError(f'{key} must be positive')
+        resolved[key] = value
+    return name, resolved
+
+
+def _plan_query(name, params, id_range=None):
+    """SELECT of (tshirt_id, restock) for every SKU the policy restocks.
+
+    id_range, a (first, last) pair of t-shirt ids, limits it to those SKUs.
+    """
+    quantity = TShirt.quantity
+    in_range = TShirt.id.between(*id_range) if id_range else db.true()
+    if name == 'threshold':
+        restock = db.literal(params['amount'])
+        return db.select(TShirt.id.label('tshirt_id'), restock.label('restock')).where(
+            quantity < params['threshold'], in_range)
+
+    if name == 'target':
+        target = db.literal(params['target'])
+        return db.select(TShirt.id.label('tshirt_id'), (target - quantity).label('restock')).where(
+            quantity < target, in_range)
+
+    window, cover = params['window_days'], params['cover_days']
+    since = date.today() - timedelta(days=window)
+    sales = (db.select(SalesDaily.tshirt_id, db.func.sum(SalesDaily.units).label('units'))
+             .where(SalesDaily.day >= since,
+                    SalesDaily.tshirt_id.between(*id_range) if id_range else db.true())
+             .group_by(SalesDaily.tshirt_id)
+             .subquery('sales'))
+    # Integer ceiling of units * cover / window, the same on SQLite and Postgres
+    covered = (db.func.coalesce(sales.c.units, 0) * cover + (window - 1)) // window
+    min_stock = db.literal(params['min_stock'])
+    target = db.case((covered > min_stock, covered), else_=min_stock)
+    return (db.select(TShirt.id.label('tshirt_id'), (target - quantity).label('restock'))
+            .select_from(TShirt.__table__.outerjoin(sales, sales.c.tshirt_id == TShirt.id))
+            .where(quantity < target, in_range))
+
+
+def plan_restock(name, params=None):
+    """Return the adjustments a policy would make, without changing stock"""
+    name, params = resolve_policy(name, params)
+    plan = _plan_query(name, params).subquery('plan')
+    rows = db.session.execute(
+        db.select(TShirt.id, TShirt.design_name, TShirt.size, TShirt.color,
+                  TShirt.quantity, plan.c.restock)
+        .join(plan, plan.c.tshirt_id == TShirt.id)
+        .order_by(TShirt.id)
+    ).all()
+    return [{
+        'tshirt_id': row.id,
+        'design_name': row.design_name,
+        'size': row.size,
+        'color': row.color,
+        'quantity': row.quantity,
+        'restock': row.restock,
+        'new_quantity': row.quantity + row.restock
+    } for row in rows]
+
+
+def apply_restock(name, params=None, id_range=None):
+    """Add the policy's restock amounts to stock in the caller's transaction.
+
+    Amounts are added to the current quantity rather than written as
+    absolute values, so a sale committed concurrently is never overwritten.
+    Each amount is also recorded as a 'restock' stock movement. Returns the
+    number of SKUs restocked. The caller commits. Pass id_range, a (first,
+    last) pair of t-shirt ids, to restock a chunk of the catalog at a time.
+    """
+    name, params = resolve_policy(name, params)
+    plan = _plan_query(name, params, id_range).subquery('plan')
+    ledger_columns = ['tshirt_id', 'delta', 'reason', 'created_at']
+    now = db.literal(datetime.utcnow(), db.DateTime)
+
+    if db.engine.dialect.name == 'postgresql':
+        # One statement: the movements are exactly the rows the UPDATE changed
+        updated = (db.update(TShirt)
+                   .where(TShirt.id == plan.c.tshirt_id)
+                   .values(quantity=TShirt.quantity + plan.c.restock)
+                   .returning(TShirt.id.label('tshirt_id'), plan.c.restock.label('delta'))
+                   .cte('updated'))
+        result = db.session.execute(db.insert(StockMovement).from_select(
+            ledger_columns,
+            db.select(updated.c.tshirt_id, updated.c.delta, db.literal('restock'), now)
+        ))
+        return result.rowcount
+
+    # SQLite has a single writer: once the INSERT holds the write lock no
+    # other transaction can change stock, so the UPDATE sees the same plan
+    db.session.execute(db.insert(StockMovement).from_select(
+        ledger_columns,
+        db.select(plan.c.tshirt_id, plan.c.restock, db.literal('restock'), now)
+    ))
+    result = db.session.execute(
+        db.update(TShirt)
+        .where(TShirt.id == plan.c.tshirt_id)
+        .values(quantity=TShirt.quantity + plan.c.restock)
+    )
+    return result.rowcount
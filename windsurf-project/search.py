@@ -0,0 +1,174 @@
+"""Type-ahead search over t-shirts and customers.
+
+T-shirts are found by design name, color and size, customers by name and
+phone. Every word typed must match the start of a word in one of those
+fields, so "wing bl" finds the black Winging It shirts. A phone number typed
+with spaces or dashes is matched as one number.
+
+    SQLite    FTS5 tables search_tshirts and search_customers index the
+              tshirts and customers tables (external content, prefix
+              indexes for 2 and 3 characters). Triggers on both tables keep
+              them in step, firing only when an indexed field changes, so
+              stock and customer-total updates cost nothing extra.
+    Postgres  GIN indexes on to_tsvector('simple', ...) of the same fields.
+              Postgres maintains expression indexes itself.
+    Fallback  SQLite built without FTS5 gets LIKE matches on word starts,
+              which scan the table.
+
+migrate_search() creates the indexes; tshirt_match() and customer_match()
+return WHERE clauses for queries on TShirt and Customer. Given a limit, they
+only match the newest limit rows that fit, which the index yields without
+reading every match: a two-letter prefix can match much of a large table,
+and type-ahead only shows the first few.
+"""
+import re
+
+from models import PHONE_SEPARATORS, db, normalize_phone, Customer, TShirt
+
+MAX_TERMS = 8
+
+# Indexed fields per table, in the order the FTS5 tables declare them
+SEARCH_FIELDS = {
+    'tshirts': ('design_name', 'color', 'size'),
+    'customers': ('name', 'phone')
+}
+
+_backends = {}
+
+
+def _fts_table(table):
+    return f'search_{table}'
+
+
+def _document(table):
+    """The Postgres tsvector expression indexed for table"""
+    fields = " || ' ' || ".join(f"coalesce({field}, '')" for field in SEARCH_FIELDS[table])
+    return f"to_tsvector('simple', {fields})"
+
+
+def search_terms(q):
+    """The word prefixes to look for in q, lowercased"""
+    q = (q or '').strip()
+    if any(ch.isdigit() for ch in q) and all(ch.isdigit() or ch in PHONE_SEPARATORS for ch in q):
+        # A phone number, however it was typed
+        return [normalize_phone(q)]
+    return re.findall(r'\w+', q.lower())[:MAX_TERMS]
+
+
+def _sqlite_has_fts5(conn):
+    try:
+        conn.exec_driver_sql('CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)')
+    except Exception:
+        return False
+    conn.exec_driver_sql('DROP TABLE temp._fts5_probe')
+    return True
+
+
+def search_backend():
+    """'fts5', 'tsvector' or 'like' for the current database"""
+    engine = db.engine
+    backend = _backends.get(engine.url)
+    if backend is None:
+        if engine.dialect.name == 'postgresql':
+            backend = 'tsvector'
+        else:
+            with engine.connect() as conn:
+                backend = 'fts5' if _sqlite_has_fts5(conn) else 'like'
+        _backends[engine.url] = backend
+    return backend
+
+
+def _sqlite_triggers(table):
+    fts = _fts_table(table)
+    fields = SEARCH_FIELDS[table]
+    columns = ', '.join(fields)
+    new = ', '.join(f'new.{field}' for field in fields)
+    old = ', '.join(f'old.{field}' for field in fields)
+    changed = ' OR '.join(f'old.{field} IS NOT new.{field}' for field in fields)
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN '
+        f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new}); END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old}); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {columns} ON {table} '
+        f'WHEN {changed} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old}); "
+        f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new}); END',
+    ]
+
+
+def migrate_search():
+    """Create the search indexes, and fill new ones from existing rows.
+
+    Run after migrate_schema(). Safe to run repeatedly.
+    """
+    backend = search_backend()
+    if backend == 'like':
+        return
+    with db.engine.begin() as conn:
+        for table in SEARCH_FIELDS:
+            if backend == 'tsvector':
+                conn.execute(db.text(f'CREATE INDEX IF NOT EXISTS ix_{table}_search '
+                                     f'ON {table} USING gin (({_document(table)}))'))
+                continue
+            fts = _fts_table(table)
+            exists = conn.execute(db.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': fts}).first()
+            conn.execute(db.text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({', '.join(SEARCH_FIELDS[table])}, "
+                f"content='{table}', content_rowid='id', prefix='2 3')"))
+            for trigger in _sqlite_triggers(table):
+                conn.execute(db.text(trigger))
+            if not exists:
+                conn.execute(db.text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def rebuild_search():
+    """Reindex every t-shirt and customer from scratch (SQLite only)"""
+    if search_backend() != 'fts5':
+        return False
+    with db.engine.begin() as conn:
+        for table in SEARCH_FIELDS:
+            fts = _fts_table(table)
+            conn.execute(db.text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+    return True
+
+
+def _match(model, table, terms, limit):
+    backend = search_backend()
+    if backend == 'fts5':
+        fts = _fts_table(table)
+        rowid = db.literal_column('rowid')
+        # Quoted, so FTS5 reads every term as a plain prefix
+        query = ' '.join(f'"{term}"*' for term in terms)
+        matches = db.select(rowid).select_from(db.table(fts)) \
+            .where(db.literal_column(fts).op('MATCH')(db.bindparam(f'{table}_search', query)))
+        if limit is not None:
+            # Doclists are in rowid order, so FTS5 stops after limit rows
+            matches = matches.order_by(rowid.desc()).limit(limit)
+        return model.id.in_(matches)
+
+    if backend == 'tsvector':
+        query = ' & '.join(f'{term}:*' for term in terms)
+        clause = db.literal_column(_document(table)).op('@@')(
+            db.func.to_tsquery('simple', db.bindparam(f'{table}_search', query)))
+    else:
+        columns = [getattr(model, field) for field in SEARCH_FIELDS[table]]
+        clause = db.and_(*[
+            db.or_(*[db.or_(column.istartswith(term, autoescape=True),
+                            column.icontains(' ' + term, autoescape=True)) for column in columns])
+            for term in terms
+        ])
+    if limit is None:
+        return clause
+    return model.id.in_(db.select(model.id).where(clause).order_by(model.id.desc()).limit(limit))
+
+
+def tshirt_match(terms, limit=None):
+    """WHERE clause for t-shirts matching every term of search_terms()"""
+    return _match(TShirt, 'tshirts', terms, limit)
+
+
+def customer_match(terms, limit=None):
+    """WHERE clause for customers matching every term of search_terms()"""
+    return _match(Customer, 'customers', terms, limit)
@@ -0,0 +1,148 @@
+"""JSON encoding and response compression for the API.
+
+dumps() encodes to compact UTF-8 bytes with orjson when it is installed and
+falls back to the standard library otherwise (or when JSON_BACKEND=json).
+FastJSONProvider makes jsonify() use the same encoder. Dates, datetimes and
+Decimals are encoded the same way by both backends.
+
+init_compression() compresses responses above a size threshold with brotli
+or gzip, whichever the client prefers and the server supports. Streamed
+responses such as /api/stream are left alone.
+"""
+import gzip
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import request
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # stdlib json is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+BACKEND = 'orjson' if orjson is not None and os.environ.get('JSON_BACKEND', 'orjson') == 'orjson' else 'json'
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'application/x-ndjson')
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if BACKEND == 'orjson':
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(obj):
+        """Encode obj as compact JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=_default)
+
+    def dumps(obj):
+        """Encode obj as compact JSON bytes"""
+        return _encoder.encode(obj).encode('utf-8')
+
+    loads = json.loads
+
+
+def records(fields, rows):
+    """Pair column tuples from a query with field names for encoding.
+
+    Builds one dict per row, for clients that expect a list of objects;
+    columns() encodes the tuples as they are.
+    """
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def columns(fields, rows):
+    """Column tuples from a query as {'fields': [...], 'rows': [[...], ...]}"""
+    return {'fields': fields, 'rows': [tuple(row) for row in rows]}
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by dumps()/loads() above"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype='application/json')
+
+
+def _negotiate(accept_encoding):
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, or None"""
+    best, best_q = None, 0.0
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name == 'br' and brotli is None:
+            continue
+        if name not in ('br', 'gzip') or q <= 0:
+            continue
+        # Equal preference goes to brotli, which is smaller at the same speed
+        if q > best_q or (q == best_q and name == 'br'):
+            best, best_q = name, q
+    return best
+
+
+def init_compression(app, min_size=None, gzip_level=None, brotli_quality=None):
+    """Compress app's responses for clients that accept it.
+
+    Bodies smaller than COMPRESS_MIN_SIZE bytes (default 1024) are sent as
+    they are. Strong ETags become weak on compressed responses, since the
+    bytes differ from the identity encoding.
+    """
+    min_size = min_size or app.config.get('COMPRESS_MIN_SIZE', 1024)
+    gzip_level = gzip_level or app.config.get('COMPRESS_GZIP_LEVEL', 6)
+    brotli_quality = brotli_quality or app.config.get('COMPRESS_BROTLI_QUALITY', 4)
+
+    @app.after_request
+    def _compress(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = _negotiate(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        if encoding == 'br':
+            data = brotli.compress(data, quality=brotli_quality)
+        else:
+            data = gzip.compress(data, compresslevel=gzip_level, mtime=0)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,73 @@
+"""Connection pragmas for running the API on SQLite.
+
+SQLite's defaults (rollback journal, full fsync on every commit, a 2 MB page
+cache) make readers wait behind each commit and make concurrent workers fail
+with "database is locked". init_sqlite_profile() applies one of the profiles
+below to every new connection through an engine connect event.
+
+The profile comes from the SQLITE_PROFILE config key (default: the
+SQLITE_PROFILE environment variable, else 'production'). Individual pragmas
+can be overridden per environment with SQLITE_PRAGMAS, e.g.
+create_app({'SQLITE_PRAGMAS': {'mmap_size': 0}}). Non-SQLite databases are
+left alone.
+"""
+import os
+
+from sqlalchemy import event
+
+SQLITE_PROFILES = {
+    # SQLite and pysqlite defaults, kept for comparison and for debugging
+    'default': {},
+    'production': {
+        # Readers see the last committed snapshot while a writer appends to the WAL
+        'journal_mode': 'WAL',
+        # In WAL mode a crash can lose the last commits but never corrupts the database
+        'synchronous': 'NORMAL',
+        # Wait for a competing writer instead of failing with "database is locked"
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        # Negative values are KiB: 64 MB of page cache per connection
+        'cache_size': -64000,
+        'temp_store': 'MEMORY',
+    },
+}
+
+# journal_mode is stored in the database file, so it goes first
+PRAGMA_ORDER = ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size', 'temp_store')
+
+
+def resolve_pragmas(config):
+    """Return the ordered pragma settings selected by an app config"""
+    name = config.get('SQLITE_PROFILE') or os.environ.get('SQLITE_PROFILE', 'production')
+    if name not in SQLITE_PROFILES:
+        raise ValueError(f'Unknown SQLITE_PROFILE {name!r}; expected one of {sorted(SQLITE_PROFILES)}')
+    pragmas = dict(SQLITE_PROFILES[name])
+    pragmas.update(config.get('SQLITE_PRAGMAS') or {})
+    ordered = [key for key in PRAGMA_ORDER if key in pragmas]
+    ordered += sorted(key for key in pragmas if key not in PRAGMA_ORDER)
+    return [(key, pragmas[key]) for key in ordered]
+
+
+def init_sqlite_profile(app, db):
+    """Apply the configured pragma profile to every SQLite connection of app"""
+    with app.app_context():
+        # The primary and, if configured, the read replica
+        engines = [engine for engine in db.engines.values() if engine.dialect.name == 'sqlite']
+    if not engines:
+        return []
+
+    pragmas = resolve_pragmas(app.config)
+    if not pragmas:
+        return pragmas
+
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for key, value in pragmas:
+                cursor.execute(f'PRAGMA {key}={value}')
+        finally:
+            cursor.close()
+
+    for engine in engines:
+        event.listen(engine, 'connect', _set_pragmas)
+    return pragmas
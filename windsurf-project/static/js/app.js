@@ -15,13 +15,32 @@ const AppState = {
   
   // API base URL - points to the backend server
   apiBaseUrl: 'http://localhost:5008',
+
+  // Until this time, API requests ask to read from the primary database
+  readPrimaryUntil: 0,
+
+  // fetch() for API calls. After a write the API sends X-Read-Primary with a
+  // number of seconds; sending it back until then keeps reads on the primary
+  // (instead of a read replica) so they see the write.
+  async apiFetch(url, options = {}) {
+    const headers = { ...(options.headers || {}) };
+    if (Date.now() < this.readPrimaryUntil) {
+      headers['X-Read-Primary'] = '1';
+    }
+    const response = await fetch(url, { ...options, headers });
+    const seconds = Number(response.headers.get('X-Read-Primary'));
+    if (seconds > 0) {
+      this.readPrimaryUntil = Date.now() + seconds * 1000;
+    }
+    return response;
+  },
   
   // Fetch t-shirts from the API
   async fetchTshirts() {
     try {
       const url = `${this.apiBaseUrl}/api/tshirts`;
       console.log('Fetching t-shirts from:', url);
-      const response = await fetch(url, {
+      const response = await this.apiFetch(url, {
         headers: {
           'Accept': 'application/json',
           'Content-Type': 'application/json'
@@ -156,30 +175,27 @@ const AppState = {
     }
     
     try {
-      // Process all order items
-      const orderPromises = this.cart.map(item => {
-        return fetch(`${this.apiBaseUrl}/api/orders`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-          },
-          body: JSON.stringify({
-            customer_name: this.customerName,
-            customer_phone: this.customerPhone,
-            quantity: item.quantity,
-            tshirt_id: item.id
-          })
-        }).then(response => {
-          if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-          }
-          return response.json();
-        });
+      // Submit the whole cart as one order so it is written in a single transaction
+      const response = await this.apiFetch(`${this.apiBaseUrl}/api/orders/batch`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'application/json'
+        },
+        body: JSON.stringify({
+          customer_name: this.customerName,
+          customer_phone: this.customerPhone,
+          items: this.cart.map(item => ({
+            tshirt_id: item.id,
+            quantity: item.quantity
+          }))
+        })
       });
-
-      // Wait for all orders to complete
-      await Promise.all(orderPromises);
+      
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+      }
       
       // Show success message
       alert('Order completed successfully!');
@@ -214,23 +230,31 @@ const AppState = {
     }
   },
   
-  // Fetch order history
-  async fetchOrders() {
+  // Fetch order history, one page at a time
+  ordersPageSize: 50,
+  ordersCursor: null,
+  
+  async fetchOrders(loadMore = false) {
     try {
-      const response = await fetch(`${this.apiBaseUrl}/api/orders`);
+      const params = new URLSearchParams({ limit: this.ordersPageSize });
+      if (loadMore && this.ordersCursor) {
+        params.set('cursor', this.ordersCursor);
+      }
+      const response = await this.apiFetch(`${this.apiBaseUrl}/api/orders?${params}`);
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
       const data = await response.json();
+      this.ordersCursor = data.next_cursor;
       
       const orderHistoryContent = document.getElementById('order-history-content');
-      if (data.length === 0) {
+      if (!loadMore && data.orders.length === 0) {
         orderHistoryContent.innerHTML = '<p>No orders found</p>';
         return;
       }
       
-      let html = '<div class="order-list">';
-      data.forEach(order => {
+      let html = '';
+      data.orders.forEach(order => {
         html += `
           <div class="order-item">
             <div class="order-header">
@@ -250,9 +274,21 @@ const AppState = {
           </div>
         `;
       });
-      html += '</div>';
       
-      orderHistoryContent.innerHTML = html;
+      let orderList = orderHistoryContent.querySelector('.order-list');
+      if (!loadMore || !orderList) {
+        orderHistoryContent.innerHTML = '<div class="order-list"></div>';
+        orderList = orderHistoryContent.querySelector('.order-list');
+      }
+      orderList.insertAdjacentHTML('beforeend', html);
+      
+      // Offer the next page only when the server reports one
+      const existingMoreBtn = document.getElementById('load-more-orders-btn');
+      if (existingMoreBtn) existingMoreBtn.remove();
+      if (this.ordersCursor) {
+        orderHistoryContent.insertAdjacentHTML('beforeend',
+          '<button id="load-more-orders-btn" class="btn-add" onclick="AppState.fetchOrders(true)">Load more</button>');
+      }
     } catch (error) {
       console.error('Error fetching orders:', error);
       document.getElementById('order-history-content').innerHTML = '<p>Error loading orders</p>';
@@ -269,10 +305,23 @@ const AppState = {
     return this.tshirts.reduce((total, tshirt) => total + (tshirt.quantity * tshirt.price), 0);
   },
   
+  // Bulk updates run as background jobs: wait until the job has finished
+  async waitForJob(response) {
+    let job = await response.json();
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise(resolve => setTimeout(resolve, 500));
+      job = await (await this.apiFetch(`${this.apiBaseUrl}/api/jobs/${job.id}`)).json();
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error);
+    }
+    return job;
+  },
+  
   // Reset the entire inventory
   async resetInventory() {
     try {
-      const response = await fetch(`${this.apiBaseUrl}/api/reset-inventory`, {
+      const response = await this.apiFetch(`${this.apiBaseUrl}/api/reset-inventory`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json'
@@ -280,6 +329,7 @@ const AppState = {
       });
       
       if (response.ok) {
+        await this.waitForJob(response);
         alert('Inventory has been reset successfully!');
         this.fetchTshirts(); // Refresh the display
       } else {
@@ -295,7 +345,7 @@ const AppState = {
   // Update stock based on sales
   async updateStock() {
     try {
-      const response = await fetch(`${this.apiBaseUrl}/api/update-stock`, {
+      const response = await this.apiFetch(`${this.apiBaseUrl}/api/update-stock`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json'
@@ -303,6 +353,7 @@ const AppState = {
       });
       
       if (response.ok) {
+        await this.waitForJob(response);
         alert('Stock has been updated successfully!');
         this.fetchTshirts(); // Refresh the display
       } else {
@@ -315,6 +366,30 @@ const AppState = {
     }
   },
   
+  // Subscribe to server-pushed changes and patch local state instead of refetching
+  subscribeToChanges() {
+    if (!window.EventSource) return;
+    
+    const source = new EventSource(`${this.apiBaseUrl}/api/stream`);
+    source.addEventListener('stock', (event) => {
+      const { tshirt_id, quantity } = JSON.parse(event.data);
+      const tshirt = this.tshirts.find(t => t.id === tshirt_id);
+      if (tshirt) {
+        tshirt.quantity = quantity;
+        this.renderApp();
+      }
+    });
+    source.addEventListener('catalog_reset', () => this.fetchTshirts());
+    
+    const refreshOrders = () => {
+      if (this.view === 'order-history') {
+        this.fetchOrders();
+      }
+    };
+    source.addEventListener('order_created', refreshOrders);
+    source.addEventListener('order_deleted', refreshOrders);
+  },
+  
   // Update header information
   updateHeaderInfo() {
     const totalItemsElement = document.getElementById('total-items');
@@ -570,6 +645,7 @@ document.addEventListener('DOMContentLoaded', () => {
     AppState.updateStock();
   });
   
-  // Fetch t-shirts on load
+  // Fetch t-shirts on load, then keep them current from the change stream
   AppState.fetchTshirts();
+  AppState.subscribeToChanges();
 });
@@ -0,0 +1,279 @@
+"""Streaming bulk export and import of orders and t-shirts as CSV or NDJSON.
+
+Exports read through a server-side cursor in partitions of EXPORT_BATCH_SIZE
+rows and yield each partition as one encoded chunk, so a worker holds one
+partition in memory however many rows go out.
+
+Imports parse the request body as it arrives and write IMPORT_BATCH_SIZE rows
+per executemany INSERT. Orders are committed batch by batch, together with
+their sales rollup and customers, so a long import never holds the write lock for long;
+a bad row stops the import with the earlier batches kept. Imported orders
+are history and leave stock alone. T-shirts are merged into the catalog by
+SKU in one transaction, with the stock changes recorded in the ledger.
+
+Both directions use the same columns, so an export can be imported into
+another database. Exported ids are not imported; rows get new ids.
+"""
+import csv
+import io
+from datetime import datetime
+
+from archive import ORDER_COLUMNS, requested_orders_source
+from catalog import SKU_COLUMNS, load_catalog
+from customers import link_customers
+from models import db, Order, TShirt, bump_cache_version, record_sales, record_stock_levels
+from serialization import dumps, loads
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+NDJSON_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-lines')
+EXPORT_BATCH_SIZE = 5000
+IMPORT_BATCH_SIZE = 5000
+READ_BUFFER_SIZE = 64 * 1024
+
+ORDER_STATUSES = ('pending', 'fulfilled', 'cancelled')
+TSHIRT_COLUMNS = ('id', 'design_name', 'size', 'color', 'quantity', 'price')
+
+
+class ImportRowError(ValueError):
+    """A row of an import that cannot be stored; earlier batches are kept"""
+
+    def __init__(self, line, message, imported=0):
+        super().__init__(f'line {line}: {message}' if line else message)
+        self.line = line
+        self.imported = imported
+
+
+def resolve_format(name=None, mimetype=None):
+    """'csv' or 'ndjson' from an explicit name, else from a request mimetype"""
+    if not name:
+        name = 'ndjson' if mimetype in NDJSON_TYPES else 'csv'
+    if name not in FORMATS:
+        raise ValueError(f'Unknown format {name!r}; expected one of {sorted(FORMATS)}')
+    return name
+
+
+# Export
+
+def orders_export_query(args):
+    """SELECT of ORDER_COLUMNS filtered by status, tshirt_id, date_from and date_to.
+
+    Reads the orders_all view when ``include_archived`` is set, as
+    GET /api/orders does.
+    """
+    orders = requested_orders_source(args).c
+    stmt = db.select(*[orders[name] for name in ORDER_COLUMNS]).order_by(orders.id)
+    if args.get('status'):
+        stmt = stmt.where(orders.status == args['status'])
+    if args.get('tshirt_id'):
+        stmt = stmt.where(orders.tshirt_id == int(args['tshirt_id']))
+    if args.get('date_from'):
+        stmt = stmt.where(orders.order_date >= datetime.fromisoformat(args['date_from']))
+    if args.get('date_to'):
+        stmt = stmt.where(orders.order_date < datetime.fromisoformat(args['date_to']))
+    return stmt
+
+
+def tshirts_export_query():
+    return db.select(*[getattr(TShirt, name) for name in TSHIRT_COLUMNS]).order_by(TShirt.id)
+
+
+def _encode_csv(fields, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def _encode_ndjson(fields, rows):
+    return b''.join([dumps(dict(zip(fields, row))) + b'\n' for row in rows])
+
+
+def stream_export(engine, statement, fields, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """Generator of encoded chunks of statement's rows, for a streamed response.
+
+    Uses its own connection, held until the last chunk is sent or the client
+    goes away, rather than the request's session.
+    """
+    encode = _encode_csv if fmt == 'csv' else _encode_ndjson
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        if fmt == 'csv':
+            yield _encode_csv(fields, [fields])
+        for rows in result.partitions():
+            yield encode(fields, rows)
+
+
+# Import
+
+class _InputStream(io.RawIOBase):
+    """io adapter for a WSGI input stream, which only promises read(size)"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def read_records(stream, fmt):
+    """Yield (line number, dict) for each record of a CSV or NDJSON byte stream"""
+    buffered = io.BufferedReader(_InputStream(stream), READ_BUFFER_SIZE)
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(io.TextIOWrapper(buffered, encoding='utf-8', newline=''))
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_number, line in enumerate(buffered, 1):
+            if not line.strip():
+                continue
+            try:
+                record = loads(line)
+            except ValueError as e:
+                raise ImportRowError(line_number, f'invalid JSON: {e}')
+            if not isinstance(record, dict):
+                raise ImportRowError(line_number, 'expected a JSON object')
+            yield line_number, record
+    except csv.Error as e:
+        raise ImportRowError(reader.line_num, f'invalid CSV: {e}')
+    except UnicodeDecodeError as e:
+        raise ImportRowError(None, f'upload is not UTF-8: {e}')
+
+
+def _required(line, record, name):
+    value = record.get(name)
+    if value is None or value == '':
+        raise ImportRowError(line, f'{name} is required')
+    return value
+
+
+def _integer(line, record, name, minimum):
+    try:
+        value = int(_required(line, record, name))
+    except (TypeError, ValueError):
+        raise ImportRowError(line, f'{name} must be an integer')
+    if value < minimum:
+        raise ImportRowError(line, f'{name} must be at least {minimum}')
+    return value
+
+
+def _text(line, record, name, max_length, default=None):
+    value = record.get(name)
+    if value is None or value == '':
+        if default is None:
+            raise ImportRowError(line, f'{name} is required')
+        return default
+    value = str(value)
+    if len(value) > max_length:
+        raise ImportRowError(line, f'{name} is longer than {max_length} characters')
+    return value
+
+
+def _order_values(line, record, prices, now):
+    tshirt_id = _integer(line, record, 'tshirt_id', 1)
+    if tshirt_id not in prices:
+        raise ImportRowError(line, f't-shirt {tshirt_id} does not exist')
+    status = record.get('status') or 'pending'
+    if status not in ORDER_STATUSES:
+        raise ImportRowError(line, f'status must be one of {", ".join(ORDER_STATUSES)}')
+    order_date = record.get('order_date')
+    try:
+        order_date = datetime.fromisoformat(order_date) if order_date else now
+    except (TypeError, ValueError):
+        raise ImportRowError(line, 'order_date must be an ISO 8601 date or datetime')
+    return {
+        'customer_name': _text(line, record, 'customer_name', 100),
+        'customer_phone': _text(line, record, 'customer_phone', 20, default=''),
+        'tshirt_id': tshirt_id,
+        'quantity': _integer(line, record, 'quantity', 1),
+        'status': status,
+        'order_date': order_date,
+        'unit_price': prices[tshirt_id]
+    }
+
+
+def _write_orders(rows, prices):
+    """Insert one batch of orders, its sales rollup and customers, then commit"""
+    db.session.execute(db.insert(Order.__table__), rows)
+    totals = {}
+    for row in rows:
+        key = (row['order_date'].date(), row['tshirt_id'])
+        total = totals.setdefault(key, [0, 0, 0.0])
+        total[0] += 1
+        total[1] += row['quantity']
+        total[2] += row['quantity'] * row['unit_price']
+    record_sales(totals)
+    link_customers()
+    bump_cache_version('orders')
+    db.session.commit()
+
+
+def import_orders(stream, fmt, batch_size=IMPORT_BATCH_SIZE):
+    """Insert the orders in a CSV or NDJSON stream; returns the number imported.
+
+    Needs customer_name, tshirt_id and quantity per row; customer_phone,
+    status (default pending) and order_date (default now) are optional.
+    Raises ImportRowError at the first bad row, after rolling back its batch.
+    """
+    prices = dict(db.session.query(TShirt.id, TShirt.price))
+    # End the read transaction; SQLite cannot turn a stale read into a write
+    db.session.commit()
+    now = datetime.utcnow()
+    imported = 0
+    batch = []
+    try:
+        for line, record in read_records(stream, fmt):
+            batch.append(_order_values(line, record, prices, now))
+            if len(batch) >= batch_size:
+                _write_orders(batch, prices)
+                imported += len(batch)
+                batch = []
+        if batch:
+            _write_orders(batch, prices)
+            imported += len(batch)
+    except ImportRowError as e:
+        db.session.rollback()
+        e.imported = imported
+        raise
+    return imported
+
+
+def _tshirt_values(line, record):
+    try:
+        price = float(_required(line, record, 'price'))
+    except (TypeError, ValueError):
+        raise ImportRowError(line, 'price must be a number')
+    return {
+        'design_name': _text(line, record, 'design_name', 100),
+        'size': _text(line, record, 'size', 5),
+        'color': _text(line, record, 'color', 20),
+        'quantity': _integer(line, record, 'quantity', 0),
+        'price': price
+    }
+
+
+def import_tshirts(stream, fmt, batch_size=IMPORT_BATCH_SIZE):
+    """Merge the t-shirts in a CSV or NDJSON stream into the catalog by SKU.
+
+    Existing SKUs get the imported quantity and price; new SKUs are added.
+    Runs in the caller's transaction, which commits; returns the number of
+    rows read. Raises ImportRowError at the first bad row.
+    """
+    record_stock_levels(-1, 'catalog_reset')
+    imported = 0
+    batch = {}
+    for line, record in read_records(stream, fmt):
+        values = _tshirt_values(line, record)
+        # A SKU repeated within one statement would be upserted twice
+        batch[tuple(values[name] for name in SKU_COLUMNS)] = values
+        imported += 1
+        if len(batch) >= batch_size:
+            load_catalog(db.session, TShirt.__table__, rows=list(batch.values()), upsert=True)
+            batch = {}
+    load_catalog(db.session, TShirt.__table__, rows=list(batch.values()), upsert=True)
+    record_stock_levels(1, 'catalog_reset')
+    return imported